@@ -60,6 +60,7 @@ from datetime import datetime, date
 import datetime as dt
 import re
 import os
+import threading
 
 LOC = QgsApplication.locale()[:2]
 def tr(*string):
@@ -84,6 +85,70 @@ def proportion(values, total):
     return new_values
 
 
+class _CacheAgregados:
+    '''
+    Cache de agregados de camadas (sequências ordenadas, somas acumuladas, azimutes etc.)
+    calculados uma única vez e reaproveitados na avaliação das demais feições.
+    Cada entrada é chaveada pelo id da camada e registra os campos e o uso de geometria,
+    sendo descartada automaticamente pelos sinais de edição/commit da camada.
+    '''
+    def __init__(self):
+        self.dados = {} # {layer_id: {chave: (campos, geometria, valor)}}
+        self.lock = threading.RLock()
+
+    def obter(self, layer, chave, campos, geometria, calcular):
+        # campos = None: a entrada depende de todos os atributos
+        layer_id = layer.id()
+        with self.lock:
+            if layer_id not in self.dados:
+                self.dados[layer_id] = {}
+                self._conectar(layer)
+            entrada = self.dados[layer_id].get(chave)
+        if entrada is not None:
+            return entrada[2]
+        valor = calcular()
+        with self.lock:
+            if layer_id in self.dados:
+                self.dados[layer_id][chave] = (None if campos is None else set(campos), geometria, valor)
+        return valor
+
+    def limpar(self, layer_id, campo=None, geometria=False):
+        with self.lock:
+            entradas = self.dados.get(layer_id)
+            if not entradas:
+                return
+            if campo is None and not geometria:
+                entradas.clear()
+                return
+            for chave in list(entradas):
+                campos, usa_geom = entradas[chave][:2]
+                if (geometria and usa_geom) or (campo is not None and (campos is None or campo in campos)):
+                    del entradas[chave]
+
+    def remover(self, layer_id):
+        with self.lock:
+            self.dados.pop(layer_id, None)
+
+    def _conectar(self, layer):
+        layer_id = layer.id()
+        tudo = lambda *args: self.limpar(layer_id)
+        def atributo(fid, idx, valor):
+            fields = layer.fields()
+            self.limpar(layer_id, campo = fields.at(idx).name() if 0 <= idx < fields.count() else None)
+        layer.attributeValueChanged.connect(atributo)
+        layer.geometryChanged.connect(lambda *args: self.limpar(layer_id, geometria=True))
+        for sinal in (layer.featureAdded, layer.featureDeleted,
+                      layer.attributeAdded, layer.attributeDeleted,
+                      layer.afterCommitChanges, layer.afterRollBack,
+                      layer.dataSourceChanged):
+            sinal.connect(tudo)
+        if layer.dataProvider():
+            layer.dataProvider().dataChanged.connect(tudo)
+        layer.willBeDeleted.connect(lambda: self.remover(layer_id))
+
+CACHE_AGREGADOS = _CacheAgregados()
+
+
 @qgsfunction(args='auto', group='LF Tools')
 def fieldstat(layer_name, field_name, type, feature, parent):
     ''' Returns the Aggregate function of a layer's field.
@@ -96,31 +161,34 @@ def fieldstat(layer_name, field_name, type, feature, parent):
           <li>fieldstat('layer_name', 'field_name', 'std') ->Standard Deviation of the values</li>
           <li>fieldstat('layer_name', 'field_name', 'median') ->Median of the values</li>
         </ul>'''
-    lista = []
-
     if len(QgsProject.instance().mapLayersByName(layer_name)) == 1:
         layer = QgsProject.instance().mapLayersByName(layer_name)[0]
     else:
         layer = QgsProject.instance().mapLayer(layer_name)
 
-    for feat in layer.getFeatures():
-        att = feat[field_name]
-        if att:
-            lista += [float(att)]
-    if type == 'sum':
-        return  float((array(lista)).sum())
-    elif type == 'min':
-        return  float((array(lista)).min())
-    elif type == 'max':
-        return  float((array(lista)).max())
-    elif type == 'mean':
-        return  float((array(lista)).mean())
-    elif type == 'std':
-        return  float((array(lista)).std())
-    elif type == 'median':
-        return  float(median(array(lista)))
-    else:
-        return None
+    def calcular():
+        lista = []
+        for feat in layer.getFeatures(QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setSubsetOfAttributes([field_name], layer.fields())):
+            att = feat[field_name]
+            if att:
+                lista += [float(att)]
+        lista = array(lista)
+        if type == 'sum':
+            return  float(lista.sum())
+        elif type == 'min':
+            return  float(lista.min())
+        elif type == 'max':
+            return  float(lista.max())
+        elif type == 'mean':
+            return  float(lista.mean())
+        elif type == 'std':
+            return  float(lista.std())
+        elif type == 'median':
+            return  float(median(lista))
+        else:
+            return None
+
+    return CACHE_AGREGADOS.obter(layer, ('fieldstat', field_name, type), [field_name], False, calcular)
 
 
 @qgsfunction(args='auto', group='LF Tools')
@@ -599,46 +667,33 @@ def cusum(layer_name, sequence_field, value_field, group_field, feature, parent)
     else:
         layer = QgsProject.instance().mapLayer(layer_name)
     field_names = [campo.name() for campo in layer.fields()]
+    agrupar = group_field in field_names
 
-    if group_field in field_names: # Grupos
-        grupos = {}
-        for feat in layer.getFeatures():
-            if feat[group_field] not in grupos:
-                grupos[feat[group_field]] = [feat]
-            else:
-                grupos[feat[group_field]] += [feat]
-
-        dic = {}
-        for grupo in grupos:
-            dic2 = {}
-            for feat in grupos[grupo]:
-                valor = feat[value_field]
-                dic2[feat[sequence_field]] = valor
-
-            chaves = list(dic2.keys())
-            chaves.sort()
-
-            soma = 0
-            for id in chaves:
-                soma += dic2[id]
-                dic2[id] = soma
-            dic[grupo] = dic2
-        return dic[feature[group_field]][feature[sequence_field]]
-
-    else:
-        dic = {}
-        for feat in layer.getFeatures():
-            valor = feat[value_field]
-            dic[feat[sequence_field]] = valor
-
+    def acumular(dic):
         chaves = list(dic.keys())
         chaves.sort()
-
         soma = 0
         for id in chaves:
             soma += dic[id]
             dic[id] = soma
-        return dic[feature[sequence_field]]
+        return dic
+
+    def calcular():
+        # Somas acumuladas de todas as feições, por grupo (ou grupo único)
+        campos = [sequence_field, value_field] + ([group_field] if agrupar else [])
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setSubsetOfAttributes(campos, layer.fields())
+        grupos = {}
+        for feat in layer.getFeatures(request):
+            grupo = feat[group_field] if agrupar else None
+            if grupo not in grupos:
+                grupos[grupo] = {}
+            grupos[grupo][feat[sequence_field]] = feat[value_field]
+        return {grupo: acumular(grupos[grupo]) for grupo in grupos}
+
+    chave = ('cusum', sequence_field, value_field, group_field if agrupar else '')
+    campos = [sequence_field, value_field] + ([group_field] if agrupar else [])
+    dic = CACHE_AGREGADOS.obter(layer, chave, campos, False, calcular)
+    return dic[feature[group_field] if agrupar else None][feature[sequence_field]]
 
 
 @qgsfunction(args='auto', group='LF Tools')
@@ -667,41 +722,9 @@ def azimuth_by_sequence(sequence_field, group_field, feature, parent, context):
     layer_id = context.variable('layer_id')
     layer = QgsProject.instance().mapLayer(layer_id)
     field_names = [campo.name() for campo in layer.fields()]
+    agrupar = group_field in field_names
 
-    if group_field in field_names: # Grupos
-        grupos = {}
-        for feat in layer.getFeatures():
-            if feat[group_field] not in grupos:
-                grupos[feat[group_field]] = [feat]
-            else:
-                grupos[feat[group_field]] += [feat]
-
-        dic = {}
-        for grupo in grupos:
-            dic2 = {}
-            for feat in grupos[grupo]:
-                ponto = feat.geometry().asPoint()
-                dic2[feat[sequence_field]] = ponto
-
-            chaves = list(dic2.keys())
-            chaves.sort()
-            lista = list(chaves)
-            tam = len(lista)
-            dic3 = {}
-            for k in range(tam):
-                p1 = dic2[lista[k]]
-                p2 = dic2[lista[0 if k+1 >= tam else k+1]]
-                Az = (180/pi)*azimute(p1, p2)[0]
-                dic3[lista[k]] = Az
-            dic[grupo] = dic3
-        return float(dic[feature[group_field]][feature[sequence_field]])
-
-    else:
-        dic = {}
-        for feat in layer.getFeatures():
-            ponto = feat.geometry().asPoint()
-            dic[feat[sequence_field]] = ponto
-
+    def azimutes(dic):
         chaves = list(dic.keys())
         chaves.sort()
         lista = list(chaves)
@@ -712,7 +735,41 @@ def azimuth_by_sequence(sequence_field, group_field, feature, parent, context):
             p2 = dic[lista[0 if k+1 >= tam else k+1]]
             Az = (180/pi)*azimute(p1, p2)[0]
             dic2[lista[k]] = Az
-        return float(dic2[feature[sequence_field]])
+        return dic2
+
+    def calcular():
+        # Azimutes de todos os pontos, por grupo (ou grupo único)
+        campos = [sequence_field] + ([group_field] if agrupar else [])
+        request = QgsFeatureRequest().setSubsetOfAttributes(campos, layer.fields())
+        grupos = {}
+        for feat in layer.getFeatures(request):
+            grupo = feat[group_field] if agrupar else None
+            if grupo not in grupos:
+                grupos[grupo] = {}
+            grupos[grupo][feat[sequence_field]] = feat.geometry().asPoint()
+        return {grupo: azimutes(grupos[grupo]) for grupo in grupos}
+
+    chave = ('azimuth_by_sequence', sequence_field, group_field if agrupar else '')
+    campos = [sequence_field] + ([group_field] if agrupar else [])
+    dic = CACHE_AGREGADOS.obter(layer, chave, campos, True, calcular)
+    return float(dic[feature[group_field] if agrupar else None][feature[sequence_field]])
+
+
+# SRC geográfico e transformação usados pelas funções LTP, criados uma vez por SRC da camada
+_CRS_LTP = {}
+def crsGeograficoLTP(crs):
+    chave = crs.authid() or crs.toWkt()
+    if chave not in _CRS_LTP:
+        if crs.isGeographic():
+            _CRS_LTP[chave] = (crs, None)
+        else:
+            crsGeo = QgsCoordinateReferenceSystem(crs.geographicCrsAuthId())
+            coordinateTransformer = QgsCoordinateTransform()
+            coordinateTransformer.setDestinationCrs(crsGeo)
+            coordinateTransformer.setSourceCrs(crs)
+            _CRS_LTP[chave] = (crsGeo, coordinateTransformer)
+    crsGeo, coordinateTransformer = _CRS_LTP[chave]
+    return crsGeo, (QgsCoordinateTransform(coordinateTransformer) if coordinateTransformer else None)
 
 
 @qgsfunction(args='auto', group='LF Tools')
@@ -732,18 +789,10 @@ def areaLTP (geometry, layer_crs, feature, parent):
     </p>
   </div>
     """
-    layer_crs = QgsCoordinateReferenceSystem(layer_crs)
-    geom = geometry
-    if not layer_crs.isGeographic():
-        crsProj = layer_crs
-        crsGeo = QgsCoordinateReferenceSystem(crsProj.geographicCrsAuthId())
-        coordinateTransformer = QgsCoordinateTransform()
-        coordinateTransformer.setDestinationCrs(crsGeo)
-        coordinateTransformer.setSourceCrs(crsProj)
-        geom.transform(coordinateTransformer)
-    else:
-        crsGeo = layer_crs
-    geomGeo = geom
+    crsGeo, coordinateTransformer = crsGeograficoLTP(QgsCoordinateReferenceSystem(layer_crs))
+    geomGeo = geometry
+    if coordinateTransformer:
+        geomGeo.transform(coordinateTransformer)
     try:
         return areaSGL(geomGeo, crsGeo)
     except:
@@ -768,17 +817,10 @@ def areaLTP2 (feature, parent, context):
     """
     layer_id = context.variable('layer_id')
     layer = QgsProject.instance().mapLayer(layer_id)
-    geom = feature.geometry()
-    if not layer.crs().isGeographic():
-        crsProj = layer.crs()
-        crsGeo = QgsCoordinateReferenceSystem(crsProj.geographicCrsAuthId())
-        coordinateTransformer = QgsCoordinateTransform()
-        coordinateTransformer.setDestinationCrs(crsGeo)
-        coordinateTransformer.setSourceCrs(crsProj)
-        geom.transform(coordinateTransformer)
-    else:
-        crsGeo = layer.crs()
-    geomGeo = geom
+    crsGeo, coordinateTransformer = crsGeograficoLTP(layer.crs())
+    geomGeo = feature.geometry()
+    if coordinateTransformer:
+        geomGeo.transform(coordinateTransformer)
     try:
         return areaSGL(geomGeo, crsGeo)
     except:
@@ -802,18 +844,10 @@ def perimeterLTP (geometry, layer_crs, feature, parent):
     </p>
   </div>
     """
-    layer_crs = QgsCoordinateReferenceSystem(layer_crs)
-    geom = geometry
-    if layer_crs.isGeographic():
-        crsProj = layer_crs
-        crsGeo = QgsCoordinateReferenceSystem(crsProj.geographicCrsAuthId())
-        coordinateTransformer = QgsCoordinateTransform()
-        coordinateTransformer.setDestinationCrs(crsGeo)
-        coordinateTransformer.setSourceCrs(crsProj)
-        geom.transform(coordinateTransformer)
-    else:
-        crsGeo = layer_crs
-    geomGeo = geom
+    crsGeo, coordinateTransformer = crsGeograficoLTP(QgsCoordinateReferenceSystem(layer_crs))
+    geomGeo = geometry
+    if coordinateTransformer:
+        geomGeo.transform(coordinateTransformer)
     try:
         return perimetroSGL(geomGeo, crsGeo)
     except:
@@ -838,17 +872,10 @@ def perimeterLTP2 (feature, parent, context):
     """
     layer_id = context.variable('layer_id')
     layer = QgsProject.instance().mapLayer(layer_id)
-    geom = feature.geometry()
-    if not layer.crs().isGeographic():
-        crsProj = layer.crs()
-        crsGeo = QgsCoordinateReferenceSystem(crsProj.geographicCrsAuthId())
-        coordinateTransformer = QgsCoordinateTransform()
-        coordinateTransformer.setDestinationCrs(crsGeo)
-        coordinateTransformer.setSourceCrs(crsProj)
-        geom.transform(coordinateTransformer)
-    else:
-        crsGeo = layer.crs()
-    geomGeo = geom
+    crsGeo, coordinateTransformer = crsGeograficoLTP(layer.crs())
+    geomGeo = feature.geometry()
+    if coordinateTransformer:
+        geomGeo.transform(coordinateTransformer)
     try:
         return perimetroSGL(geomGeo, crsGeo)
     except:
@@ -873,18 +900,10 @@ def lengthLTP (geometry, layer_crs, dimension, feature, parent):
     </p>
   </div>
     """
-    layer_crs = QgsCoordinateReferenceSystem(layer_crs)
-    geom = geometry
-    if not layer_crs.isGeographic():
-        crsProj = layer_crs
-        crsGeo = QgsCoordinateReferenceSystem(crsProj.geographicCrsAuthId())
-        coordinateTransformer = QgsCoordinateTransform()
-        coordinateTransformer.setDestinationCrs(crsGeo)
-        coordinateTransformer.setSourceCrs(crsProj)
-        geom.transform(coordinateTransformer)
-    else:
-        crsGeo = layer_crs
-    geomGeo = geom
+    crsGeo, coordinateTransformer = crsGeograficoLTP(QgsCoordinateReferenceSystem(layer_crs))
+    geomGeo = geometry
+    if coordinateTransformer:
+        geomGeo.transform(coordinateTransformer)
     try:
         return comprimentoSGL(geomGeo, crsGeo, dimension)
     except:
@@ -910,17 +929,10 @@ def lengthLTP2 (feature, parent, context):
     dimension = '2d'
     layer_id = context.variable('layer_id')
     layer = QgsProject.instance().mapLayer(layer_id)
-    geom = feature.geometry()
-    if not layer.crs().isGeographic():
-        crsProj = layer.crs()
-        crsGeo = QgsCoordinateReferenceSystem(crsProj.geographicCrsAuthId())
-        coordinateTransformer = QgsCoordinateTransform()
-        coordinateTransformer.setDestinationCrs(crsGeo)
-        coordinateTransformer.setSourceCrs(crsProj)
-        geom.transform(coordinateTransformer)
-    else:
-        crsGeo = layer.crs()
-    geomGeo = geom
+    crsGeo, coordinateTransformer = crsGeograficoLTP(layer.crs())
+    geomGeo = feature.geometry()
+    if coordinateTransformer:
+        geomGeo.transform(coordinateTransformer)
     try:
         return comprimentoSGL(geomGeo, crsGeo, dimension)
     except:
@@ -946,17 +958,10 @@ def lengthLTP3 (feature, parent, context):
     dimension = '3d'
     layer_id = context.variable('layer_id')
     layer = QgsProject.instance().mapLayer(layer_id)
-    geom = feature.geometry()
-    if not layer.crs().isGeographic():
-        crsProj = layer.crs()
-        crsGeo = QgsCoordinateReferenceSystem(crsProj.geographicCrsAuthId())
-        coordinateTransformer = QgsCoordinateTransform()
-        coordinateTransformer.setDestinationCrs(crsGeo)
-        coordinateTransformer.setSourceCrs(crsProj)
-        geom.transform(coordinateTransformer)
-    else:
-        crsGeo = layer.crs()
-    geomGeo = geom
+    crsGeo, coordinateTransformer = crsGeograficoLTP(layer.crs())
+    geomGeo = feature.geometry()
+    if coordinateTransformer:
+        geomGeo.transform(coordinateTransformer)
     try:
         return comprimentoSGL(geomGeo, crsGeo, dimension)
     except:
@@ -1066,14 +1071,29 @@ def inter_area (this_layer, other_layer, calc_CRS, filter, feature, parent):
     else:
         layer2 = QgsProject.instance().mapLayer(other_layer)
 
-    exp = QgsExpression(filter)
-    request = QgsFeatureRequest(exp)
-
     crs1 = QgsCoordinateReferenceSystem(layer1.crs())
     crs2 = QgsCoordinateReferenceSystem(layer2.crs())
-    transf1 = QgsCoordinateTransform()
-    transf1.setDestinationCrs(crs1)
-    transf1.setSourceCrs(crs2)
+
+    def calcular():
+        # Índice espacial das geometrias da outra camada, já transformadas para o SRC desta camada
+        transf1 = QgsCoordinateTransform()
+        transf1.setDestinationCrs(crs1)
+        transf1.setSourceCrs(crs2)
+        request = QgsFeatureRequest(QgsExpression(filter)) if filter else QgsFeatureRequest()
+        index = QgsSpatialIndex()
+        geometrias = {}
+        for feat2 in layer2.getFeatures(request):
+            geom2 = feat2.geometry()
+            if geom2.isEmpty():
+                continue
+            if crs1 != crs2:
+                geom2.transform(transf1)
+            geometrias[feat2.id()] = geom2
+            index.addFeature(feat2.id(), geom2.boundingBox())
+        return index, geometrias
+
+    chave = ('inter_area', crs1.toWkt(), filter)
+    index, geometrias = CACHE_AGREGADOS.obter(layer2, chave, None, True, calcular)
 
     calc_CRS = QgsCoordinateReferenceSystem(calc_CRS)
     transf2 = QgsCoordinateTransform()
@@ -1081,12 +1101,18 @@ def inter_area (this_layer, other_layer, calc_CRS, filter, feature, parent):
     transf2.setSourceCrs(crs1)
 
     area = 0
-    iterLayer2 = layer2.getFeatures(request) if filter else layer2.getFeatures()
     geom1 = feature.geometry()
-    for feat2 in iterLayer2:
-        geom2 = feat2.geometry()
-        geom2.transform(transf1)
-        if geom1.intersects(geom2):
+    if geom1.isEmpty():
+        return float(area)
+    candidatos = index.intersects(geom1.boundingBox())
+    if not candidatos:
+        return float(area)
+    # Geometria preparada para testar os candidatos do índice
+    engine = QgsGeometry.createGeometryEngine(geom1.constGet())
+    engine.prepareGeometry()
+    for fid in candidatos:
+        geom2 = geometrias[fid]
+        if engine.intersects(geom2.constGet()):
             inter = geom1.intersection(geom2)
             if inter.type() == 2: #Polygon
                 inter.transform(transf2)
@@ -22,7 +22,7 @@ from lftools.translations.translate import translate
 from qgis.core import *
 from qgis.gui import *
 import numpy as np
-from numpy.linalg import norm, det, inv, solve
+from numpy.linalg import norm, det, inv, solve, cholesky, LinAlgError
 
 # Tradução
 LOC = QgsApplication.locale()[:2]
@@ -119,6 +119,66 @@ def transformGeom2D(geom, CoordTransf):
     else:
         return None
 
+# Mínimos quadrados com matrizes ndarray
+class EquacoesNormais:
+    '''
+    Fatoração de Cholesky das equações normais N = A'A, reaproveitada
+    na solução dos parâmetros e no cálculo da MVC (N^-1).
+    '''
+    def __init__(self, A, msg_erro):
+        self.A = A
+        try:
+            self.C = cholesky(A.T @ A)
+        except LinAlgError:
+            raise QgsProcessingException(msg_erro)
+
+    def resolver(self, L):
+        # N X = A'L  ->  C C' X = A'L
+        return solve(self.C.T, solve(self.C, self.A.T @ L))
+
+    def inversa(self):
+        Ci = inv(self.C)
+        return Ci.T @ Ci
+
+
+# Funções de transformação 2D (aceitam QgsPointXY ou arrays X e Y)
+def Transf2D(metodo, param):
+    if metodo == 0: # Translação
+        a, b = param
+        def direta(X, Y):
+            return (X + a, Y + b)
+        def inversa(X, Y):
+            return (X - a, Y - b)
+    elif metodo == 1: # Helmert 2D
+        a, b, c, d = param
+        s2 = a**2 + b**2
+        def direta(X, Y):
+            return (X*a - Y*b + c, X*b + Y*a + d)
+        def inversa(X, Y):
+            dX, dY = X - c, Y - d
+            return ((a*dX + b*dY)/s2, (a*dY - b*dX)/s2)
+    elif metodo == 2: # Afim
+        a, b, c, d, e, f = param
+        D = a*e - b*d
+        def direta(X, Y):
+            return (X*a + Y*b + c, X*d + Y*e + f)
+        def inversa(X, Y):
+            dX, dY = X - c, Y - f
+            return ((e*dX - b*dY)/D, (a*dY - d*dX)/D)
+
+    def CoordTransf(X, Y = None):
+        if Y is None:
+            X, Y = X.x(), X.y()
+        return direta(X, Y)
+
+    def CoordInvTransf(X, Y = None):
+        if Y is None:
+            X, Y = X.x(), X.y()
+        return inversa(X, Y)
+
+    return CoordTransf, CoordInvTransf
+
+
 # Ajustamento 2D
 def Ajust2D(vetores, metodo):
     # Métodos:
@@ -135,39 +195,32 @@ def Ajust2D(vetores, metodo):
     elif metodo == 2: # 2 - Afim
         min_pnts_homo = n_pnts_homo == 3
 
-    A = [] # Matriz Design
-    L = [] # Coordenadas Finais
-    Lo = [] # Coordenadas Iniciais
-    for feat in vetores.getFeatures():
-        geom = feat.geometry()
-        coord = geom.asPolyline()
-        xa = coord[0].x()
-        ya = coord[0].y()
-        xb = coord[1].x()
-        yb = coord[1].y()
-        if metodo == 0:
-            A += [[1, 0], [0, 1]]
-        elif metodo == 1:
-            A += [[xa, -ya, 1, 0], [ya, xa, 0, 1]]
-        elif metodo == 2:
-            A += [[xa, ya, 1, 0, 0, 0], [0, 0, 0, xa, ya, 1]]
-        L +=[[xb], [yb]]
-        Lo +=[[xa], [ya]]
-
-    A = np.matrix(A)
-    L = np.matrix(L)
-    Lo = np.matrix(Lo)
+    # Coordenadas iniciais (xa, ya) e finais (xb, yb) dos vetores
+    coords = np.array([[pnt.x(), pnt.y()] for feat in vetores.getFeatures() for pnt in feat.geometry().asPolyline()[:2]], dtype=float)
+    xa, ya = coords[0::2, 0], coords[0::2, 1]
+    xb, yb = coords[1::2, 0], coords[1::2, 1]
+    um, zero = np.ones(n_pnts_homo), np.zeros(n_pnts_homo)
+
+    # Matriz Design (linhas intercaladas x, y de cada ponto)
+    if metodo == 0:
+        A = np.column_stack([np.ravel([um, zero], 'F'), np.ravel([zero, um], 'F')])
+    elif metodo == 1:
+        A = np.column_stack([np.ravel([xa, ya], 'F'), np.ravel([-ya, xa], 'F'),
+                             np.ravel([um, zero], 'F'), np.ravel([zero, um], 'F')])
+    elif metodo == 2:
+        A = np.column_stack([np.ravel([xa, zero], 'F'), np.ravel([ya, zero], 'F'), np.ravel([um, zero], 'F'),
+                             np.ravel([zero, xa], 'F'), np.ravel([zero, ya], 'F'), np.ravel([zero, um], 'F')])
+    L = np.ravel([xb, yb], 'F') # Coordenadas Finais
+    Lo = np.ravel([xa, ya], 'F') # Coordenadas Iniciais
 
     msg_erro = tr('Georeferencing vectors should not be aligned!', 'Os vetores de georreferenciamento não podem ter a mesma direção (alinhados)!')
+    normais = None
     if metodo == 0:
         if min_pnts_homo:
             X = L - Lo
         else:
-            M = A.T*A
-            if det(M):
-                X = solve(M, A.T*(L - Lo))
-            else:
-                raise QgsProcessingException(msg_erro)
+            normais = EquacoesNormais(A, msg_erro)
+            X = normais.resolver(L - Lo)
     else:
         if min_pnts_homo:
             if det(A):
@@ -175,123 +228,50 @@ def Ajust2D(vetores, metodo):
             else:
                 raise QgsProcessingException(msg_erro)
         else: # asjustamento
-            M = A.T*A
-            if det(M):
-                X = solve(M, A.T*L)
-            else:
-                raise QgsProcessingException(msg_erro)
+            normais = EquacoesNormais(A, msg_erro)
+            X = normais.resolver(L)
 
     # Parametros e Função da Transformação
+    X = [float(x) for x in X]
     if metodo == 0:
-        a = X[0,0]
-        b = X[1,0]
-        def CoordTransf(pnt, a = a, b = b): # Translacao
-            X, Y = pnt.x(), pnt.y()
-            Xt = X + a
-            Yt = Y + b
-            return (Xt, Yt)
-        def CoordInvTransf(pnt, a = a, b = b): # Translacao (Inversa)
-            X, Y = pnt.x(), pnt.y()
-            Xit = X - a
-            Yit = Y - b
-            return (Xit, Yit)
-
+        a, b = X
     elif metodo == 1:
-        a = X[0,0]
-        b = X[1,0]
-        c = X[2,0]
-        d = X[3,0]
-        def CoordTransf(pnt, a = a, b = b, c = c, d = d): # Transformação Conforme - Helmert 2D
-            '''
-            Xt = X*a - Y*b + c
-            Yt = X*b + Y*a + d
-            a = S*cos(alfa)
-            b = S*sin(alfa)
-            '''
-            X, Y = pnt.x(), pnt.y()
-            Xt = X*a - Y*b + c
-            Yt = X*b + Y*a + d
-            return (Xt, Yt)
-        def CoordInvTransf(pnt, a = a, b = b, c = c, d = d): # Transformação de Helmert 2D (Inversa)
-            X, Y = pnt.x(), pnt.y()
-            A = np.matrix([[a,-b],[b,a]])
-            B = np.matrix([[X-c],[Y-d]])
-            sol = solve(A,B)
-            Xit = sol[0,0]
-            Yit = sol[1,0]
-            return (Xit, Yit)
-
+        a, b, c, d = X
     elif metodo == 2:
-        a = X[0,0]
-        b = X[1,0]
-        c = X[2,0]
-        d = X[3,0]
-        e = X[4,0]
-        f = X[5,0]
-        def CoordTransf(pnt, a = a, b = b, c = c, d = d, e = e, f = f): # Transformação Afim
-            X, Y = pnt.x(), pnt.y()
-            Xt = X*a + Y*b + c
-            Yt = X*d + Y*e + f
-            return (Xt, Yt)
-        def CoordInvTransf(pnt, a = a, b = b, c = c, d = d, e = e, f = f): # Transformação Afim (Inversa)
-            X, Y = pnt.x(), pnt.y()
-            A = np.matrix([[a,b],[d,e]])
-            B = np.matrix([[X-c],[Y-f]])
-            sol = solve(A,B)
-            Xit = sol[0,0]
-            Yit = sol[1,0]
-            return (Xit, Yit)
+        a, b, c, d, e, f = X
+    CoordTransf, CoordInvTransf = Transf2D(metodo, X)
 
     # Cálculo do Resíduos
-    transf = []
-    for feat in vetores.getFeatures():
-        geom = feat.geometry()
-        coord = geom.asPolyline()
-        Xt, Yt = CoordTransf(coord[0])
-        transf += [[Xt],[Yt]]
-        X, Y = coord[-1].x(), coord[-1].y()
-        Vx = X - Xt
-        Vy = Y - Yt
+    Xt, Yt = CoordTransf(xa, ya)
+    transf = np.ravel([Xt, Yt], 'F')
 
     # MVC dos Parametros e das coordenadas Ajustadas
     n = np.shape(A)[0] # número de observações
     u = np.shape(A)[1] # número de parâmetros
     if not min_pnts_homo:
         # Residuos
-        V = L - np.matrix(transf)
+        V = L - transf
         # Sigma posteriori
-        sigma2 = V.T*V/(n-u)
+        sigma2 = float(V @ V)/(n-u)
         # Precisão dos Pontos Ajustados
         # MVC de Xa
-        SigmaXa = sigma2[0,0]*inv(A.T*A)
-        SigmaXa  = np.matrix(SigmaXa).astype(float)
-        # MVC de La
-        SigmaLa = A*SigmaXa*A.T
-        SigmaLa  = np.matrix(SigmaLa).astype(float)
+        SigmaXa = sigma2*normais.inversa()
+        # Variâncias de La (diagonal de A*SigmaXa*A')
+        varLa = np.einsum('ij,jk,ik->i', A, SigmaXa, A)
         # RMSE
-        RMSE = np.sqrt((V.T*V)[0,0]/n_pnts_homo)
+        RMSE = np.sqrt(float(V @ V)/n_pnts_homo)
     else:
         sigma2 = 0
         RMSE = 0
 
     # Lista de Coordenadas Ajustadas, Precisões e Resíduos
-    COORD = []
-    PREC = []
-    DELTA = []
-    for index, feat in enumerate(vetores.getFeatures()):
-        X = transf[2*index][0]
-        Y = transf[2*index+1][0]
-        COORD += [QgsPointXY(X, Y)]
-        if not min_pnts_homo:
-            s_X = float(np.sqrt(SigmaLa[2*index,2*index]))
-            s_Y = float(np.sqrt(SigmaLa[2*index+1,2*index+1]))
-            PREC += [(s_X, s_Y)]
-            d_X = float(V[2*index][0])
-            d_Y = float(V[2*index+1][0])
-            DELTA += [(d_X, d_Y)]
-        else:
-            PREC += [(0, 0)]
-            DELTA += [(0, 0)]
+    COORD = [QgsPointXY(float(x), float(y)) for x, y in zip(Xt, Yt)]
+    if not min_pnts_homo:
+        PREC = [(float(sx), float(sy)) for sx, sy in np.sqrt(varLa).reshape(-1, 2)]
+        DELTA = [(float(dx), float(dy)) for dx, dy in V.reshape(-1, 2)]
+    else:
+        PREC = [(0, 0)]*n_pnts_homo
+        DELTA = [(0, 0)]*n_pnts_homo
 
 
     if metodo == 0:
@@ -414,7 +394,7 @@ align="center"><b><span style="">''' + str2HTML(tr('Transformation Parameters:',
 <div style="text-align: center;"><b><span style=""
 >''' + str2HTML(tr('Adjustment&rsquo;s Reference Variance','Variância a posteriori')) + '''</span></b><span style=""
 > <span style="">&nbsp;</span>=
-</span><span style="">''' + str(round(sigma2[0,0] if not min_pnts_homo else 0, 4)) + '''</span></div>
+</span><span style="">''' + str(round(sigma2, 4)) + '''</span></div>
 <br>
 <div style="text-align: center;"><b><span style=""
 >''' + str2HTML(tr('Root Mean Square Error (RMSE)','Raiz do Erro Médio Quadrático (REMQ)')) + '''</span></b><span style=""
@@ -501,29 +481,23 @@ def AjustVertical(lista, metodo):
     elif metodo == 1: # 1 - plano
         min_pnts_ctrl = n_pnts_ctrl == 3
 
-    A = [] # Matriz Design
-    L = [] # Coordenadas Finais
-    Lo = [] # Coordenadas Iniciais
-    for item in lista:
-        xa = item[0][0]
-        ya = item[0][1]
-        za = item[1]
-        zb = item[0][2]
-
-        if metodo == 0:
-            A += [[1]]
-        elif metodo == 1:
-            A += [[xa, ya, 1]]
-        L +=[[zb]]
-        Lo +=[[za]]
-
-    A = np.matrix(A)
-    L = np.matrix(L)
-    Lo = np.matrix(Lo)
+    # Coordenadas do GCP (xa, ya, zb) e cota do MDE (za)
+    xa = np.array([item[0][0] for item in lista], dtype=float)
+    ya = np.array([item[0][1] for item in lista], dtype=float)
+    zb = np.array([item[0][2] for item in lista], dtype=float)
+    za = np.array([item[1] for item in lista], dtype=float)
+
+    if metodo == 0:
+        A = np.ones((n_pnts_ctrl, 1)) # Matriz Design
+    elif metodo == 1:
+        A = np.column_stack([xa, ya, np.ones(n_pnts_ctrl)])
+    L = zb # Coordenadas Finais
+    Lo = za # Coordenadas Iniciais
 
     msg_erro = tr('Inconsistent values, check your control points!', 'Valores inconsistentes, verifique seus pontos de controle!')
+    normais = EquacoesNormais(A, msg_erro) if metodo == 0 or not min_pnts_ctrl else None
     if metodo == 0:
-        X = (L - Lo).mean()
+        X = [float((L - Lo).mean())]
     elif metodo == 1:
         if min_pnts_ctrl:
             if det(A):
@@ -531,26 +505,21 @@ def AjustVertical(lista, metodo):
             else:
                 raise QgsProcessingException(msg_erro)
         else: # asjustamento
-            M = A.T*A
-            if det(M):
-                X = solve(M, A.T*(L-Lo))
-            else:
-                raise QgsProcessingException(msg_erro)
+            X = normais.resolver(L - Lo)
+        X = [float(x) for x in X]
 
-    # Parametros e Função da Transformação
+    # Parametros e Função da Transformação (X e Y escalares ou arrays)
     if metodo == 0:
-        a = X
+        a = X[0]
         def CoordTransf(X, Y, a = a): # Transformação dz Plano
             '''
             dz = a
             '''
-            dz = a
+            dz = np.zeros_like(X, dtype=float) + a
             return dz
 
     elif metodo == 1:
-        a = X[0,0]
-        b = X[1,0]
-        c = X[2,0]
+        a, b, c = X
         def CoordTransf(X, Y, a = a, b = b, c = c): # Transformação dz Plano
             '''
             dz = X*a + Y*b + c
@@ -559,42 +528,31 @@ def AjustVertical(lista, metodo):
             return dz
 
     # Cálculo do Resíduos
-    V = []
-    COTAS = []
-    DELTA = []
-    for item in lista:
-        X = item[0][0]
-        Y = item[0][1]
-        Z = item[1]
-        dz = CoordTransf(X, Y)
-        Zaj = Z + dz
-        COTAS += [Zaj]
-        difer = Zaj - item[0][2]
-        DELTA += [difer]
-        V += [[difer]]
+    COTAS = za + CoordTransf(xa, ya)
+    V = COTAS - zb
+    DELTA = [float(difer) for difer in V]
+    COTAS = [float(cota) for cota in COTAS]
 
     # MVC dos Parametros e das coordenadas Ajustadas
     n = np.shape(A)[0] # número de observações
     u = np.shape(A)[1] # número de parâmetros
-    V = np.matrix(V)
     if not min_pnts_ctrl:
         # Sigma posteriori
-        sigma2 = V.T*V/(n-u)
+        sigma2 = float(V @ V)/(n-u)
         # Precisão dos Pontos Ajustados
         # MVC de Xa
-        SigmaXa = sigma2[0,0]*inv(A.T*A)
-        SigmaXa  = np.matrix(SigmaXa).astype(float)
-        # MVC de La
-        SigmaLa = A*SigmaXa*A.T
-        SigmaLa  = np.matrix(SigmaLa).astype(float)
+        SigmaXa = sigma2*normais.inversa()
+        # Variâncias de La (diagonal de A*SigmaXa*A')
+        varLa = np.einsum('ij,jk,ik->i', A, SigmaXa, A)
         # RMSE
-        RMSE = np.sqrt((V.T*V)[0,0]/n_pnts_ctrl)
+        RMSE = np.sqrt(float(V @ V)/n_pnts_ctrl)
     else:
         sigma2 = 0
         RMSE = 0
+        varLa = np.zeros(n)
 
     # Lista Precisões das Cotas Ajustadas
-    PREC = (np.array(SigmaLa.diagonal())).tolist()
+    PREC = [varLa.tolist()]
 
     if metodo == 0:
         formula = '''<p class="MsoNormal" style="text-align: center;"
@@ -677,7 +635,7 @@ align="center"><b><span style="">''' + str2HTML(tr('Transformation Parameters:',
 <div style="text-align: center;"><b><span style=""
 >''' + str2HTML(tr('Adjustment Reference Variance','Variância a posteriori')) + '''</span></b><span style=""
 > <span style="">&nbsp;</span>=
-</span><span style="">''' + str(round(sigma2[0,0],4)) + '''</span></div>
+</span><span style="">''' + str(round(sigma2,4)) + '''</span></div>
 <br>
 <div style="text-align: center;"><b><span style=""
 >''' + str2HTML(tr('Root Mean Square Error (RMSE)','Raiz do Erro Médio Quadrático (REMQ)')) + '''</span></b><span style=""
@@ -195,6 +195,59 @@ def Distancia(coords, dim):
     return float(soma)
 
 
+# Versões vetorizadas (NumPy) das somas de Gauss e das distâncias
+def areaGaussArray(X, Y):
+    # Fórmula de Gauss (shoelace) para todos os vértices de uma vez
+    return float(np.sum(X*(np.roll(Y, 1) - np.roll(Y, -1)))/2)
+
+
+def DistanciaArray(X, Y, Z=None):
+    # Soma das distâncias entre vértices consecutivos (2D ou 3D)
+    if Z is None:
+        return float(np.sum(np.hypot(np.diff(X), np.diff(Y))))
+    return float(np.sum(np.sqrt(np.diff(X)**2 + np.diff(Y)**2 + np.diff(Z)**2)))
+
+
+def curvaArray(curva):
+    # Coordenadas (x, y, z) de uma curva como arrays, com z nulo igual a 0
+    if isinstance(curva, QgsLineString):
+        X = np.array(curva.xVector(), dtype=float)
+        Y = np.array(curva.yVector(), dtype=float)
+        Z = np.array(curva.zVector(), dtype=float) if curva.is3D() else np.zeros(len(X))
+    else:
+        pnts = curva.points()
+        X = np.array([pnt.x() for pnt in pnts], dtype=float)
+        Y = np.array([pnt.y() for pnt in pnts], dtype=float)
+        Z = np.array([pnt.z() for pnt in pnts], dtype=float)
+    Z[np.isnan(Z)] = 0
+    return X, Y, Z
+
+
+def partesArray(geom):
+    # Lista de partes da geometria: polígonos como listas de anéis, linhas como curvas
+    const = geom.constGet()
+    if geom.isMultipart():
+        partes = [const.geometryN(k) for k in range(const.numGeometries())]
+    else:
+        partes = [const]
+    if geom.type() == 2: # Polígono
+        return [[curvaArray(parte.exteriorRing())] + [curvaArray(parte.interiorRing(k)) for k in range(parte.numInteriorRings())]
+                for parte in partes]
+    return [curvaArray(parte) for parte in partes]
+
+
+def centroideAnel(X, Y):
+    # Centroide da área delimitada pelo anel (coordenadas relativas ao 1º vértice para estabilidade)
+    x, y = X - X[0], Y - Y[0]
+    x1, y1 = np.roll(x, -1), np.roll(y, -1)
+    cruz = x*y1 - x1*y
+    A = np.sum(cruz)/2
+    if A == 0:
+        return float(X.mean()), float(Y.mean())
+    return (float(np.sum((x + x1)*cruz)/(6*A) + X[0]),
+            float(np.sum((y + y1)*cruz)/(6*A) + Y[0]))
+
+
 def AzimutePuissant(lat1, lon1, lat2, lon2, a = 6378137, f = 1/298.257222101):
     """
     Calcula o azimute segundo Puissant entre dois pontos geodésicos.
@@ -245,74 +298,41 @@ def raioMedioGauss(lat, EPSG):
     return R
 
 
+def elipsoide(crsGeo):
+    ellipsoid = QgsEllipsoidUtils.ellipsoidParameters(crsGeo.ellipsoidAcronym())
+    return ellipsoid.semiMajor, 1/ellipsoid.inverseFlattening
+
+
 def OrigemSGL(lon0, lat0, h0, crsGeo):
-    ellipsoid_id = crsGeo.ellipsoidAcronym()
-    ellipsoid = QgsEllipsoidUtils.ellipsoidParameters(ellipsoid_id)
-    a = ellipsoid.semiMajor
-    f_inv = ellipsoid.inverseFlattening
-    f = 1/f_inv
+    a, f = elipsoide(crsGeo)
     X0, Y0, Z0 = geod2geoc(lon0, lat0, h0, a, f)
     return (X0, Y0, Z0, a, f)
 
 
 # Area no SGL
-def AreaPerimetroParteSGL(coordsXYZ, coordsXY, crsGeo):
-    centroide = QgsGeometry.fromPolygonXY([coordsXY]).centroid().asPoint()
-    alt = []
-    for pnt in coordsXYZ[:-1]:
-        if str(pnt.z()) != 'nan':
-            alt += [pnt.z()]
-        else:
-            alt += [0]
-    h0 = np.array(alt).mean()
-    lon0 = centroide.x()
-    lat0 = centroide.y()
-    Xo, Yo, Zo, a, f = OrigemSGL(lon0, lat0, h0, crsGeo)
-    # CONVERSÃO DAS COORDENADAS
-    coordsSGL = []
-    for coord in coordsXYZ:
-        lon = coord.x()
-        lat = coord.y()
-        h = coord.z() if str(coord.z()) != 'nan' else 0
-        X, Y, Z = geod2geoc(lon, lat, h, a, f)
-        E, N, U = geoc2enu(X, Y, Z, lon0, lat0, Xo, Yo, Zo)
-        coordsSGL += [QgsPointXY(E, N)]
-    return (abs(areaGauss(coordsSGL)), Distancia(coordsSGL, '2D'))
+def AreaPerimetroParteSGL(lon, lat, h, a, f):
+    # Anel fechado em arrays (lon, lat, h), com SGL na origem do centroide do anel
+    lon0, lat0 = centroideAnel(lon, lat)
+    h0 = h[:-1].mean()
+    Xo, Yo, Zo = geod2geoc(lon0, lat0, h0, a, f)
+    X, Y, Z = geod2geoc(lon, lat, h, a, f)
+    E, N, U = geoc2enu(X, Y, Z, lon0, lat0, Xo, Yo, Zo)
+    return (abs(areaGaussArray(E, N)), DistanciaArray(E, N))
 
 def areaSGL(geomGeo, crsGeo):
-    if geomGeo.isMultipart():
-        coordsXYZ = geom2PointList(geomGeo)
-        coordsXY = geomGeo.asMultiPolygon()
-        areaSGL = 0
-        for k, coords in enumerate(coordsXY):
-            coordsGeo = coordsXYZ[k]
-            areaSGL += AreaPerimetroParteSGL(coordsGeo[0], coords[0], crsGeo)[0]
-            n_aneis = len(coordsGeo)
-            if n_aneis > 1:
-                for w in range(1, n_aneis):
-                    areaSGL -= AreaPerimetroParteSGL(coordsGeo[w], coords[w], crsGeo)[0]
-    else:
-        coordsGeo = geom2PointList(geomGeo)
-        coords = geomGeo.asPolygon()
-        areaSGL = AreaPerimetroParteSGL(coordsGeo[0], coords[0], crsGeo)[0]
-        n_aneis = len(coordsGeo)
-        if n_aneis > 1:
-            for w in range(1, n_aneis):
-                areaSGL -= AreaPerimetroParteSGL(coordsGeo[w], coords[w], crsGeo)[0]
+    a, f = elipsoide(crsGeo)
+    areaSGL = 0
+    for aneis in partesArray(geomGeo):
+        areaSGL += AreaPerimetroParteSGL(*aneis[0], a, f)[0]
+        for anel in aneis[1:]:
+            areaSGL -= AreaPerimetroParteSGL(*anel, a, f)[0]
     return areaSGL
 
 def perimetroSGL(geomGeo, crsGeo):
-    if geomGeo.isMultipart():
-        coordsXYZ = geom2PointList(geomGeo)
-        coordsXY = geomGeo.asMultiPolygon()
-        perimetroSGL = 0
-        for k, coords in enumerate(coordsXY):
-            coordsGeo = coordsXYZ[k]
-            perimetroSGL += AreaPerimetroParteSGL(coordsGeo[0], coords[0], crsGeo)[1]
-    else:
-        coordsGeo = geom2PointList(geomGeo)
-        coords = geomGeo.asPolygon()
-        perimetroSGL = AreaPerimetroParteSGL(coordsGeo[0], coords[0], crsGeo)[1]
+    a, f = elipsoide(crsGeo)
+    perimetroSGL = 0
+    for aneis in partesArray(geomGeo):
+        perimetroSGL += AreaPerimetroParteSGL(*aneis[0], a, f)[1]
     return float(perimetroSGL)
 
 
@@ -323,6 +343,35 @@ def Unicos(pnts):
             lista += [pnt]
     return lista
 
+
+class IndiceCoordenadas:
+    '''
+    Índice de coordenadas por hash em células de tamanho igual à tolerância.
+    Dois pontos correspondem quando |dx| <= tol e |dy| <= tol (mesmo critério do
+    operador == do QgsPointXY); a busca verifica apenas as 9 células vizinhas.
+    '''
+    def __init__(self, tol=1e-8):
+        self.tol = tol
+        self.celulas = {}
+
+    def adicionar(self, x, y, valor=None):
+        chave = (math.floor(x/self.tol), math.floor(y/self.tol))
+        self.celulas.setdefault(chave, []).append((x, y, valor))
+
+    def buscar(self, x, y):
+        # Valores de todos os pontos correspondentes a (x, y)
+        i, j = math.floor(x/self.tol), math.floor(y/self.tol)
+        resultado = []
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for x2, y2, valor in self.celulas.get((i+di, j+dj), ()):
+                    if abs(x - x2) <= self.tol and abs(y - y2) <= self.tol:
+                        resultado += [valor]
+        return resultado
+
+    def contem(self, x, y):
+        return len(self.buscar(x, y)) > 0
+
 # Azimute e Distância no SGL
 def AzimuteDistanciaSGL(pntA, pntB, geomGeo, crsGeo, tipoAz):
     # Origem do SGL
@@ -362,42 +411,22 @@ def AzimuteDistanciaSGL(pntA, pntB, geomGeo, crsGeo, tipoAz):
 
 # Comprimento no SGL para linhas 2D e 3D
 def comprimentoSGL(geomGeo, crsGeo, dim):
-    if geomGeo.isMultipart():
-        coordsGeo = geom2PointList(geomGeo)[0]
-    else:
-        coordsGeo = geom2PointList(geomGeo)
+    lon, lat, h = partesArray(geomGeo)[0]
     centroide = geomGeo.centroid().asPoint()
-    alt = []
-    for pnt in coordsGeo:
-        if str(pnt.z()) != 'nan':
-            alt += [pnt.z()]
-        else:
-            alt += [0]
-    h0 = np.array(alt).mean()
+    h0 = h.mean()
     lon0 = centroide.x()
     lat0 = centroide.y()
-
-    ellipsoid_id = crsGeo.ellipsoidAcronym()
-    ellipsoid = QgsEllipsoidUtils.ellipsoidParameters(ellipsoid_id)
-    a = ellipsoid.semiMajor
-    f_inv = ellipsoid.inverseFlattening
-    f = 1/f_inv
+    a, f = elipsoide(crsGeo)
 
     # CENTRO DE ROTAÇÃO
     Xo, Yo, Zo = geod2geoc(lon0, lat0, h0, a, f)
     # CONVERSÃO DAS COORDENADAS
-    coordsSGL = []
-    for coord in coordsGeo:
-        lon = coord.x()
-        lat = coord.y()
-        h = coord.z() if str(coord.z()) != 'nan' else 0
-        X, Y, Z = geod2geoc(lon, lat, h, a, f)
-        E, N, U = geoc2enu(X, Y, Z, lon0, lat0, Xo, Yo, Zo)
-        coordsSGL += [QgsPoint(E, N, U)]
+    X, Y, Z = geod2geoc(lon, lat, h, a, f)
+    E, N, U = geoc2enu(X, Y, Z, lon0, lat0, Xo, Yo, Zo)
     if dim.lower() == '3d': # Comprimento Real 3D no SGL para Linhas 3D
-        return Distancia(coordsSGL, dim)
+        return DistanciaArray(E, N, U)
     else: # 2D: Comprimento no plano do SGL
-        return Distancia(coordsSGL, dim)
+        return DistanciaArray(E, N)
 
 
 # ---------------
@@ -617,6 +646,35 @@ def reprojectPoints(geom, xform):
         return None
 
 
+def reprojectArrays(crsSrc, crsDest):
+    """
+    Retorna uma função que transforma arrays de coordenadas X e Y do SRC de origem
+    para o SRC de destino (QgsCoordinateReferenceSystem) em uma única chamada.
+    Usa o pyproj, quando disponível, ou o OSR do GDAL.
+    """
+    def definicao(crs):
+        return crs.authid() if crs.authid() else crs.toWkt()
+    try:
+        from pyproj import Transformer
+        transformer = Transformer.from_crs(definicao(crsSrc), definicao(crsDest), always_xy=True)
+        def transformar(X, Y):
+            return transformer.transform(np.asarray(X, dtype='float64'), np.asarray(Y, dtype='float64'))
+    except ImportError:
+        from osgeo import osr
+        src = osr.SpatialReference()
+        src.SetFromUserInput(definicao(crsSrc))
+        src.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        dest = osr.SpatialReference()
+        dest.SetFromUserInput(definicao(crsDest))
+        dest.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        ct = osr.CoordinateTransformation(src, dest)
+        def transformar(X, Y):
+            X, Y = np.broadcast_arrays(np.asarray(X, dtype='float64'), np.asarray(Y, dtype='float64'))
+            pnts = np.array(ct.TransformPoints(np.column_stack((X.ravel(), Y.ravel())).tolist()))
+            return pnts[:,0].reshape(X.shape), pnts[:,1].reshape(X.shape)
+    return transformar
+
+
 def geom2PointList(geom):
     """
     Converte uma QgsGeometry em listas de QgsPoint, considerando seu tipo:
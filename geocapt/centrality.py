@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Leandro França'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026, Leandro França'
+
+# Medidas de centralidade de nuvens de pontos (feição central, mediana espacial)
+# e leitura das coordenadas de camadas de pontos por grupo
+
+import numpy as np
+from qgis.core import QgsFeatureRequest
+
+MAX_EXATO = 5000 # acima deste número de pontos a feição central é aproximada
+CANDIDATOS = 256 # pontos avaliados na aproximação
+
+
+def somaDistancias(x, y, w, cx, cy, bloco=2**22):
+    # Soma (ponderada) das distâncias de cada ponto (cx, cy) a todos os pontos (x, y),
+    # calculada em blocos de linhas para limitar a memória
+    somas = np.empty(len(cx))
+    passo = max(1, bloco//max(len(x), 1))
+    for ini in range(0, len(cx), passo):
+        dx = cx[ini:ini+passo, None] - x[None, :]
+        dy = cy[ini:ini+passo, None] - y[None, :]
+        somas[ini:ini+passo] = np.sqrt(dx*dx + dy*dy) @ w
+    return somas
+
+
+def medianaEspacial(x, y, w=None, iteracoes=50, tol=1e-12):
+    # Mediana espacial (ponto de menor soma das distâncias) pelo método de Weiszfeld
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = np.ones(len(x)) if w is None else np.asarray(w, dtype=float)
+    mx, my = np.average(x, weights=w), np.average(y, weights=w)
+    for k in range(iteracoes):
+        d = np.hypot(x - mx, y - my)
+        d[d < tol] = tol
+        p = w/d
+        nx, ny = (p @ x)/p.sum(), (p @ y)/p.sum()
+        if np.hypot(nx - mx, ny - my) < tol:
+            break
+        mx, my = nx, ny
+    return mx, my
+
+
+def indiceCentral(x, y, w=None, max_exato=MAX_EXATO, candidatos=CANDIDATOS):
+    '''
+    Índice da feição central: ponto com a menor soma (ponderada) das distâncias aos demais.
+    Até max_exato pontos o cálculo é exato; acima disso, apenas os candidatos mais próximos
+    da mediana espacial são avaliados (contra todos os pontos).
+    Em caso de empate, retorna o primeiro índice.
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = np.ones(len(x)) if w is None else np.asarray(w, dtype=float)
+    if len(x) <= max_exato:
+        return int(np.argmin(somaDistancias(x, y, w, x, y)))
+    mx, my = medianaEspacial(x, y, w)
+    ind = np.argpartition(np.hypot(x - mx, y - my), candidatos)[:candidatos]
+    ind.sort()
+    return int(ind[np.argmin(somaDistancias(x, y, w, x[ind], y[ind]))])
+
+
+def pontosPorGrupo(layer, campo_grupo=None, campo_peso=None, temZ=False, feedback=None):
+    '''
+    Lê em uma única passada as coordenadas de uma camada de pontos, separadas por grupo.
+    Retorna um dicionário (na ordem de ocorrência dos grupos) com os arrays
+    'x', 'y', 'z' (se temZ), 'w' (pesos inteiros, se campo_peso) e 'id' (ids das feições).
+    Sem campo de agrupamento, todos os pontos ficam no grupo 'ungrouped'.
+    '''
+    dic = {}
+    total = 100.0/layer.featureCount() if feedback and layer.featureCount() else 0
+    for current, feat in enumerate(layer.getFeatures()):
+        geom = feat.geometry()
+        pnt = geom.constGet()
+        if geom.isMultipart():
+            pnt = pnt.geometryN(0)
+        grupo = feat[campo_grupo] if campo_grupo is not None else 'ungrouped'
+        if grupo not in dic:
+            dic[grupo] = {'x': [], 'y': [], 'z': [], 'w': [], 'id': []}
+        item = dic[grupo]
+        item['x'] += [pnt.x()]
+        item['y'] += [pnt.y()]
+        if temZ:
+            item['z'] += [pnt.z()]
+        if campo_peso is not None:
+            item['w'] += [int(feat[campo_peso])]
+        item['id'] += [feat.id()]
+        if feedback:
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(int(current * total))
+    for grupo in dic:
+        item = dic[grupo]
+        for chave in ('x', 'y', 'z'):
+            item[chave] = np.array(item[chave], dtype=float)
+        item['w'] = np.array(item['w'], dtype=np.int64)
+        item['id'] = np.array(item['id'], dtype=np.int64)
+        if not temZ:
+            del item['z']
+        if campo_peso is None:
+            del item['w']
+    return dic
+
+
+def feicoesPorId(layer, ids):
+    # Feições da camada indexadas pelo id, obtidas em uma única requisição
+    ids = [int(fid) for fid in ids]
+    if not ids:
+        return {}
+    return {feat.id(): feat for feat in layer.getFeatures(QgsFeatureRequest().setFilterFids(ids))}
@@ -68,6 +68,172 @@ def Interpolar(X, Y, BAND, origem, resol_X, resol_Y, metodo, nulo):
             return nulo
 
 
+# Função de Interpolação vetorizada para arrays de coordenadas X e Y
+# Retorna um array com a forma de X e Y, com valor nulo fora do raster ou em vizinhanças com pixel nulo
+def InterpolarArray(X, Y, BAND, origem, resol_X, resol_Y, metodo, nulo):
+    X, Y = np.broadcast_arrays(np.asarray(X, dtype='float64'), np.asarray(Y, dtype='float64'))
+    forma = X.shape
+    X = X.ravel()
+    Y = Y.ravel()
+    lin, col = BAND.shape
+    I = (origem[1]-Y)/resol_Y - 0.5
+    J = (X - origem[0])/resol_X - 0.5
+    Z = np.full(X.shape, np.nan if nulo is None else nulo, dtype='float64')
+    if metodo == 'nearest':
+        # floor(x + 0.5) em vez de round: empates não dependem da janela lida
+        I = np.floor(I + 0.5)
+        J = np.floor(J + 0.5)
+        ok = (I >= 0) & (I < lin) & (J >= 0) & (J < col)
+        Z[ok] = BAND[I[ok].astype(int), J[ok].astype(int)]
+        return Z.reshape(forma)
+    I0 = np.floor(I)
+    J0 = np.floor(J)
+    di = I - I0
+    dj = J - J0
+    if metodo == 'bilinear':
+        I1 = np.ceil(I)
+        J1 = np.ceil(J)
+        ok = (I0 >= 0) & (I1 < lin) & (J0 >= 0) & (J1 < col)
+        i0, i1, j0, j1 = [V[ok].astype(int) for V in (I0, I1, J0, J1)]
+        di, dj = di[ok], dj[ok]
+        V = np.stack((BAND[i0, j0], BAND[i1, j0], BAND[i0, j1], BAND[i1, j1])).astype('float64')
+        valores = (1-di)*(1-dj)*V[0] + (1-dj)*di*V[1] + (1-di)*dj*V[2] + di*dj*V[3]
+    elif metodo == 'bicubic':
+        ok = (I0 >= 1) & (I0 + 2 < lin) & (J0 >= 1) & (J0 + 2 < col)
+        i0 = I0[ok].astype(int)
+        j0 = J0[ok].astype(int)
+        Wi = _PesosCubicos(di[ok])
+        Wj = _PesosCubicos(dj[ok])
+        valores = np.zeros(len(i0))
+        V = np.empty((16, len(i0)))
+        for a in range(4):
+            for b in range(4):
+                V[4*a + b] = BAND[i0 + a - 1, j0 + b - 1]
+                valores += Wi[a]*Wj[b]*V[4*a + b]
+    else:
+        raise ValueError('Invalid interpolation method: {}'.format(metodo))
+    if nulo is not None:
+        valido = (V != nulo).all(axis=0)
+        valores = np.where(valido, valores, nulo)
+    Z[ok] = valores
+    return Z.reshape(forma)
+
+# Pesos da interpolação cúbica (Lagrange) para os nós -1, 0, 1 e 2
+def _PesosCubicos(t):
+    return np.stack((-t*(t-1)*(t-2)/6.,
+                     (t+1)*(t-1)*(t-2)/2.,
+                     -(t+1)*t*(t-2)/2.,
+                     (t+1)*t*(t-1)/6.))
+
+
+# Filtro de janela deslizante (média, mediana, mínimo e máximo)
+# Retorna a matriz filtrada com (linhas - size + 1) por (colunas - size + 1) elementos.
+# Janelas que contêm algum pixel nulo recebem o valor nulo.
+def FiltroJanela(BAND, size, metodo, nulo):
+    BAND = np.asarray(BAND, dtype='float64')
+    lin, col = BAND.shape
+    y = lin - size + 1
+    x = col - size + 1
+    if y < 1 or x < 1:
+        return np.zeros((max(y, 0), max(x, 0)))
+    mask = (BAND == nulo) if nulo is not None else np.zeros(BAND.shape, dtype=bool)
+    if metodo == 'mean':
+        # Tabela de áreas somadas (summed-area table), sem nulos e NaN para não contaminar as somas
+        invalido = ~np.isfinite(BAND)
+        limpo = np.where(mask | invalido, 0.0, BAND)
+        RESULT = _SomaJanela(limpo, size)/(size**2)
+        if invalido.any():
+            RESULT[_SomaJanela(invalido.astype('int64'), size) > 0] = np.nan
+    elif metodo == 'median':
+        janelas = np.lib.stride_tricks.sliding_window_view(BAND, (size, size))
+        RESULT = np.median(janelas.reshape(y, x, size*size), axis=2)
+    elif metodo in ('min', 'max'):
+        func = np.minimum if metodo == 'min' else np.maximum
+        # Filtro separável: primeiro nas colunas, depois nas linhas
+        temp = BAND[:, 0:x].copy()
+        for k in range(1, size):
+            func(temp, BAND[:, k:k+x], out=temp)
+        RESULT = temp[0:y, :].copy()
+        for k in range(1, size):
+            func(RESULT, temp[k:k+y, :], out=RESULT)
+    else:
+        raise ValueError('Invalid filter method: {}'.format(metodo))
+    # Propagação dos valores nulos
+    if mask.any():
+        RESULT[_SomaJanela(mask.astype('int64'), size) > 0] = nulo
+    return RESULT
+
+# Soma em janelas deslizantes de size por size pela tabela de áreas somadas
+def _SomaJanela(BAND, size):
+    lin, col = BAND.shape
+    SAT = np.zeros((lin + 1, col + 1), dtype=BAND.dtype)
+    SAT[1:, 1:] = BAND.cumsum(axis=0).cumsum(axis=1)
+    return SAT[size:, size:] - SAT[:-size, size:] - SAT[size:, :-size] + SAT[:-size, :-size]
+
+
+# Classificação supervisionada de um bloco de pixels
+# PIXELS: array (bandas, linhas, colunas)
+# dic: estatísticas de cada classe (média, desvio-padrão, MVC, determinante e inversa da MVC)
+# ordem: lista [traço da MVC, código] em ordem decrescente
+# metodo: 0 - Paralelepípedo, 1 - Elipsoide, 2 - Distância Euclidiana, 3 - Distância de Mahalanobis
+def ClassificarBloco(PIXELS, dic, ordem, metodo, fator):
+    n_bands, lin, col = PIXELS.shape
+    px = PIXELS.reshape(n_bands, -1).astype('float64')
+    if metodo in (0, 1):
+        # A última classe da ordem que contém o pixel prevalece
+        classes = np.zeros(px.shape[1], dtype=np.uint8)
+        for item in ordem:
+            code = item[1]
+            m = dic[code]['media']
+            if metodo == 0: # Paralelepípedo
+                s = dic[code]['desvpad']
+                cond = ((m - fator*s < px) & (px < m + fator*s)).all(axis=0)
+            else: # Elipsoide
+                d = px - m
+                pos = np.einsum('in,ij,jn->n', d, np.asarray(dic[code]['mvc']), d) - dic[code]['det']
+                cond = pos <= 0
+            if code:
+                classes[cond] = code
+    else:
+        # Classe de menor distância
+        codes = list(dic.keys())
+        dist = np.empty((len(codes), px.shape[1]))
+        for k, code in enumerate(codes):
+            d = px - dic[code]['media']
+            if metodo == 2: # Distância Euclidiana
+                dist[k] = (d*d).sum(axis=0)
+            else: # Distância de Mahalanobis
+                dist[k] = np.einsum('in,ij,jn->n', d, np.asarray(dic[code]['MVC_inv']), d)
+        classes = np.array(codes)[np.argmin(dist, axis=0)].astype(np.uint8)
+    return classes.reshape(lin, col)
+
+
+# Camada OGR em memória com polígonos (lista de geometrias WKT) para rasterização
+def FontePoligonos(wkts, prj=''):
+    from osgeo import ogr, osr
+    fonte = ogr.GetDriverByName('Memory').CreateDataSource('poligonos')
+    srs = osr.SpatialReference(wkt=prj) if prj else None
+    camada = fonte.CreateLayer('poligonos', srs, ogr.wkbUnknown)
+    for wkt in wkts:
+        feat = ogr.Feature(camada.GetLayerDefn())
+        feat.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+        camada.CreateFeature(feat)
+        feat = None
+    return fonte
+
+# Máscara booleana dos pixels com centro dentro dos polígonos, para um bloco do raster
+# geotransform: do raster completo; col0, lin0, cols, rows: janela do bloco
+def MascaraPoligonos(fonte, geotransform, col0, lin0, cols, rows):
+    from osgeo import gdal
+    ulx, xres, xskew, uly, yskew, yres = geotransform
+    mem = gdal.GetDriverByName('MEM').Create('', cols, rows, 1, gdal.GDT_Byte)
+    mem.SetGeoTransform((ulx + col0*xres, xres, xskew, uly + lin0*yres, yskew, yres))
+    gdal.RasterizeLayer(mem, [1], fonte.GetLayer(0), burn_values=[1])
+    mascara = mem.GetRasterBand(1).ReadAsArray().astype(bool)
+    mem = None
+    return mascara
+
+
 def rgb2hsv(rgb):
     rgb = rgb.astype('float')/255. # dividir pelo máximo - mínimo
     maxv = np.amax(rgb, axis=2)
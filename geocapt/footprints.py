@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Leandro França'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026, Leandro França'
+
+# Índice persistente das extensões (footprints) de arquivos raster
+# SQLite com R-tree das extensões em WGS84, chaveado por caminho e data de modificação
+
+import os
+import sqlite3
+from osgeo import gdal
+from qgis.core import (QgsApplication,
+                       QgsProject,
+                       QgsPointXY,
+                       QgsGeometry,
+                       QgsCoordinateTransform,
+                       QgsCoordinateReferenceSystem)
+
+CAMPOS = ['path', 'mtime', 'crs', 'ulx', 'xres', 'uly', 'yres', 'cols', 'rows', 'bands', 'datatype', 'nodata']
+
+
+def caminhoIndice():
+    pasta = os.path.join(QgsApplication.qgisSettingsDirPath(), 'lftools')
+    os.makedirs(pasta, exist_ok=True)
+    return os.path.join(pasta, 'raster_footprints.sqlite')
+
+
+def abrirIndice(arquivo=None):
+    conn = sqlite3.connect(arquivo or caminhoIndice())
+    conn.execute('''CREATE TABLE IF NOT EXISTS footprints (
+                        id INTEGER PRIMARY KEY,
+                        path TEXT UNIQUE,
+                        mtime REAL,
+                        crs TEXT,
+                        ulx REAL, xres REAL, uly REAL, yres REAL,
+                        cols INTEGER, rows INTEGER,
+                        bands INTEGER, datatype INTEGER, nodata REAL)''')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS footprints_rtree USING rtree(id, xmin, xmax, ymin, ymax)')
+    except sqlite3.OperationalError:
+        # SQLite compilado sem o módulo R-tree
+        conn.execute('CREATE TABLE IF NOT EXISTS footprints_rtree (id INTEGER PRIMARY KEY, xmin REAL, xmax REAL, ymin REAL, ymax REAL)')
+    return conn
+
+
+def extensaoGeo(crs, ulx, xres, uly, yres, cols, rows):
+    # Extensão do raster em WGS84 (xmin, xmax, ymin, ymax)
+    coord = [[QgsPointXY(ulx, uly),
+              QgsPointXY(ulx+cols*xres, uly),
+              QgsPointXY(ulx+cols*xres, uly+rows*yres),
+              QgsPointXY(ulx, uly+rows*yres),
+              QgsPointXY(ulx, uly)]]
+    geom = QgsGeometry.fromPolygonXY(coord).densifyByCount(10)
+    SRC = QgsCoordinateReferenceSystem(crs)
+    WGS84 = QgsCoordinateReferenceSystem('EPSG:4326')
+    try:
+        if SRC != WGS84:
+            geom.transform(QgsCoordinateTransform(SRC, WGS84, QgsProject.instance()))
+        box = geom.boundingBox()
+        return (box.xMinimum(), box.xMaximum(), box.yMinimum(), box.yMaximum())
+    except Exception:
+        return (-180.0, 180.0, -90.0, 90.0)
+
+
+def metadadosRaster(file_path):
+    # Metadados lidos diretamente do arquivo pelo GDAL
+    image = gdal.Open(file_path)
+    if image is None:
+        return None
+    ulx, xres, xskew, uly, yskew, yres = image.GetGeoTransform()
+    banda = image.GetRasterBand(1)
+    meta = {'path': file_path,
+            'mtime': None,
+            'crs': image.GetProjection(),
+            'ulx': ulx, 'xres': xres, 'uly': uly, 'yres': yres,
+            'cols': image.RasterXSize, 'rows': image.RasterYSize,
+            'bands': image.RasterCount,
+            'datatype': banda.DataType,
+            'nodata': banda.GetNoDataValue()}
+    image = None
+    return meta
+
+
+def indexarRasters(lista, feedback=None, arquivo=None):
+    '''
+    Atualiza o índice com os arquivos novos ou modificados da lista e retorna
+    um dicionário {caminho: metadados} com SRC, geotransform, tamanho, bandas, tipo e valor nulo.
+    Arquivos que não puderem ser abertos pelo GDAL não são retornados.
+    '''
+    conn = abrirIndice(arquivo)
+    resultado = {}
+    total = 100.0/len(lista) if lista else 0
+    for current, file_path in enumerate(lista):
+        file_path = os.path.abspath(file_path)
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            continue
+        linha = conn.execute('SELECT id, ' + ', '.join(CAMPOS) + ' FROM footprints WHERE path = ?', (file_path,)).fetchone()
+        if linha and linha[2] == mtime:
+            resultado[file_path] = dict(zip(CAMPOS, linha[1:]))
+        else:
+            meta = metadadosRaster(file_path)
+            if meta is None:
+                if feedback:
+                    feedback.pushInfo('Problem opening the file: {}'.format(file_path))
+                continue
+            meta['mtime'] = mtime
+            if linha:
+                conn.execute('DELETE FROM footprints WHERE id = ?', (linha[0],))
+                conn.execute('DELETE FROM footprints_rtree WHERE id = ?', (linha[0],))
+            cursor = conn.execute('INSERT INTO footprints (' + ', '.join(CAMPOS) + ') VALUES (' + ', '.join(['?']*len(CAMPOS)) + ')',
+                                  [meta[campo] for campo in CAMPOS])
+            xmin, xmax, ymin, ymax = extensaoGeo(meta['crs'], meta['ulx'], meta['xres'], meta['uly'], meta['yres'], meta['cols'], meta['rows'])
+            conn.execute('INSERT INTO footprints_rtree (id, xmin, xmax, ymin, ymax) VALUES (?, ?, ?, ?, ?)',
+                         (cursor.lastrowid, xmin, xmax, ymin, ymax))
+            resultado[file_path] = meta
+        if feedback:
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(int((current+1) * total))
+    conn.commit()
+    conn.close()
+    return resultado
+
+
+def rastersNaExtensao(lista, xmin, xmax, ymin, ymax, arquivo=None):
+    '''
+    Retorna os caminhos da lista (já indexados) cuja extensão em WGS84 intercepta o retângulo dado.
+    '''
+    caminhos = set(os.path.abspath(file_path) for file_path in lista)
+    conn = abrirIndice(arquivo)
+    linhas = conn.execute('''SELECT f.path FROM footprints f JOIN footprints_rtree r ON f.id = r.id
+                             WHERE r.xmax >= ? AND r.xmin <= ? AND r.ymax >= ? AND r.ymin <= ?''',
+                          (xmin, xmax, ymin, ymax)).fetchall()
+    conn.close()
+    return [linha[0] for linha in linhas if linha[0] in caminhos]
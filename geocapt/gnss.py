@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Leandro França'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026, Leandro França'
+
+# Leitura de arquivos GNSS (NMEA e .pos do RTKLIB / PPP-IBGE) em uma única passada,
+# com os valores retornados em colunas (arrays NumPy) e cache por caminho e data de modificação
+
+import os
+import threading
+import numpy as np
+
+NMEA_QUALITY = {0:'0: Invalid', 1:'1: Standalone', 2:'2: DGPS', 3:'3: n/a', 4:'4: RTK fixed', 5:'5: RTK float'}
+POS_QUALITY = {1:'1: fix', 2:'2: float', 3:'3: sbas', 4:'4: dgps', 5: '5: single', 6: '6: ppp'}
+
+_BLOCO = 2**24 # bytes lidos por vez
+_CACHE = {}
+_CACHE_MAX = 8
+_LOCK = threading.Lock()
+
+
+def _cache(caminho, leitor):
+    # Resultado reaproveitado enquanto o arquivo não for modificado
+    info = os.stat(caminho)
+    chave = (os.path.abspath(caminho), info.st_mtime_ns, info.st_size, leitor.__name__)
+    with _LOCK:
+        if chave in _CACHE:
+            return dict(_CACHE[chave])
+    dados = leitor(caminho)
+    with _LOCK:
+        if len(_CACHE) >= _CACHE_MAX:
+            del _CACHE[next(iter(_CACHE))]
+        _CACHE[chave] = dados
+    return dict(dados)
+
+
+def _numeros(coluna):
+    # Conversão de uma coluna de textos (bytes) para float, com nan nos valores inválidos
+    coluna = np.asarray(coluna, dtype=bytes)
+    try:
+        return np.where(coluna == b'', b'nan', coluna).astype(float)
+    except ValueError:
+        valores = np.full(len(coluna), np.nan)
+        for k, valor in enumerate(coluna):
+            try:
+                valores[k] = float(valor)
+            except ValueError:
+                pass
+        return valores
+
+
+def _digitos(coluna, ini, fim):
+    # Inteiro formado pelos caracteres [ini:fim] de textos de largura fixa (ex.: datas)
+    largura = max(len(valor) for valor in coluna) if len(coluna) else fim
+    chars = np.ascontiguousarray(coluna, dtype='S{}'.format(largura)).view('S1').reshape(len(coluna), largura)
+    digitos = chars[:, ini:fim].view(np.uint8).astype(int) - 48
+    return (digitos * 10**np.arange(fim - ini - 1, -1, -1)).sum(axis=1)
+
+
+def _colunas(partes, n):
+    # Matriz de textos com as n primeiras colunas das linhas que possuem pelo menos n colunas
+    partes = [p[:n] for p in partes if len(p) >= n]
+    if not partes:
+        return np.empty((0, n), dtype=bytes)
+    return np.array(partes, dtype=bytes)
+
+
+def lerNMEA(caminho):
+    '''
+    Lê um arquivo NMEA e retorna um dicionário de arrays com as soluções válidas (sentenças GGA)
+    lat, lon, H (altitude ortométrica), N (ondulação geoidal), HDOP, VDOP, PDOP (última GSA anterior),
+    hora, minuto, segundo, quality (código) e num_sat, além da data (ano, mes, dia) da última
+    sentença ZDA ou RMC válida (ou None).
+    '''
+    return _cache(caminho, _lerNMEA)
+
+
+def _lerNMEA(caminho):
+    colunas = {nome: [] for nome in ('lat', 'lon', 'H', 'N', 'HDOP', 'VDOP', 'PDOP', 'hora', 'minuto', 'segundo', 'quality', 'num_sat')}
+    data = None
+    dop = (-1., -1.) # VDOP e PDOP da última sentença GSA
+    with open(caminho, 'rb') as arq:
+        while True:
+            bloco = arq.readlines(_BLOCO)
+            if not bloco:
+                break
+            tipos = [linha[3:6] for linha in bloco]
+            ind_gga = [k for k, tipo in enumerate(tipos) if tipo == b'GGA']
+            ind_gsa = [k for k, tipo in enumerate(tipos) if tipo == b'GSA']
+
+            # Data (ZDA ou RMC), apenas a última válida é usada
+            for k, tipo in enumerate(tipos):
+                try:
+                    if tipo == b'ZDA':
+                        partes = bloco[k].split(b',')
+                        data = (int(partes[4]), int(partes[3]), int(partes[2]))
+                    elif tipo == b'RMC':
+                        partes = bloco[k].split(b',')
+                        if partes[2] == b'A':
+                            data = (int(partes[9][4:6]) + 2000, int(partes[9][2:4]), int(partes[9][0:2]))
+                except (ValueError, IndexError):
+                    pass
+
+            # DOPs das sentenças GSA
+            gsa = [bloco[k].split(b',') for k in ind_gsa]
+            gsa_ok = [len(p) >= 4 for p in gsa]
+            dops = np.array([[_float(p[-2]), _float(p[-4])] if ok else [np.nan, np.nan] for p, ok in zip(gsa, gsa_ok)]).reshape(-1, 2)
+            validas = ~np.isnan(dops).any(axis=1)
+            ind_gsa = np.array(ind_gsa, dtype=int)[validas]
+            dops = dops[validas]
+
+            # Sentenças GGA
+            gga = [bloco[k].split(b',') for k in ind_gga]
+            ind_gga = np.array([k for k, p in zip(ind_gga, gga) if len(p) >= 12], dtype=int)
+            M = _colunas(gga, 12)
+            if len(M):
+                quality = _numeros(M[:, 6])
+                tempo = _numeros(M[:, 1])
+                lat = _numeros(M[:, 2])
+                lon = _numeros(M[:, 4])
+                lat = (np.floor(lat/100) + (lat - 100*np.floor(lat/100))/60) * np.where(M[:, 3] == b'S', -1, 1)
+                lon = (np.floor(lon/100) + (lon - 100*np.floor(lon/100))/60) * np.where(M[:, 5] == b'W', -1, 1)
+                num_sat = _numeros(M[:, 7])
+                HDOP = _numeros(M[:, 8])
+                H = _numeros(M[:, 9])
+                N = _numeros(M[:, 11])
+                # VDOP e PDOP da última GSA anterior a cada GGA
+                pos = np.searchsorted(ind_gsa, ind_gga) - 1
+                VDOP = np.where(pos >= 0, dops[np.maximum(pos, 0), 0] if len(dops) else dop[0], dop[0])
+                PDOP = np.where(pos >= 0, dops[np.maximum(pos, 0), 1] if len(dops) else dop[1], dop[1])
+                ok = (quality >= 1) & (quality <= 5) & ~np.isnan(tempo + lat + lon + num_sat + HDOP + H + N)
+                hora = np.floor(tempo/1e4)
+                minuto = np.floor(tempo/100) - 100*hora
+                segundo = tempo - 1e4*hora - 100*minuto
+                for nome, valores in (('lat', lat), ('lon', lon), ('H', H), ('N', N), ('HDOP', HDOP), ('VDOP', VDOP), ('PDOP', PDOP),
+                                      ('hora', hora), ('minuto', minuto), ('segundo', segundo), ('quality', quality), ('num_sat', num_sat)):
+                    colunas[nome] += [valores[ok]]
+            if len(dops):
+                dop = tuple(dops[-1])
+
+    dados = {nome: (np.concatenate(colunas[nome]) if colunas[nome] else np.empty(0)) for nome in colunas}
+    for nome in ('hora', 'minuto', 'quality', 'num_sat'):
+        dados[nome] = dados[nome].astype(int)
+    dados['data'] = data
+    return dados
+
+
+def _float(valor):
+    try:
+        return float(valor)
+    except ValueError:
+        return np.nan
+
+
+def lerPOS(caminho):
+    '''
+    Lê um arquivo .pos do RTKLIB ou do PPP-IBGE e retorna um dicionário de arrays
+    lat, lon, h, ano, mes, dia, hora, minuto, segundo, quality (código; 0 para o PPP-IBGE),
+    nsat, slat, slon, sh, além do tipo ('rtklib' ou 'ibge').
+    Retorna tipo None se o formato não for reconhecido.
+    '''
+    return _cache(caminho, _lerPOS)
+
+
+def _lerPOS(caminho):
+    nomes = ('lat', 'lon', 'h', 'ano', 'mes', 'dia', 'hora', 'minuto', 'segundo', 'quality', 'nsat', 'slat', 'slon', 'sh')
+    colunas = {nome: [] for nome in nomes}
+    with open(caminho, 'rb') as arq:
+        primeira = arq.readline()
+        if primeira[:1] == b'%':
+            tipo = 'rtklib'
+        elif primeira[:1] == b'-':
+            tipo = 'ibge'
+        else:
+            return {'tipo': None}
+        arq.seek(0)
+        while True:
+            bloco = arq.readlines(_BLOCO)
+            if not bloco:
+                break
+            if tipo == 'rtklib':
+                # data hora lat lon h Q ns sdn sde sdu ...
+                M = _colunas([linha.split() for linha in bloco if linha[:1] != b'%'], 10)
+                if not len(M):
+                    continue
+                M = M[(np.char.count(M[:, 0], b'/') == 2) & (np.char.count(M[:, 1], b':') == 2)]
+                if not len(M):
+                    continue
+                valores = {'lat': _numeros(M[:, 2]),
+                           'lon': _numeros(M[:, 3]),
+                           'h': _numeros(M[:, 4]),
+                           'ano': _digitos(M[:, 0], 0, 4),
+                           'mes': _digitos(M[:, 0], 5, 7),
+                           'dia': _digitos(M[:, 0], 8, 10),
+                           'hora': _digitos(M[:, 1], 0, 2),
+                           'minuto': _digitos(M[:, 1], 3, 5),
+                           'segundo': _numeros([t[6:] for t in M[:, 1]]),
+                           'quality': _numeros(M[:, 5]),
+                           'nsat': _numeros(M[:, 6]),
+                           'slat': _numeros(M[:, 7]),
+                           'slon': _numeros(M[:, 8]),
+                           'sh': _numeros(M[:, 9])}
+                ok = np.isin(valores['quality'], list(POS_QUALITY))
+            else:
+                # Linhas FWD do relatório do PPP-IBGE
+                M = _colunas([linha.split() for linha in bloco if linha[0:3] == b'FWD'], 27)
+                M = M[(np.char.count(M[:, 4], b'-') == 2) & (np.char.count(M[:, 5], b':') == 2)]
+                if not len(M):
+                    continue
+                graus_lat, graus_lon = _numeros(M[:, 20]), _numeros(M[:, 23])
+                sinal_lat = np.where(np.signbit(graus_lat), -1, 1)
+                sinal_lon = np.where(np.signbit(graus_lon), -1, 1)
+                valores = {'lat': graus_lat + sinal_lat*(_numeros(M[:, 21])/60. + _numeros(M[:, 22])/3600),
+                           'lon': graus_lon + sinal_lon*(_numeros(M[:, 24])/60. + _numeros(M[:, 25])/3600),
+                           'h': _numeros(M[:, 26]),
+                           'ano': _digitos(M[:, 4], 0, 4),
+                           'mes': _digitos(M[:, 4], 5, 7),
+                           'dia': _digitos(M[:, 4], 8, 10),
+                           'hora': _digitos(M[:, 5], 0, 2),
+                           'minuto': _digitos(M[:, 5], 3, 5),
+                           'segundo': _numeros([t[6:] for t in M[:, 5]]),
+                           'quality': np.zeros(len(M)),
+                           'nsat': _numeros(M[:, 6]),
+                           'slat': _numeros(M[:, 15]),
+                           'slon': _numeros(M[:, 16]),
+                           'sh': _numeros(M[:, 17])}
+                # Segundo igual a 60 passa para o minuto (ou hora) seguinte
+                s60 = np.floor(valores['segundo']) == 60
+                vira_hora = s60 & (valores['minuto'] >= 59)
+                valores['hora'] = valores['hora'] + vira_hora
+                valores['minuto'] = np.where(vira_hora, 0, valores['minuto'] + s60)
+                valores['segundo'] = np.where(s60, 0, valores['segundo'])
+                ok = np.ones(len(M), dtype=bool)
+            for nome in ('lat', 'lon', 'h', 'segundo', 'nsat', 'slat', 'slon', 'sh'):
+                ok &= ~np.isnan(valores[nome])
+            for nome in nomes:
+                colunas[nome] += [valores[nome][ok]]
+
+    dados = {nome: (np.concatenate(colunas[nome]) if colunas[nome] else np.empty(0)) for nome in nomes}
+    for nome in ('ano', 'mes', 'dia', 'hora', 'minuto', 'quality', 'nsat'):
+        dados[nome] = dados[nome].astype(int)
+    dados['tipo'] = tipo
+    return dados
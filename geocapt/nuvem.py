@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Leandro França'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026, Leandro França'
+
+# Leitura em blocos de nuvens de pontos em texto (X Y Z ...) e filtro pela vizinhança
+# de pontos de referência, sem carregar a nuvem inteira na memória
+
+import os
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+def _linhasXYZ(linhas):
+    # Conversão linha a linha, ignorando linhas inválidas (cabeçalho, linhas vazias)
+    valores = []
+    for linha in linhas:
+        partes = linha.split()
+        try:
+            valores += [(float(partes[0]), float(partes[1]), float(partes[2]))]
+        except (ValueError, IndexError):
+            continue
+    return np.array(valores, dtype=float).reshape(-1, 3)
+
+
+def blocosXYZ(caminho, tamanho=2**24):
+    '''
+    Gera blocos (array (n, 3) com X, Y, Z, bytes lidos, tamanho do arquivo) de um arquivo texto
+    com as coordenadas nas três primeiras colunas, lendo cerca de "tamanho" bytes por vez.
+    '''
+    total = os.path.getsize(caminho)
+    with open(caminho, 'rb') as arquivo:
+        while True:
+            linhas = arquivo.readlines(tamanho)
+            if not linhas:
+                break
+            try:
+                xyz = np.loadtxt(linhas, usecols=(0, 1, 2), ndmin=2, dtype=float)
+            except (ValueError, IndexError):
+                xyz = _linhasXYZ(linhas)
+            yield xyz, arquivo.tell(), total
+
+
+class VizinhancaQuadrada:
+    '''
+    Pontos de referência (xr, yr) indexados em uma grade de células de lado d.
+    mascara(x, y) indica os pontos com |x - xr| < d e |y - yr| < d para alguma referência,
+    testando apenas as referências das 9 células vizinhas.
+    '''
+    def __init__(self, xr, yr, d):
+        self.xr = np.asarray(xr, dtype=float)
+        self.yr = np.asarray(yr, dtype=float)
+        self.d = float(d)
+        ci = np.floor(self.xr/self.d).astype(np.int64)
+        cj = np.floor(self.yr/self.d).astype(np.int64)
+        # Origem com uma célula de folga para as células vizinhas
+        self.i0, self.j0 = ci.min() - 1, cj.min() - 1
+        self.nx = int(ci.max() - self.i0) + 2
+        self.ny = int(cj.max() - self.j0) + 2
+        chaves = (ci - self.i0)*self.ny + (cj - self.j0)
+        self.ordem = np.argsort(chaves, kind='stable')
+        self.chaves = chaves[self.ordem]
+        self.limites = (self.xr.min() - self.d, self.xr.max() + self.d,
+                        self.yr.min() - self.d, self.yr.max() + self.d)
+
+    def mascara(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        resultado = np.zeros(len(x), dtype=bool)
+        xmin, xmax, ymin, ymax = self.limites
+        dentro = np.nonzero((x > xmin) & (x < xmax) & (y > ymin) & (y < ymax))[0]
+        if not len(dentro):
+            return resultado
+        xs, ys = x[dentro], y[dentro]
+        pi = np.floor(xs/self.d).astype(np.int64) - self.i0
+        pj = np.floor(ys/self.d).astype(np.int64) - self.j0
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                ii, jj = pi + di, pj + dj
+                valido = (ii >= 0) & (ii < self.nx) & (jj >= 0) & (jj < self.ny)
+                chave = np.where(valido, ii*self.ny + jj, -1)
+                ini = np.searchsorted(self.chaves, chave, 'left')
+                cont = np.searchsorted(self.chaves, chave, 'right') - ini
+                if not cont.any():
+                    continue
+                # Pares (ponto, referência) das referências da célula
+                pares = np.repeat(np.arange(len(xs)), cont)
+                desloc = np.arange(len(pares)) - np.repeat(np.cumsum(cont) - cont, cont)
+                refs = self.ordem[ini[pares] + desloc]
+                ok = (np.abs(xs[pares] - self.xr[refs]) < self.d) & (np.abs(ys[pares] - self.yr[refs]) < self.d)
+                resultado[dentro[pares[ok]]] = True
+        return resultado
+
+
+def maisProximo3D(pontos, consultas, usar_scipy=True):
+    '''
+    Ponto mais próximo (distância 3D) de cada consulta.
+    Retorna (dist, ind); com "pontos" vazio, dist = inf e ind = -1.
+    '''
+    pontos = np.asarray(pontos, dtype=float).reshape(-1, 3)
+    consultas = np.asarray(consultas, dtype=float).reshape(-1, 3)
+    dist = np.full(len(consultas), np.inf)
+    ind = np.full(len(consultas), -1, dtype=np.int64)
+    if not len(pontos):
+        return dist, ind
+    if usar_scipy and cKDTree is not None:
+        dist, ind = cKDTree(pontos).query(consultas, k=1)
+        return np.asarray(dist, dtype=float), np.asarray(ind, dtype=np.int64)
+    for k, q in enumerate(consultas):
+        d2 = ((pontos - q)**2).sum(axis=1)
+        ind[k] = np.argmin(d2)
+        dist[k] = np.sqrt(d2[ind[k]])
+    return dist, ind
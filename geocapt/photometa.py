@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Leandro França'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026, Leandro França'
+
+# Cache persistente dos metadados (EXIF/GPS) de fotos
+# SQLite chaveado por caminho, tamanho e data de modificação; a extração dos arquivos novos
+# ou modificados é feita em paralelo (threads)
+
+import os
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from qgis.core import QgsApplication
+
+NAO_LIDO = object() # foto não processada (cancelamento)
+
+
+def caminhoCache():
+    pasta = os.path.join(QgsApplication.qgisSettingsDirPath(), 'lftools')
+    os.makedirs(pasta, exist_ok=True)
+    return os.path.join(pasta, 'photo_metadata.sqlite')
+
+
+def abrirCache(arquivo=None):
+    conn = sqlite3.connect(arquivo or caminhoCache())
+    conn.execute('''CREATE TABLE IF NOT EXISTS fotos (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER,
+                        mtime REAL,
+                        ypr INTEGER,
+                        dados TEXT)''')
+    return conn
+
+
+def metadadosFotos(lista, extrair, ypr=False, workers=None, feedback=None, arquivo=None):
+    '''
+    Retorna a lista de metadados (dicionários) das fotos, na mesma ordem da lista de caminhos.
+    extrair(caminho, ypr) é chamada, em um pool de threads, apenas para os arquivos ausentes no cache
+    ou modificados (tamanho ou data), e deve retornar um dicionário serializável em JSON.
+    Arquivos que não puderem ser lidos retornam None e não são guardados no cache.
+    Após um cancelamento, as fotos ainda não processadas retornam NAO_LIDO.
+    '''
+    conn = abrirCache(arquivo)
+    resultado = [NAO_LIDO]*len(lista)
+    faltantes = []
+    for k, caminho in enumerate(lista):
+        try:
+            info = os.stat(caminho)
+        except OSError:
+            resultado[k] = None
+            continue
+        linha = conn.execute('SELECT size, mtime, ypr, dados FROM fotos WHERE path = ?', (os.path.abspath(caminho),)).fetchone()
+        if linha and linha[0] == info.st_size and linha[1] == info.st_mtime and (linha[2] or not ypr):
+            resultado[k] = json.loads(linha[3])
+        else:
+            faltantes += [(k, caminho, info.st_size, info.st_mtime)]
+
+    def tarefa(item):
+        try:
+            return extrair(item[1], ypr)
+        except Exception:
+            return None
+
+    if feedback and len(lista):
+        feedback.pushInfo('{} / {} (cache)'.format(len(lista) - len(faltantes), len(lista)))
+    total = 100.0/len(faltantes) if faltantes else 0
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        for ini in range(0, len(faltantes), 2*workers):
+            lote = faltantes[ini:ini+2*workers]
+            for (k, caminho, tamanho, mtime), dados in zip(lote, executor.map(tarefa, lote)):
+                resultado[k] = dados
+                if dados is not None:
+                    conn.execute('INSERT OR REPLACE INTO fotos (path, size, mtime, ypr, dados) VALUES (?, ?, ?, ?, ?)',
+                                 (os.path.abspath(caminho), tamanho, mtime, int(ypr), json.dumps(dados)))
+            conn.commit()
+            if feedback:
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(int((ini + len(lote)) * total))
+    conn.close()
+    return resultado
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Leandro França'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026, Leandro França'
+
+# Cache local de tiles (MDE) endereçado por conteúdo, com remoção LRU por tamanho
+# Os arquivos ficam em <pasta>/objects/<sha256>/<nome do tile>, preservando o nome original
+# (necessário para drivers como o HGT do SRTM). O índice é um SQLite em <pasta>/index.sqlite.
+
+import os
+import time
+import gzip
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import http.client
+from urllib.parse import urlsplit, urljoin
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class _Conexoes(threading.local):
+    # Conexões HTTP(S) reaproveitadas (keep-alive) por thread e por servidor
+    # "abertas" é a mesma lista em todas as threads, para que fechar() alcance as conexões de todas elas
+    def __init__(self, abertas):
+        self.pool = {}
+        self.abertas = abertas
+
+    def get(self, scheme, netloc, timeout):
+        chave = (scheme, netloc)
+        if chave not in self.pool:
+            classe = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            self.pool[chave] = classe(netloc, timeout=timeout)
+            self.abertas.append(self.pool[chave])
+        return self.pool[chave]
+
+    def drop(self, scheme, netloc):
+        conn = self.pool.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def fechar(self):
+        # Fecha as conexões de todas as threads (chamado após o término do pool de threads)
+        while self.abertas:
+            self.abertas.pop().close()
+
+
+def gunzip(origem, destino):
+    with gzip.open(origem, 'rb') as f_in:
+        with open(destino, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+
+class TileCache:
+
+    def __init__(self, pasta, max_bytes=2*1024**3, workers=4, timeout=60):
+        self.pasta = pasta
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.timeout = timeout
+        self.conexoes = _Conexoes([])
+        os.makedirs(os.path.join(pasta, 'objects'), exist_ok=True)
+        conn = self._abrir()
+        conn.execute('''CREATE TABLE IF NOT EXISTS tiles (
+                            url TEXT PRIMARY KEY,
+                            hash TEXT,
+                            path TEXT,
+                            size INTEGER,
+                            atime REAL)''')
+        conn.commit()
+        conn.close()
+
+    def _abrir(self):
+        return sqlite3.connect(os.path.join(self.pasta, 'index.sqlite'))
+
+    def _baixar(self, url, destino, redirecionamentos=5):
+        # Download por conexão reaproveitada, seguindo redirecionamentos
+        for tentativa in range(redirecionamentos + 1):
+            partes = urlsplit(url)
+            caminho = partes.path or '/'
+            if partes.query:
+                caminho += '?' + partes.query
+            for reconectar in (False, True):
+                conn = self.conexoes.get(partes.scheme, partes.netloc, self.timeout)
+                try:
+                    conn.request('GET', caminho, headers={'User-Agent': 'LFTools'})
+                    resposta = conn.getresponse()
+                    break
+                except (http.client.HTTPException, OSError):
+                    # Conexão keep-alive encerrada pelo servidor
+                    self.conexoes.drop(partes.scheme, partes.netloc)
+                    if reconectar:
+                        raise
+            if resposta.status in (301, 302, 303, 307, 308):
+                resposta.read()
+                url = urljoin(url, resposta.getheader('Location'))
+                continue
+            if resposta.status != 200:
+                resposta.read()
+                raise IOError('HTTP {} {} - {}'.format(resposta.status, resposta.reason, url))
+            sha = hashlib.sha256()
+            with open(destino, 'wb') as arq:
+                while True:
+                    dados = resposta.read(2**20)
+                    if not dados:
+                        break
+                    sha.update(dados)
+                    arq.write(dados)
+            return sha.hexdigest()
+        raise IOError('Too many redirects - {}'.format(url))
+
+    def _obter(self, url, nome, transformar):
+        # Executado nas threads: baixa, transforma (ex.: gunzip) e move para o objeto endereçado pelo hash
+        temp = tempfile.mkdtemp(dir=self.pasta, prefix='tmp_')
+        try:
+            baixado = os.path.join(temp, 'download')
+            sha = self._baixar(url, baixado)
+            final = os.path.join(temp, nome)
+            if transformar:
+                transformar(baixado, final)
+            else:
+                os.replace(baixado, final)
+            pasta_obj = os.path.join(self.pasta, 'objects', sha)
+            os.makedirs(pasta_obj, exist_ok=True)
+            caminho = os.path.join(pasta_obj, nome)
+            os.replace(final, caminho)
+            return url, sha, caminho, os.path.getsize(caminho)
+        finally:
+            shutil.rmtree(temp, ignore_errors=True)
+
+    def get_many(self, itens, feedback=None):
+        '''
+        itens: lista de (url, nome do arquivo, função de transformação ou None)
+        Retorna {url: caminho local ou exceção}. Tiles já presentes no cache são reaproveitados
+        e os ausentes são baixados em paralelo.
+        '''
+        resultado = {}
+        faltantes = []
+        conn = self._abrir()
+        agora = time.time()
+        for url, nome, transformar in itens:
+            linha = conn.execute('SELECT path FROM tiles WHERE url = ?', (url,)).fetchone()
+            if linha and os.path.exists(linha[0]):
+                resultado[url] = linha[0]
+                conn.execute('UPDATE tiles SET atime = ? WHERE url = ?', (agora, url))
+                if feedback:
+                    feedback.pushInfo('{} (cache)'.format(nome))
+            else:
+                faltantes += [(url, nome, transformar)]
+        conn.commit()
+
+        if faltantes:
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+                    futuros = {executor.submit(self._obter, url, nome, transformar): (url, nome) for url, nome, transformar in faltantes}
+                    for futuro in as_completed(futuros):
+                        url, nome = futuros[futuro]
+                        try:
+                            url, sha, caminho, tamanho = futuro.result()
+                        except Exception as e:
+                            resultado[url] = e
+                            continue
+                        conn.execute('INSERT OR REPLACE INTO tiles (url, hash, path, size, atime) VALUES (?, ?, ?, ?, ?)',
+                                     (url, sha, caminho, tamanho, time.time()))
+                        resultado[url] = caminho
+                        if feedback:
+                            feedback.pushInfo('{} ({:.1f} MB)'.format(nome, tamanho/1024**2))
+            finally:
+                self.conexoes.fechar()
+            conn.commit()
+        conn.close()
+        return resultado
+
+    def evict(self, manter=()):
+        # Remove os tiles menos usados recentemente até o cache caber em max_bytes
+        manter = set(manter)
+        conn = self._abrir()
+        linhas = conn.execute('SELECT url, path, size FROM tiles ORDER BY atime ASC').fetchall()
+        total = sum(linha[2] for linha in linhas)
+        for url, caminho, tamanho in linhas:
+            if total <= self.max_bytes:
+                break
+            if url in manter:
+                continue
+            conn.execute('DELETE FROM tiles WHERE url = ?', (url,))
+            # Outro URL pode apontar para o mesmo conteúdo
+            if not conn.execute('SELECT 1 FROM tiles WHERE path = ?', (caminho,)).fetchone():
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+                # A pasta do objeto é compartilhada por tiles de mesmo conteúdo e nomes diferentes
+                try:
+                    os.rmdir(os.path.dirname(caminho))
+                except OSError:
+                    pass
+            total -= tamanho
+        conn.commit()
+        conn.close()
+        return total
+
@@ -216,6 +216,7 @@ def String2CoordList (txt):
 
 
 # Conversão de coordenadas geodésicas para geocêntricas
+# (aceita escalares ou arrays NumPy com todos os vértices)
 def geod2geoc(lon, lat, h, a, f):
     lon = radians(lon)
     lat = radians(lat)
@@ -228,6 +229,7 @@ def geod2geoc(lon, lat, h, a, f):
 
 
 # Conversão de coordenadas geocêntricas para geodésicas
+# (aceita escalares ou arrays NumPy com todos os vértices)
 def geoc2geod(X, Y, Z, a, f):
     b = a*(1-f)
     e2 = f*(2-f) # primeira excentricidade
@@ -245,50 +247,38 @@ def geoc2geod(X, Y, Z, a, f):
 
 
 # Conversão de Coordenadas Geocêntrica para Topocêntricas
+# Produto da matriz de rotação escrito por componentes, valendo para escalares ou arrays NumPy:
+#     | E |   | -sen(lon)            cos(lon)           0        |   | X - Xo |
+#     | N | = | -sen(lat)cos(lon)   -sen(lat)sen(lon)   cos(lat) | * | Y - Yo | + Fo
+#     | U |   |  cos(lat)cos(lon)    cos(lat)sen(lon)   sen(lat) |   | Z - Zo |
 def geoc2enu(X, Y, Z, lon0, lat0, Xo, Yo, Zo, Fo=None):
     lon = radians(lon0)
     lat = radians(lat0)
 
     if Fo is None:
         Fo = array([[15e4], [25e4], [0]]) # False E and N
+    Fo = np.ravel(Fo)
 
-    M = array(
-    [
-    [  -sin(lon),                     cos(lon),                 0 ],
-    [  -sin(lat)*cos(lon),   -sin(lat)*sin(lon),          cos(lat)],
-    [   cos(lat)*cos(lon),    cos(lat)*sin(lon),          sin(lat)]
-    ]
-    )
-
-    T = array(
-    [[X - Xo], [Y-Yo], [Z-Zo]]
-    )
-
-    R = M@T + Fo
-    return (R[0,0], R[1,0], R[2,0])
+    dX, dY, dZ = X - Xo, Y - Yo, Z - Zo
+    E = -sin(lon)*dX + cos(lon)*dY + Fo[0]
+    N = -sin(lat)*cos(lon)*dX - sin(lat)*sin(lon)*dY + cos(lat)*dZ + Fo[1]
+    U = cos(lat)*cos(lon)*dX + cos(lat)*sin(lon)*dY + sin(lat)*dZ + Fo[2]
+    return (E, N, U)
 
 
 # Conversão de Coordenadas Topocêntricas para Geocêntrica
+# (transposta da rotação de geoc2enu; escalares ou arrays NumPy)
 def enu2geoc(E, N, U, lon0, lat0, Xo, Yo, Zo):
     lon = radians(lon0)
     lat = radians(lat0)
 
-    Fo = array([[15e4],[25e4],[0]]) # False E and N
-
-    M = array(
-    [
-    [  -sin(lon),     -sin(lat)*cos(lon),          cos(lat)*cos(lon)],
-    [  cos(lon),      -sin(lat)*sin(lon),          cos(lat)*sin(lon)],
-    [   0        ,              cos(lat),                       sin(lat)     ]
-    ]
-    )
-
-    T = array(
-    [[E], [N], [U]]
-    )
+    Fo = array([15e4, 25e4, 0]) # False E and N
 
-    R = M@(T-Fo) + [[Xo], [Yo], [Zo]]
-    return (R[0,0], R[1,0], R[2,0])
+    dE, dN, dU = E - Fo[0], N - Fo[1], U - Fo[2]
+    X = -sin(lon)*dE - sin(lat)*cos(lon)*dN + cos(lat)*cos(lon)*dU + Xo
+    Y = cos(lon)*dE - sin(lat)*sin(lon)*dN + cos(lat)*sin(lon)*dU + Yo
+    Z = cos(lat)*dN + sin(lat)*dU + Zo
+    return (X, Y, Z)
 
 
 # Transformar distancia em metros para graus
@@ -356,6 +346,17 @@ def str_decimal_to_datetime(dt_str):
     return base + timedelta(seconds=sec, microseconds=micro)
 
 
+def str_decimal_to_seconds(lista):
+    """
+    Converte uma lista de 'YYYY-MM-DD HH:MM:SS.sss' para um array
+    de segundos desde 1970-01-01, com o mesmo tratamento de overflow.
+    """
+    partes = np.char.split(np.char.strip(np.asarray(lista, dtype=str)))
+    datas = np.array([p[0] for p in partes], dtype='datetime64[D]')
+    hms = np.array([p[1].split(':') for p in partes], dtype=float).reshape(-1, 3)
+    return datas.astype('int64')*86400. + hms[:,0]*3600 + hms[:,1]*60 + hms[:,2]
+
+
 # Hora GPS
 def gpsdate(Y, M, DoM, Hr, Mn, Sc):
     '''
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Leandro França'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026, Leandro França'
+
+# Busca de vizinhos mais próximos em 2D (k vizinhos e raio)
+# Usa o cKDTree do SciPy, quando disponível, ou uma grade regular em NumPy
+
+import math
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+class IndiceVizinhos:
+    '''
+    Índice espacial de pontos (X, Y) para consultas dos k vizinhos mais próximos e por raio.
+    Os índices retornados referem-se à posição dos pontos nos arrays originais.
+    '''
+    def __init__(self, X, Y, usar_scipy=True):
+        self.X = np.asarray(X, dtype=float)
+        self.Y = np.asarray(Y, dtype=float)
+        self.n = len(self.X)
+        self.arvore = None
+        if usar_scipy and cKDTree is not None and self.n:
+            self.arvore = cKDTree(np.column_stack((self.X, self.Y)))
+        elif self.n:
+            self._grade()
+
+    def _grade(self):
+        # Grade com cerca de 2 pontos por célula
+        self.x0, self.y0 = self.X.min(), self.Y.min()
+        largura = max(self.X.max() - self.x0, self.Y.max() - self.y0)
+        self.h = largura/math.sqrt(self.n/2) if largura > 0 else 1.0
+        self.nx = int((self.X.max() - self.x0)//self.h) + 1
+        self.ny = int((self.Y.max() - self.y0)//self.h) + 1
+        chaves = ((self.X - self.x0)//self.h).astype(np.int64)*self.ny + ((self.Y - self.y0)//self.h).astype(np.int64)
+        self.ordem = np.argsort(chaves, kind='stable')
+        self.chaves = chaves[self.ordem]
+
+    def _celulas(self, x, y, r):
+        # Índices dos pontos nas células a até r células da célula de (x, y)
+        cx = int(math.floor((x - self.x0)/self.h))
+        cy = int(math.floor((y - self.y0)/self.h))
+        y_ini, y_fim = max(cy - r, 0), min(cy + r, self.ny - 1)
+        if y_ini > y_fim:
+            return self.ordem[:0]
+        partes = []
+        for ix in range(max(cx - r, 0), min(cx + r, self.nx - 1) + 1):
+            ini = np.searchsorted(self.chaves, ix*self.ny + y_ini, 'left')
+            fim = np.searchsorted(self.chaves, ix*self.ny + y_fim, 'right')
+            if fim > ini:
+                partes += [self.ordem[ini:fim]]
+        return np.concatenate(partes) if partes else self.ordem[:0]
+
+    def _distancias(self, x, y, ind):
+        return np.hypot(self.X[ind] - x, self.Y[ind] - y)
+
+    def knn(self, x, y, k, dmax=np.inf):
+        '''
+        k vizinhos mais próximos de cada ponto (x, y), limitados à distância dmax (inclusive).
+        Retorna (dist, ind), arrays (m, k) ordenados pela distância; posições sem vizinho
+        têm dist = inf e ind = n.
+        '''
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        dist = np.full((len(x), k), np.inf)
+        ind = np.full((len(x), k), self.n, dtype=np.int64)
+        if not self.n or k < 1:
+            return dist, ind
+        if self.arvore is not None:
+            limite = np.nextafter(dmax, np.inf) if np.isfinite(dmax) else np.inf
+            d, i = self.arvore.query(np.column_stack((x, y)), k=k, distance_upper_bound=limite)
+            d, i = d.reshape(len(x), k), i.reshape(len(x), k)
+            fora = d > dmax
+            d[fora], i[fora] = np.inf, self.n
+            return d, i
+        r_max = np.inf if not np.isfinite(dmax) else int(math.ceil(dmax/self.h))
+        for p in range(len(x)):
+            # Raio (em células) que alcança toda a grade a partir da célula do ponto
+            cx = int(math.floor((x[p] - self.x0)/self.h))
+            cy = int(math.floor((y[p] - self.y0)/self.h))
+            r_lim = min(r_max, max(abs(cx), abs(cx - self.nx + 1), abs(cy), abs(cy - self.ny + 1)))
+            r = 0
+            while True:
+                cand = self._celulas(x[p], y[p], r)
+                d = self._distancias(x[p], y[p], cand)
+                if len(cand) >= k:
+                    sel = np.argsort(d, kind='stable')[:k]
+                    if r >= math.ceil(d[sel[-1]]/self.h) or r >= r_lim:
+                        break
+                elif r >= r_lim:
+                    sel = np.argsort(d, kind='stable')
+                    break
+                r += 1
+            ok = d[sel] <= dmax
+            sel = sel[ok]
+            dist[p, :len(sel)] = d[sel]
+            ind[p, :len(sel)] = cand[sel]
+        return dist, ind
+
+    def raio(self, x, y, r):
+        '''
+        Vizinhos de cada ponto (x, y) a até a distância r (inclusive).
+        Retorna uma lista de arrays de índices ordenados pela distância.
+        '''
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        if not self.n:
+            return [np.zeros(0, dtype=np.int64) for p in range(len(x))]
+        if self.arvore is not None:
+            listas = self.arvore.query_ball_point(np.column_stack((x, y)), r)
+        else:
+            celulas = int(math.ceil(r/self.h))
+            listas = []
+            for p in range(len(x)):
+                cand = self._celulas(x[p], y[p], celulas)
+                listas += [cand[self._distancias(x[p], y[p], cand) <= r]]
+        resultado = []
+        for p, lista in enumerate(listas):
+            lista = np.asarray(lista, dtype=np.int64)
+            resultado += [lista[np.argsort(self._distancias(x[p], y[p], lista), kind='stable')]]
+        return resultado
@@ -27,6 +27,22 @@ def declination(*args, **kargs):
     mag = __singleton__.GeoMag(*args, **kargs)
     return mag.dec
 
+def magnetic_field(*args, **kargs):
+    """Calculate the magnetic field for arrays of points in one call
+    dlat = latitudes in degrees
+    dlon = longitudes in degrees
+    h = altitudes in feet, default=0
+    time = date, decimal year or a sequence of them, default=today
+    Returns an object with arrays dec, dip (inclination), ti (total intensity), bh, bx, by, bz and gv.
+    """
+    return __singleton__.GeoMagArray(*args, **kargs)
+
+def declinations(*args, **kargs):
+    """Calculate magnetic declinations in degrees for arrays of points.
+    The parameters are the same as magnetic_field.
+    """
+    return magnetic_field(*args, **kargs).dec
+
 def mag_heading(hdg, *args, **kargs):
     """Calculates the magnetic heading from a true heading.
     hdg = true heading in degrees
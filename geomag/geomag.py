@@ -7,183 +7,174 @@
 #
 # Suggestions for improvements are appreciated.
 
-import math, os, unittest
+import math, os, unittest, threading
 from datetime import date
+import numpy as np
+
+class RetObj:
+    pass
+
+def decimal_year(time):
+    """Date, decimal year or sequence of them as an array of decimal years"""
+    if isinstance(time, date):
+        return np.array([time.year+((time - date(time.year,1,1)).days/365.0)])
+    if np.ndim(time) == 0:
+        return np.array([float(time)])
+    return np.array([t.year+((t - date(t.year,1,1)).days/365.0) if isinstance(t, date) else float(t) for t in time])
 
 class GeoMag:
 
     def GeoMag(self, dlat, dlon, h=0, time=date.today()): # latitude (decimal degrees), longitude (decimal degrees), altitude (feet), date
-        #time = date('Y') + date('z')/365
-        time = time.year+((time - date(time.year,1,1)).days/365.0)
-        alt = h/3280.8399
-
-        otime = oalt = olat = olon = -1000.0
-
-        dt = time - self.epoch
-        glat = dlat
-        glon = dlon
-        rlat = math.radians(glat)
-        rlon = math.radians(glon)
-        srlon = math.sin(rlon)
-        srlat = math.sin(rlat)
-        crlon = math.cos(rlon)
-        crlat = math.cos(rlat)
+        # Scalar path: evaluated by the batch routine, with no state kept on the instance (thread-safe)
+        res = self.GeoMagArray(dlat, dlon, h, time)
+        retobj = RetObj()
+        for name in ('dec', 'dip', 'ti', 'bh', 'bx', 'by', 'bz', 'gv'):
+            setattr(retobj, name, float(getattr(res, name)[0]))
+        retobj.lat = dlat
+        retobj.lon = dlon
+        retobj.alt = h
+        retobj.time = float(res.time[0])
+        return retobj
+
+    def GeoMagArray(self, dlat, dlon, h=0, time=date.today(), block=65536):
+        """Magnetic field for arrays of points.
+        dlat, dlon = latitudes and longitudes in decimal degrees
+        h = altitudes in feet
+        time = date, decimal year, or a sequence of them (one per point)
+        Returns an object with arrays dec, dip, ti, bh, bx, by, bz, gv, lat, lon, alt and time.
+        """
+        glat, glon, h, time = np.broadcast_arrays(np.atleast_1d(np.asarray(dlat, dtype=float)),
+                                                  np.atleast_1d(np.asarray(dlon, dtype=float)),
+                                                  np.atleast_1d(np.asarray(h, dtype=float)),
+                                                  decimal_year(time))
+        retobj = RetObj()
+        names = ('dec', 'dip', 'ti', 'bh', 'bx', 'by', 'bz', 'gv')
+        for name in names:
+            setattr(retobj, name, np.empty(glat.shape))
+        # Blocks of points keep the Legendre work arrays bounded in memory
+        for ini in range(0, len(glat), block):
+            part = slice(ini, ini + block)
+            values = self._field(glat[part], glon[part], h[part]/3280.8399, time[part])
+            for name, value in zip(names, values):
+                getattr(retobj, name)[part] = value
+        retobj.lat = glat
+        retobj.lon = glon
+        retobj.alt = h
+        retobj.time = time
+        return retobj
+
+    def _coefficients(self, time):
+        # Time adjusted Gauss coefficients, cached per epoch
+        with self._lock:
+            tc = self._tc_cache.get(time)
+            if tc is None:
+                tc = self._c + (time - self.epoch)*self._cd
+                if len(self._tc_cache) >= 16:
+                    self._tc_cache.pop(next(iter(self._tc_cache)))
+                self._tc_cache[time] = tc
+        return tc
+
+    def _field(self, glat, glon, alt, time):
+        maxord = self.maxord
+        rlat = np.radians(glat)
+        rlon = np.radians(glon)
+        srlat = np.sin(rlat)
+        crlat = np.cos(rlat)
         srlat2 = srlat*srlat
         crlat2 = crlat*crlat
-        self.sp[1] = srlon
-        self.cp[1] = crlon
+
+        # Time adjusted coefficients: one set for a single epoch, or per point
+        epochs = np.unique(time)
+        if len(epochs) == 1:
+            tc = self._coefficients(float(epochs[0]))
+            coef = lambda i, j: tc[i][j]
+        else:
+            dt = time - self.epoch
+            coef = lambda i, j: self._c[i][j] + dt*self._cd[i][j]
+
+        sp = [np.zeros_like(rlon), np.sin(rlon)]
+        cp = [np.ones_like(rlon), np.cos(rlon)]
+        for m in range(2, maxord+1):
+            sp += [sp[1]*cp[m-1] + cp[1]*sp[m-1]]
+            cp += [cp[1]*cp[m-1] - sp[1]*sp[m-1]]
 
         #/* CONVERT FROM GEODETIC COORDS. TO SPHERICAL COORDS. */
-        if (alt != oalt or glat != olat):
-            q = math.sqrt(self.a2-self.c2*srlat2)
-            q1 = alt*q
-            q2 = ((q1+self.a2)/(q1+self.b2))*((q1+self.a2)/(q1+self.b2))
-            ct = srlat/math.sqrt(q2*crlat2+srlat2)
-            st = math.sqrt(1.0-(ct*ct))
-            r2 = (alt*alt)+2.0*q1+(self.a4-self.c4*srlat2)/(q*q)
-            r = math.sqrt(r2)
-            d = math.sqrt(self.a2*crlat2+self.b2*srlat2)
-            ca = (alt+d)/r
-            sa = self.c2*crlat*srlat/(r*d)
-
-        if (glon != olon):
-            for m in range(2,self.maxord+1):
-                self.sp[m] = self.sp[1]*self.cp[m-1]+self.cp[1]*self.sp[m-1]
-                self.cp[m] = self.cp[1]*self.cp[m-1]-self.sp[1]*self.sp[m-1]
+        q = np.sqrt(self.a2 - self.c2*srlat2)
+        q1 = alt*q
+        q2 = ((q1 + self.a2)/(q1 + self.b2))*((q1 + self.a2)/(q1 + self.b2))
+        ct = srlat/np.sqrt(q2*crlat2 + srlat2)
+        st = np.sqrt(1.0 - (ct*ct))
+        r2 = (alt*alt) + 2.0*q1 + (self.a4 - self.c4*srlat2)/(q*q)
+        r = np.sqrt(r2)
+        d = np.sqrt(self.a2*crlat2 + self.b2*srlat2)
+        ca = (alt + d)/r
+        sa = self.c2*crlat*srlat/(r*d)
+
+        # Legendre polynomials and derivatives, p[m][n] (zero where m > n)
+        zero = np.zeros_like(rlat)
+        p = [[zero]*(maxord+1) for m in range(maxord+1)]
+        dp = [[zero]*(maxord+1) for m in range(maxord+1)]
+        p[0][0] = np.ones_like(rlat)
+        pp = [np.ones_like(rlat)]
 
         aor = self.re/r
         ar = aor*aor
-        br = bt = bp = bpp = 0.0
-        for n in range(1,self.maxord+1):
+        br = bt = bp = bpp = zero
+        for n in range(1, maxord+1):
             ar = ar*aor
+            for m in range(n+1):
+                if n == m:
+                    p[m][n] = st*p[m-1][n-1]
+                    dp[m][n] = st*dp[m-1][n-1] + ct*p[m-1][n-1]
+                elif n == 1 and m == 0:
+                    p[m][n] = ct*p[m][n-1]
+                    dp[m][n] = ct*dp[m][n-1] - st*p[m][n-1]
+                else:
+                    p[m][n] = ct*p[m][n-1] - self.k[m][n]*p[m][n-2]
+                    dp[m][n] = ct*dp[m][n-1] - st*p[m][n-1] - self.k[m][n]*dp[m][n-2]
 
-            #for (m=0,D3=1,D4=(n+m+D3)/D3;D4>0;D4--,m+=D3):
-            m=0
-            D3=1
-            #D4=(n+m+D3)/D3
-            D4=(n+m+1)
-            while D4>0:
-
-        # /*
-                # COMPUTE UNNORMALIZED ASSOCIATED LEGENDRE POLYNOMIALS
-                # AND DERIVATIVES VIA RECURSION RELATIONS
-        # */
-                if (alt != oalt or glat != olat):
-                    if (n == m):
-                        self.p[m][n] = st * self.p[m-1][n-1]
-                        self.dp[m][n] = st*self.dp[m-1][n-1]+ct*self.p[m-1][n-1]
-
-                    elif (n == 1 and m == 0):
-                        self.p[m][n] = ct*self.p[m][n-1]
-                        self.dp[m][n] = ct*self.dp[m][n-1]-st*self.p[m][n-1]
-
-                    elif (n > 1 and n != m):
-                        if (m > n-2):
-                            self.p[m][n-2] = 0
-                        if (m > n-2):
-                            self.dp[m][n-2] = 0.0
-                        self.p[m][n] = ct*self.p[m][n-1]-self.k[m][n]*self.p[m][n-2]
-                        self.dp[m][n] = ct*self.dp[m][n-1] - st*self.p[m][n-1]-self.k[m][n]*self.dp[m][n-2]
-
-        # /*
-                # TIME ADJUST THE GAUSS COEFFICIENTS
-        # */
-                if (time != otime):
-                    self.tc[m][n] = self.c[m][n]+dt*self.cd[m][n]
-                    if (m != 0):
-                        self.tc[n][m-1] = self.c[n][m-1]+dt*self.cd[n][m-1]
-
-        # /*
                 # ACCUMULATE TERMS OF THE SPHERICAL HARMONIC EXPANSIONS
-        # */
-                par = ar*self.p[m][n]
-
-                if (m == 0):
-                    temp1 = self.tc[m][n]*self.cp[m]
-                    temp2 = self.tc[m][n]*self.sp[m]
+                par = ar*p[m][n]
+                if m == 0:
+                    temp1 = coef(m, n)*cp[m]
+                    temp2 = coef(m, n)*sp[m]
                 else:
-                    temp1 = self.tc[m][n]*self.cp[m]+self.tc[n][m-1]*self.sp[m]
-                    temp2 = self.tc[m][n]*self.sp[m]-self.tc[n][m-1]*self.cp[m]
-
-                bt = bt-ar*temp1*self.dp[m][n]
-                bp = bp + (self.fm[m] * temp2 * par)
-                br = br + (self.fn[n] * temp1 * par)
-        # /*
-                    # SPECIAL CASE:  NORTH/SOUTH GEOGRAPHIC POLES
-        # */
-                if (st == 0.0 and m == 1):
-                    if (n == 1):
-                        self.pp[n] = self.pp[n-1]
+                    temp1 = coef(m, n)*cp[m] + coef(n, m-1)*sp[m]
+                    temp2 = coef(m, n)*sp[m] - coef(n, m-1)*cp[m]
+                bt = bt - ar*temp1*dp[m][n]
+                bp = bp + (self.fm[m]*temp2*par)
+                br = br + (self.fn[n]*temp1*par)
+
+                # SPECIAL CASE:  NORTH/SOUTH GEOGRAPHIC POLES
+                if m == 1:
+                    if n == 1:
+                        pp += [pp[n-1]]
                     else:
-                        self.pp[n] = ct*self.pp[n-1]-self.k[m][n]*self.pp[n-2]
-                    parp = ar*self.pp[n]
-                    bpp = bpp + (self.fm[m]*temp2*parp)
+                        pp += [ct*pp[n-1] - self.k[m][n]*pp[n-2]]
+                    bpp = bpp + (self.fm[m]*temp2*ar*pp[n])
 
-                D4=D4-1
-                m=m+1
+        pole = st == 0.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bp = np.where(pole, bpp, bp/np.where(pole, 1.0, st))
 
-        if (st == 0.0):
-            bp = bpp
-        else:
-            bp = bp/st
-        # /*
-            # ROTATE MAGNETIC VECTOR COMPONENTS FROM SPHERICAL TO
-            # GEODETIC COORDINATES
-        # */
-        bx = -bt*ca-br*sa
+        # ROTATE MAGNETIC VECTOR COMPONENTS FROM SPHERICAL TO GEODETIC COORDINATES
+        bx = -bt*ca - br*sa
         by = bp
-        bz = bt*sa-br*ca
-        # /*
-            # COMPUTE DECLINATION (DEC), INCLINATION (DIP) AND
-            # TOTAL INTENSITY (TI)
-        # */
-        bh = math.sqrt((bx*bx)+(by*by))
-        ti = math.sqrt((bh*bh)+(bz*bz))
-        dec = math.degrees(math.atan2(by,bx))
-        dip = math.degrees(math.atan2(bz,bh))
-        # /*
-            # COMPUTE MAGNETIC GRID VARIATION IF THE CURRENT
-            # GEODETIC POSITION IS IN THE ARCTIC OR ANTARCTIC
-            # (I.E. GLAT > +55 DEGREES OR GLAT < -55 DEGREES)
-
-            # OTHERWISE, SET MAGNETIC GRID VARIATION TO -999.0
-        # */
-        gv = -999.0
-        if (math.fabs(glat) >= 55.):
-            if (glat > 0.0 and glon >= 0.0):
-                gv = dec-glon
-            if (glat > 0.0 and glon < 0.0):
-                gv = dec+math.fabs(glon);
-            if (glat < 0.0 and glon >= 0.0):
-                gv = dec+glon
-            if (glat < 0.0 and glon < 0.0):
-                gv = dec-math.fabs(glon)
-            if (gv > +180.0):
-                gv = gv - 360.0
-            if (gv < -180.0):
-                gv = gv + 360.0
-
-        otime = time
-        oalt = alt
-        olat = glat
-        olon = glon
-
-        class RetObj:
-            pass
-        retobj = RetObj()
-        retobj.dec = dec
-        retobj.dip = dip
-        retobj.ti = ti
-        retobj.bh = bh
-        retobj.bx = bx
-        retobj.by = by
-        retobj.bz = bz
-        retobj.lat = dlat
-        retobj.lon = dlon
-        retobj.alt = h
-        retobj.time = time
+        bz = bt*sa - br*ca
 
-        return retobj
+        # COMPUTE DECLINATION (DEC), INCLINATION (DIP) AND TOTAL INTENSITY (TI)
+        bh = np.sqrt((bx*bx) + (by*by))
+        ti = np.sqrt((bh*bh) + (bz*bz))
+        dec = np.degrees(np.arctan2(by, bx))
+        dip = np.degrees(np.arctan2(bz, bh))
+
+        # MAGNETIC GRID VARIATION IN THE ARCTIC OR ANTARCTIC (|GLAT| >= 55), OTHERWISE -999.0
+        gv = np.where(glat > 0.0, dec - glon, dec + glon)
+        gv = np.where(gv > 180.0, gv - 360.0, gv)
+        gv = np.where(gv < -180.0, gv + 360.0, gv)
+        gv = np.where(np.fabs(glat) >= 55., gv, -999.0)
+
+        return dec, dip, ti, bh, bx, by, bz, gv
 
     def __init__(self, wmm_filename=None):
         if not wmm_filename:
@@ -207,15 +198,6 @@ class GeoMag:
 
         z = [0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0]
         self.maxord = self.maxdeg = 12
-        self.tc = [z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13]]
-        self.sp = z[0:14]
-        self.cp = z[0:14]
-        self.cp[0] = 1.0
-        self.pp = z[0:13]
-        self.pp[0] = 1.0
-        self.p = [z[0:14],z[0:14],z[0:14],z[0:14],z[0:14],z[0:14],z[0:14],z[0:14],z[0:14],z[0:14],z[0:14],z[0:14],z[0:14],z[0:14]]
-        self.p[0][0] = 1.0
-        self.dp = [z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13],z[0:13]]
         self.a = 6378.137
         self.b = 6356.7523142
         self.re = 6371.2
@@ -270,6 +252,11 @@ class GeoMag:
                 D2=D2-1
                 m=m+D1
 
+        self._c = np.array(self.c)
+        self._cd = np.array(self.cd)
+        self._tc_cache = {}
+        self._lock = threading.Lock()
+
 class GeoMagTest(unittest.TestCase):
 
     d1=date(2015,1,1)
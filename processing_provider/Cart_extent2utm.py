@@ -281,13 +281,24 @@ class Extent2UTMGrid(QgsProcessingAlgorithm):
 
         Percent = 100.0/(len(LON)*len(LAT))
         current = 0
-        for lat in LAT[::-1]:
+
+        # Declinação magnética no centro de todas as folhas, calculada de uma só vez
+        if mag_decl:
+            data = date.today()
+            LAT0 = np.where(LAT >= 0, np.trunc(LAT/d_lat)*d_lat, np.trunc(LAT/d_lat)*d_lat - d_lat)
+            LON0 = np.where(LON >= 0, np.trunc(LON/d_lon)*d_lon, np.trunc(LON/d_lon)*d_lon - d_lon)
+            centro_lon, centro_lat = np.meshgrid(LON0 + d_lon/2, LAT0 + d_lat/2)
+            DM = geomag.declinations(centro_lat.ravel(), centro_lon.ravel(), h=0, time = data).reshape(centro_lat.shape)
+            var_DM = geomag.declinations(centro_lat.ravel(), centro_lon.ravel(), h=0, time = date(data.year + 1 , data.month, data.day)).reshape(centro_lat.shape) - DM
+
+        for i in range(len(LAT))[::-1]:
+            lat = LAT[i]
             if lat >=0:
                 lat0 = math.modf(lat/d_lat)[1]*d_lat
             else:
                 lat0 = math.modf(lat/d_lat)[1]*d_lat - d_lat
             
-            for lon in LON:
+            for j, lon in enumerate(LON):
                 if lon>=0:
                     lon0 = math.modf(lon/d_lon)[1]*d_lon
                 else:
@@ -339,11 +350,8 @@ class Extent2UTMGrid(QgsProcessingAlgorithm):
                     feat[self.tr('zone_hemisphere', 'fuso_hemisfério')] = str(zone)+hemisf
 
                 if mag_decl:
-                    data = date.today()
-                    DM = geomag.declination(centroide.y(), centroide.x(), h=0, time = data)
-                    var_DM = geomag.declination(centroide.y(), centroide.x(), h=0, time = date(data.year + 1 , data.month, data.day)) - DM
-                    feat[self.tr('MD', 'DM')] = float(DM)
-                    feat[self.tr('VAR_MD', 'var_DM')] = float(var_DM)
+                    feat[self.tr('MD', 'DM')] = float(DM[i, j])
+                    feat[self.tr('VAR_MD', 'var_DM')] = float(var_DM[i, j])
                     feat[self.tr('Epoch', 'Época')] = '{}-{:02d}-{:02d}'.format(data.year , data.month, data.day)
 
                 # Coordinate Transformations (if needed)
@@ -29,13 +29,14 @@ from qgis.core import (Qgis,
                        QgsProcessingException,
                        QgsProcessingAlgorithm,
                        QgsFeatureRequest,
+                       QgsSpatialIndex,
                        QgsProcessingUtils,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterFeatureSink)
 import os
 from lftools.geocapt.imgs import *
 from lftools.translations.translate import translate
-from lftools.geocapt.cartography import LabelConf, SymbolSimplePoint
+from lftools.geocapt.cartography import LabelConf, SymbolSimplePoint, IndiceCoordenadas
 from qgis.PyQt.QtGui import QIcon
 
 class ValidateTopology(QgsProcessingAlgorithm):
@@ -174,16 +175,22 @@ class ValidateTopology(QgsProcessingAlgorithm):
         feedback.pushInfo(self.tr('Validating topology of geometries...', 'Validando topologia das geometrias...' ))
         cont = 0
 
-        def validarGeometria(layer, nome_camada):
+        # Cada camada é lida uma única vez
+        def carregar(layer):
+            return [(feat.id(), feat.geometry()) for feat in layer.getFeatures()]
+        feicoes_vertices = carregar(vertices)
+        feicoes_limites = carregar(limites)
+        feicoes_area = carregar(area)
+
+        def validarGeometria(feicoes, nome_camada):
             cont_erros_estrutura = 0
-            for feat in layer.getFeatures():
-                geom = feat.geometry()
+            for feat_id, geom in feicoes:
 
                 if geom is None:
                     erro = self.tr(
                         'Null geometry in feature ID {} of layer "{}"!',
                         'Geometria nula na feição de ID {} da camada "{}"!'
-                    ).format(feat.id(), nome_camada)
+                    ).format(feat_id, nome_camada)
                     cont_erros_estrutura += 1
                     feedback.reportError(erro)
 
@@ -191,7 +198,7 @@ class ValidateTopology(QgsProcessingAlgorithm):
                     erro = self.tr(
                         'Empty geometry in feature ID {} of layer "{}"!',
                         'Geometria vazia na feição de ID {} da camada "{}"!'
-                    ).format(feat.id(), nome_camada)
+                    ).format(feat_id, nome_camada)
                     cont_erros_estrutura += 1
                     feedback.reportError(erro)
 
@@ -205,14 +212,14 @@ class ValidateTopology(QgsProcessingAlgorithm):
                     erro = self.tr(
                         'Invalid geometry in feature ID {} of layer "{}"!',
                         'Geometria inválida na feição de ID {} da camada "{}"!'
-                    ).format(feat.id(), nome_camada)
+                    ).format(feat_id, nome_camada)
                     cont_erros_estrutura += 1
                     feedback.reportError(erro)
             return cont_erros_estrutura
 
-        cont_erros_estrutura = validarGeometria(vertices, self.tr('Vertices (points)', 'Vértices (pontos)'))
-        cont_erros_estrutura+= validarGeometria(limites, self.tr('Limits (lines)', 'Limites (linhas)'))
-        cont_erros_estrutura+= validarGeometria(area, self.tr('Area (polygon)', 'Área (polígono)'))
+        cont_erros_estrutura = validarGeometria(feicoes_vertices, self.tr('Vertices (points)', 'Vértices (pontos)'))
+        cont_erros_estrutura+= validarGeometria(feicoes_limites, self.tr('Limits (lines)', 'Limites (linhas)'))
+        cont_erros_estrutura+= validarGeometria(feicoes_area, self.tr('Area (polygon)', 'Área (polígono)'))
 
         # Validar limites geográficos
         def validarLimitesGeograficos(layer, nome_camada):
@@ -235,106 +242,90 @@ class ValidateTopology(QgsProcessingAlgorithm):
 
         # Validações das geometrias
 
+        # Índices de coordenadas dos vértices (pontos) e dos vértices dos polígonos
+        def aneisPoligono(geom):
+            if geom.isMultipart():
+                pols = geom.asMultiPolygon()
+            else:
+                pols = [geom.asPolygon()]
+            return [anel for aneis in pols for anel in aneis]
+
+        indice_vertices = IndiceCoordenadas()
+        for feat_id, geom in feicoes_vertices:
+            if geom:
+                vert = geom.asPoint()
+                indice_vertices.adicionar(vert.x(), vert.y())
+
+        indice_area = IndiceCoordenadas()
+        for feat_id, geom in feicoes_area:
+            if geom:
+                for anel in aneisPoligono(geom):
+                    for pnt in anel:
+                        indice_area.adicionar(pnt.x(), pnt.y())
+
         feedback.pushInfo(self.tr('Checking if each vertex of the Limit layer (line) has the corresponding one of the Vertex layer (point)...', 'Verificando se cada vértice da camada Limite (linha) tem o correspondente da camada Vértice (ponto)...'))
-        for feat1 in limites.getFeatures():
-            geom1 = feat1.geometry()
+        for feat1_id, geom1 in feicoes_limites:
             if geom1:
                 if geom1.isMultipart():
-                    linha = feat1.geometry().asMultiPolyline()[0]
+                    linha = geom1.asMultiPolyline()[0]
                 else:
-                    linha = feat1.geometry().asPolyline()
+                    linha = geom1.asPolyline()
                 for pnt in linha:
-                    corresp = False
-                    for feat2 in vertices.getFeatures():
-                        geom2 = feat2.geometry()
-                        if geom2:
-                            vert = geom2.asPoint()
-                            if vert == pnt:
-                                corresp = True
-                                continue
-                    if not corresp:
+                    if not indice_vertices.contem(pnt.x(), pnt.y()):
                         cont += 1
                         X, Y = pnt.x(), pnt.y()
                         erro = self.tr('Point of the "line" layer has no correspondent in the "point" layer!',
                                     'Ponto de camada "linha" não possui correspondente na camada "ponto"!')
                         fet = QgsFeature(Fields)
                         fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
-                        fet.setAttributes([cont, feat1.id(), erro])
+                        fet.setAttributes([cont, feat1_id, erro])
                         sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
 
         feedback.pushInfo(self.tr('Checking if each vertex of the Area layer (polygon) has the corresponding one of the Vertex layer (point)...', 'Verificando se cada vértice da camada Área (polígono) tem o correspondente da camada Vértice (ponto)...'))
-        for feat1 in area.getFeatures():
-            geom1 = feat1.geometry()
+        for feat1_id, geom1 in feicoes_area:
             if geom1:
-                if geom1.isMultipart():
-                    pols = geom1.asMultiPolygon()
-                else:
-                    pols = [geom1.asPolygon()]
-                for aneis in pols:
-                    for anel in aneis:
-                        for pnt in anel:
-                            corresp = False
-                            for feat2 in vertices.getFeatures():
-                                geom2 = feat2.geometry()
-                                if geom2:
-                                    vert = geom2.asPoint()
-                                    if vert == pnt:
-                                        corresp = True
-                                        continue
-                            if not corresp:
-                                cont += 1
-                                X, Y = pnt.x(), pnt.y()
-                                erro = self.tr('Point of the "area" layer has no correspondent in the "point" layer!',
-                                            'Ponto de camada "área" não possui correspondente na camada "ponto"!')
-                                fet = QgsFeature(Fields)
-                                fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
-                                fet.setAttributes([cont, feat1.id(), erro])
-                                sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
+                for anel in aneisPoligono(geom1):
+                    for pnt in anel:
+                        if not indice_vertices.contem(pnt.x(), pnt.y()):
+                            cont += 1
+                            X, Y = pnt.x(), pnt.y()
+                            erro = self.tr('Point of the "area" layer has no correspondent in the "point" layer!',
+                                        'Ponto de camada "área" não possui correspondente na camada "ponto"!')
+                            fet = QgsFeature(Fields)
+                            fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
+                            fet.setAttributes([cont, feat1_id, erro])
+                            sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
 
         feedback.pushInfo(self.tr('Checking if each vertex of the Vertex layer (point) has the corresponding one of the Area layer (polygon)...', 'Verificando se cada vértice da camada Vértice (ponto) tem o correspondente da camada Área (polígono)...'))
-        for feat1 in vertices.getFeatures():
-            geom1 = feat1.geometry()
+        for feat1_id, geom1 in feicoes_vertices:
             if geom1:
                 vert = geom1.asPoint()
-                corresp = False
-                for feat2 in area.getFeatures():
-                    geom2 = feat2.geometry()
-                    if geom2:
-                        if geom2.isMultipart():
-                            pols = geom2.asMultiPolygon()
-                        else:
-                            pols = [geom2.asPolygon()]
-                        for aneis in pols:
-                            for anel in aneis:
-                                for pnt in anel:
-                                    if vert == pnt:
-                                        corresp = True
-                                        break
-                            if corresp:
-                                break
-                if not corresp:
+                if not indice_area.contem(vert.x(), vert.y()):
                     cont += 1
                     X, Y = vert.x(), vert.y()
                     erro = self.tr('Point of the "point" layer has no correspondent in the "area" layer!',
                                 'Ponto da camada "ponto" não possui correspondente na camada "área"!')
                     fet = QgsFeature(Fields)
                     fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
-                    fet.setAttributes([cont, feat1.id(), erro])
+                    fet.setAttributes([cont, feat1_id, erro])
                     sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
 
         feedback.pushInfo(self.tr('Checking if each vertex of the Vertex layer (point) has the corresponding one of the limit layer (line)...', 'Verificando se cada vértice da camada Vértice (ponto) tem o correspondente da camada Limite (linha)...'))
-        for feat1 in vertices.getFeatures():
-            geom1 = feat1.geometry()
+        indice_limites = QgsSpatialIndex()
+        geoms_limites = {}
+        for feat_id, geom in feicoes_limites:
+            if geom:
+                indice_limites.addFeature(feat_id, geom.boundingBox())
+                geoms_limites[feat_id] = geom
+        for feat1_id, geom1 in feicoes_vertices:
             if geom1:
                 vert = geom1.asPoint()
                 geom1 = geom1.buffer(tolerancia,5)
                 corresp = False
-                for feat2 in limites.getFeatures():
-                    geom2 = feat2.geometry()
-                    if geom2:
-                        if geom2.intersects(geom1):
-                            corresp = True
-                            break
+                for feat2_id in indice_limites.intersects(geom1.boundingBox()):
+                    if geoms_limites[feat2_id].intersects(geom1):
+                        corresp = True
+                        break
                 if not corresp:
                     cont += 1
                     X, Y = vert.x(), vert.y()
@@ -342,13 +333,12 @@ class ValidateTopology(QgsProcessingAlgorithm):
                                 'Ponto de camada "ponto" não possui correspondente na camada "linha"!')
                     fet = QgsFeature(Fields)
                     fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
-                    fet.setAttributes([cont, feat1.id(), erro])
+                    fet.setAttributes([cont, feat1_id, erro])
                     sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
 
         feedback.pushInfo(self.tr('Checking for duplicate vertices inside the vertex (point) layer...', 'Verificando vértices duplicados dentro da camada vértice (ponto)...'))
         pontos = set()
-        for feat1 in vertices.getFeatures():
-            geom1 = feat1.geometry()
+        for feat1_id, geom1 in feicoes_vertices:
             if geom1:
                 vert = geom1.asPoint()
                 chave = (vert.x(), vert.y())
@@ -361,17 +351,16 @@ class ValidateTopology(QgsProcessingAlgorithm):
                                 'Vértice da camada "ponto" está duplicado!')
                     fet = QgsFeature(Fields)
                     fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
-                    fet.setAttributes([cont, feat1.id(), erro])
+                    fet.setAttributes([cont, feat1_id, erro])
                     sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
 
         feedback.pushInfo(self.tr('Checking for duplicate vertices inside the limit (line) layer...', 'Verificando vértices duplicados dentro da camada limite (linha)...'))
-        for feat1 in limites.getFeatures():
-            geom1 = feat1.geometry()
+        for feat1_id, geom1 in feicoes_limites:
             if geom1:
                 if geom1.isMultipart():
-                    linha = feat1.geometry().asMultiPolyline()[0]
+                    linha = geom1.asMultiPolyline()[0]
                 else:
-                    linha = feat1.geometry().asPolyline()
+                    linha = geom1.asPolyline()
                 pontos = set()
                 for pnt in linha:
                     chave = (pnt.x(), pnt.y())
@@ -385,39 +374,41 @@ class ValidateTopology(QgsProcessingAlgorithm):
                                         'Vértice da camada "linha" está duplicado!')
                             fet = QgsFeature(Fields)
                             fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
-                            fet.setAttributes([cont, feat1.id(), erro])
+                            fet.setAttributes([cont, feat1_id, erro])
                             sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
 
 
         feedback.pushInfo(self.tr('Checking for duplicate vertices inside the area (polygon) layer...', 'Verificando vértices duplicados dentro da camada área (polígono)...'))
-        for feat1 in area.getFeatures():
-            geom1 = feat1.geometry()
+        for feat1_id, geom1 in feicoes_area:
             if geom1:
-                if geom1.isMultipart():
-                    pols = geom1.asMultiPolygon()
-                else:
-                    pols = [geom1.asPolygon()]
-                for aneis in pols:
-                    for anel in aneis:
-                        pontos = set()
-                        for pnt in anel[:-1]:
-                            chave = (pnt.x(), pnt.y())
-                            if chave not in pontos:
-                                pontos.add(chave)
-                            else:
-                                cont += 1
-                                X, Y = pnt.x(), pnt.y()
-                                erro = self.tr('Vertex of the "area" layer is duplicated!',
-                                            'Vértice da camada "área" está duplicado!')
-                                fet = QgsFeature(Fields)
-                                fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
-                                fet.setAttributes([cont, feat1.id(), erro])
-                                sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
+                for anel in aneisPoligono(geom1):
+                    pontos = set()
+                    for pnt in anel[:-1]:
+                        chave = (pnt.x(), pnt.y())
+                        if chave not in pontos:
+                            pontos.add(chave)
+                        else:
+                            cont += 1
+                            X, Y = pnt.x(), pnt.y()
+                            erro = self.tr('Vertex of the "area" layer is duplicated!',
+                                        'Vértice da camada "área" está duplicado!')
+                            fet = QgsFeature(Fields)
+                            fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
+                            fet.setAttributes([cont, feat1_id, erro])
+                            sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
 
 
         feedback.pushInfo(self.tr('Checking line layer orientation...', 'Verificando orientação da camada linha...'))
-        for feat1 in limites.getFeatures():
-            geom1 =  feat1.geometry()
+        # Primeiro ponto de cada linha
+        indice_inicio = IndiceCoordenadas()
+        for feat_id, geom in feicoes_limites:
+            if geom:
+                if geom.isMultipart():
+                    primeiro_pnt = geom.asMultiPolyline()[0][0]
+                else:
+                    primeiro_pnt = geom.asPolyline()[0]
+                indice_inicio.adicionar(primeiro_pnt.x(), primeiro_pnt.y(), feat_id)
+        for feat1_id, geom1 in feicoes_limites:
             if geom1:
                 if geom1.isMultipart():
                     ultimo_pnt = geom1.asMultiPolyline()[0][-1]
@@ -425,17 +416,7 @@ class ValidateTopology(QgsProcessingAlgorithm):
                 else:
                     ultimo_pnt = geom1.asPolyline()[-1]
                     p0 = geom1.asPolyline()[0]
-                for feat2 in limites.getFeatures():
-                    if feat1.id() != feat2.id():
-                        geom2 = feat2.geometry()
-                        if geom2:
-                            if geom2.isMultipart():
-                                primeiro_pnt = geom2.asMultiPolyline()[0][0]
-                            else:
-                                primeiro_pnt = geom2.asPolyline()[0]
-                            if ultimo_pnt == primeiro_pnt:
-                                break
-                else:
+                if not [feat2_id for feat2_id in indice_inicio.buscar(ultimo_pnt.x(), ultimo_pnt.y()) if feat2_id != feat1_id]:
                     if ultimo_pnt != p0: # não for fechamento de anel linear
                         cont += 1
                         X, Y = ultimo_pnt.x(), ultimo_pnt.y()
@@ -443,14 +424,13 @@ class ValidateTopology(QgsProcessingAlgorithm):
                                     'Problema na orientação dos vértices da camada de linhas!')
                         fet = QgsFeature(Fields)
                         fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
-                        fet.setAttributes([cont, feat1.id(), erro])
+                        fet.setAttributes([cont, feat1_id, erro])
                         sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
 
         # Checar geometrias duplicadas para linhas
         feedback.pushInfo(self.tr('Checking for duplicate geometry line layer...', 'Verificando geometria duplicada na camada de linhas...'))
         geoms = set()
-        for feat1 in limites.getFeatures():
-            geom = feat1.geometry()
+        for feat1_id, geom in feicoes_limites:
             if geom:
                 wkt = geom.asWkt()
                 if wkt not in geoms:
@@ -459,18 +439,17 @@ class ValidateTopology(QgsProcessingAlgorithm):
                     cont += 1
                     pnt = geom.centroid().asPoint()
                     X, Y = pnt.x(), pnt.y()
-                    erro = self.tr('Duplicated line geometry in feature ID {}!'.format(feat1.id()),
-                                'Geometria linha duplicada na feição de ID {}!'.format(feat1.id()))
+                    erro = self.tr('Duplicated line geometry in feature ID {}!'.format(feat1_id),
+                                'Geometria linha duplicada na feição de ID {}!'.format(feat1_id))
                     fet = QgsFeature(Fields)
                     fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
-                    fet.setAttributes([cont, feat1.id(), erro])
+                    fet.setAttributes([cont, feat1_id, erro])
                     sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
 
         # Checar geometrias duplicadas para polígono
         feedback.pushInfo(self.tr('Checking for duplicate geometry polygon layer...', 'Verificando geometria duplicada na camada de polígonos...'))
         geoms = set()
-        for feat1 in area.getFeatures():
-            geom = feat1.geometry()
+        for feat1_id, geom in feicoes_area:
             if geom:
                 wkt = geom.asWkt()
                 if wkt not in geoms:
@@ -479,17 +458,16 @@ class ValidateTopology(QgsProcessingAlgorithm):
                     cont += 1
                     pnt = geom.centroid().asPoint()
                     X, Y = pnt.x(), pnt.y()
-                    erro = self.tr('Duplicated polygon geometry in feature ID {}!'.format(feat1.id()),
-                                'Geometria polígono duplicada na feição de ID {}!'.format(feat1.id()))
+                    erro = self.tr('Duplicated polygon geometry in feature ID {}!'.format(feat1_id),
+                                'Geometria polígono duplicada na feição de ID {}!'.format(feat1_id))
                     fet = QgsFeature(Fields)
                     fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
-                    fet.setAttributes([cont, feat1.id(), erro])
+                    fet.setAttributes([cont, feat1_id, erro])
                     sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
 
         # Verificar coordenada Z igual a Zero
         feedback.pushInfo(self.tr('Checking if any vertex has a dimension-Z equal to Zero...', 'Verificando se algum vértice tem cota Z igual a Zero...'))
-        for feat1 in vertices.getFeatures():
-            geom1 =  feat1.geometry()
+        for feat1_id, geom1 in feicoes_vertices:
             if geom1:
                 try:
                     z = float(geom1.constGet().z())
@@ -503,7 +481,7 @@ class ValidateTopology(QgsProcessingAlgorithm):
                                 'Altitude Z não preenchida corretamente!')
                     fet = QgsFeature(Fields)
                     fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(X,Y)))
-                    fet.setAttributes([cont, feat1.id(), erro])
+                    fet.setAttributes([cont, feat1_id, erro])
                     sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
 
         def avaliar_erros(cont):
@@ -40,8 +40,9 @@ from osgeo import osr, gdal_array, gdal #https://gdal.org/python/
 import numpy as np
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
-from lftools.geocapt.dip import Interpolar
+from lftools.geocapt.dip import InterpolarArray
 from lftools.geocapt.adjust import Ajust2D, ValidacaoVetores, transformGeom2D
+from concurrent.futures import ThreadPoolExecutor
 import os
 from qgis.PyQt.QtGui import QIcon
 
@@ -111,6 +112,7 @@ class GeorrefAdjust(QgsProcessingAlgorithm):
     COORDS = 'COORDS'
     HTML = 'HTML'
     CHECKCRS = 'CHECKCRS'
+    PARALLEL = 'PARALLEL'
 
     def initAlgorithm(self, config=None):
         # INPUT
@@ -165,6 +167,14 @@ class GeorrefAdjust(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.PARALLEL,
+                self.tr('Parallel processing', 'Processamento paralelo'),
+                defaultValue= False
+            )
+        )
+
         # OUTPUT
         self.addParameter(
             QgsProcessingParameterFileDestination(
@@ -255,6 +265,12 @@ class GeorrefAdjust(QgsProcessingAlgorithm):
             context
         )
 
+        Paralelo = self.parameterAsBool(
+            parameters,
+            self.PARALLEL,
+            context
+        )
+
         # Coordenas ajustadas de saida
         GeomType = Qgis.WkbType.Point
         Fields = QgsFields()
@@ -346,53 +362,86 @@ class GeorrefAdjust(QgsProcessingAlgorithm):
         resol_Y = abs(yres)
 
         # Criar Raster
-        Driver = gdal.GetDriverByName('GTiff').Create(Output, n_col, n_lin, n_bands, GDT)
+        Driver = gdal.GetDriverByName('GTiff').Create(Output, n_col, n_lin, n_bands, GDT, ['TILED=YES', 'BIGTIFF=IF_SAFER'])
         Driver.SetGeoTransform(geotransform)
         Driver.SetProjection(prj)
-
-        # Iniciar reamostragem
-        Percent = 100.0/(n_lin*n_bands)
-        current = 0
-
         for k in range(n_bands):
-            # Abrir banda 1 como array
-            feedback.pushInfo((self.tr('Opening band {} as array...', 'Abrindo banda {} como array...')).format(str(k+1)))
-            banda_antiga = image.GetRasterBand(k+1).ReadAsArray()
-            # Criando novo array
-            feedback.pushInfo((self.tr('Transforming new band {}...', 'Transformando nova banda {}...')).format(str(k+1)))
-            tipo = gdal_array.GDALTypeCodeToNumericTypeCode(GDT)
-            inteiro = True if GDT in (gdal.GDT_Byte,
-                                      gdal.GDT_UInt16,
-                                      gdal.GDT_Int16,
-                                      gdal.GDT_UInt32,
-                                      gdal.GDT_Int32) else False
-            banda_nova = np.ones((n_lin,n_col), dtype = tipo) * (int(valor_nulo) if inteiro else valor_nulo)
-            # Varrendo e preenchendo nova imagem
-            for lin in range(n_lin):
-                for col in range(n_col):
-                    X = origem[0] + resol_X*(col + 0.5)
-                    Y = origem[1] - resol_Y*(lin + 0.5)
-                    X_antigo, Y_antigo = CoordInvTransf(QgsPointXY(X,Y))
-                    Interpolado = Interpolar(X_antigo, Y_antigo,
-                                            banda_antiga,
-                                            origem_antiga,
-                                            xres_antiga,
-                                            yres_antiga,
-                                            reamostragem,
-                                            valor_nulo)
-                    if Interpolado != valor_nulo:
-                        banda_nova[lin][col] = round(Interpolado) if inteiro else Interpolado
+            Driver.GetRasterBand(k+1).SetNoDataValue(valor_nulo)
+
+        tipo = gdal_array.GDALTypeCodeToNumericTypeCode(GDT)
+        inteiro = True if GDT in (gdal.GDT_Byte,
+                                  gdal.GDT_UInt16,
+                                  gdal.GDT_Int16,
+                                  gdal.GDT_UInt32,
+                                  gdal.GDT_Int32) else False
+        if inteiro:
+            limites = np.iinfo(tipo)
+
+        # Reamostragem em blocos da imagem de saída: as coordenadas de cada bloco são
+        # transformadas de uma vez para a imagem original e todas as bandas são
+        # interpoladas a partir da janela correspondente
+        bloco = 512
+        blocos = [(lin, col, min(bloco, n_lin - lin), min(bloco, n_col - col))
+                  for lin in range(0, n_lin, bloco) for col in range(0, n_col, bloco)]
+
+        def reamostrar(janela):
+            lin, col, b_lin, b_col = janela
+            saida = np.full((n_bands, b_lin, b_col), int(valor_nulo) if inteiro else valor_nulo, dtype = tipo)
+            X = origem[0] + resol_X*(np.arange(col, col + b_col) + 0.5)
+            Y = origem[1] - resol_Y*(np.arange(lin, lin + b_lin) + 0.5)
+            X, Y = np.meshgrid(X, Y)
+            X_antigo, Y_antigo = CoordInvTransf(X, Y)
+            # Janela da imagem original (com margem para a interpolação)
+            c0 = max(int(np.floor((X_antigo.min() - origem_antiga[0])/xres_antiga)) - 2, 0)
+            c1 = min(int(np.ceil((X_antigo.max() - origem_antiga[0])/xres_antiga)) + 2, cols)
+            r0 = max(int(np.floor((origem_antiga[1] - Y_antigo.max())/yres_antiga)) - 2, 0)
+            r1 = min(int(np.ceil((origem_antiga[1] - Y_antigo.min())/yres_antiga)) + 2, rows)
+            if c1 <= c0 or r1 <= r0:
+                return janela, saida
+            origem_janela = (origem_antiga[0] + c0*xres_antiga, origem_antiga[1] - r0*yres_antiga)
+            # Cada bloco abre o seu próprio dataset GDAL
+            img = gdal.Open(RasterIN)
+            for k in range(n_bands):
+                banda_antiga = img.GetRasterBand(k+1).ReadAsArray(c0, r0, c1 - c0, r1 - r0)
+                Interpolado = InterpolarArray(X_antigo, Y_antigo,
+                                              banda_antiga,
+                                              origem_janela,
+                                              xres_antiga,
+                                              yres_antiga,
+                                              reamostragem,
+                                              valor_nulo)
+                ok = Interpolado != valor_nulo
+                if inteiro:
+                    saida[k][ok] = np.clip(np.round(Interpolado[ok]), limites.min, limites.max)
+                else:
+                    saida[k][ok] = Interpolado[ok]
+            img = None
+            return janela, saida
+
+        def gravar(janela, saida):
+            lin, col = janela[:2]
+            for k in range(n_bands):
+                Driver.GetRasterBand(k+1).WriteArray(saida[k], col, lin)
 
+        # Iniciar reamostragem
+        feedback.pushInfo(self.tr('Transforming raster...', 'Transformando raster...'))
+        Percent = 100.0/len(blocos)
+        if Paralelo:
+            n_workers = os.cpu_count() or 1
+            feedback.pushInfo(self.tr('Resampling with {} threads...', 'Reamostrando com {} threads...').format(n_workers))
+            with ThreadPoolExecutor(max_workers = n_workers) as executor:
+                for k in range(0, len(blocos), 2*n_workers):
+                    for current, (janela, saida) in enumerate(executor.map(reamostrar, blocos[k:k+2*n_workers])):
+                        gravar(janela, saida)
+                        feedback.setProgress(int((k + current + 1) * Percent))
+                    if feedback.isCanceled():
+                        break
+        else:
+            for current, janela in enumerate(blocos):
+                gravar(*reamostrar(janela))
+                feedback.setProgress(int((current + 1) * Percent))
                 if feedback.isCanceled():
                     break
-                current += 1
-                feedback.setProgress(int(current * Percent))
-
-            # Salvar banda
-            outband = Driver.GetRasterBand(k+1)
-            feedback.pushInfo(self.tr('Writing Band {}...'.format(k+1), 'Escrevendo Banda {}...'.format(k+1)))
-            outband.WriteArray(banda_nova)
-            outband.SetNoDataValue(valor_nulo)
 
         # Fechar Raster
         image = None # Close image
@@ -18,12 +18,15 @@ __copyright__ = '(C) 2023, Leandro França'
 from qgis.core import (Qgis,
                        QgsProcessingException,
                        QgsProcessingAlgorithm,
+                       QgsProcessingParameterBoolean,
                        QgsProcessingParameterFile,
                        QgsProcessingParameterFeatureSource,
+                       QgsSpatialIndex,
                        QgsApplication
                        )
 
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
 import os
@@ -76,6 +79,7 @@ class PhotosHistogramMatch(QgsProcessingAlgorithm):
     INPUT = 'INPUT'
     REFERENCE = 'REFERENCE'
     FOLDER = 'FOLDER'
+    PARALLEL = 'PARALLEL'
 
     def initAlgorithm(self, config=None):
         # INPUT
@@ -95,6 +99,14 @@ class PhotosHistogramMatch(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.PARALLEL,
+                self.tr('Parallel processing', 'Processamento paralelo'),
+                defaultValue= False
+            )
+        )
+
         # OUTPUT
         self.addParameter(
             QgsProcessingParameterFile(
@@ -140,81 +152,83 @@ class PhotosHistogramMatch(QgsProcessingAlgorithm):
         if not pasta:
             raise QgsProcessingException(self.invalidSourceError(parameters, self.FOLDER))
 
-        # distancia
-        def distancia1(geom1, geom2):
-            p1 = geom1.asPoint()
-            x1,y1 =  p1.x(),  p1.y()
-            p2 = geom2.asPoint()
-            x2,y2 =  p2.x(),  p2.y()
-            return np.sqrt((x1-x2)**2 + (y1-y2)**2)
+        Paralelo = self.parameterAsBool(
+            parameters,
+            self.PARALLEL,
+            context
+        )
 
-        # Para cada imagem a ser ajustada encontrar a foto mais próxima
-        feedback.pushInfo(self.tr('Histogram matching...', 'Casamento de histograma...'))
-        Percent = 100.0/ajust.featureCount() if ajust.featureCount() else 0
-
-        for current, feat1 in enumerate(ajust.getFeatures()):
-            geom1 = feat1.geometry()
-            caminho = feat1[self.tr('path','caminho')]
-            nome = feat1[self.tr('name','nome')]
-            dist = 1e10
-            for feat2 in ref.getFeatures():
-                geom2 = feat2.geometry()
-                distancia = distancia1(geom1,geom2)
-                if distancia < dist:
-                    dist = distancia
-                    caminho_ref = feat2[self.tr('path','caminho')]
-                    nome_ref = feat2[self.tr('name','nome')]
-
-            # Abrir imagem de referência
-            img = Image.open(caminho_ref)
-            rgb = np.asarray(img)
-            img = None
-
-            # Calcular média e desvio padrão por banda
-            R = rgb[..., 0]
-            G = rgb[..., 1]
-            B = rgb[..., 2]
-            meanR_ref, stdR_ref = R.mean(), R.std()
-            meanG_ref, stdG_ref = G.mean(), G.std()
-            meanB_ref, stdB_ref = B.mean(), B.std()
-
-            del rgb
+        # Índice espacial das fotos de referência
+        indice = QgsSpatialIndex()
+        fotos_ref = {}
+        for feat in ref.getFeatures():
+            indice.addFeature(feat)
+            fotos_ref[feat.id()] = feat[self.tr('path','caminho')]
 
+        # Para cada imagem a ser ajustada encontrar a foto mais próxima
+        fotos = []
+        for feat in ajust.getFeatures():
+            vizinho = indice.nearestNeighbor(feat.geometry(), 1)
+            if vizinho:
+                fotos += [(feat[self.tr('path','caminho')], feat[self.tr('name','nome')], fotos_ref[vizinho[0]])]
+
+        # Média e desvio padrão por banda a partir do histograma
+        def estatisticas(rgb):
+            medias, desvios = [], []
+            for k in range(3):
+                hist = np.bincount(rgb[..., k].ravel(), minlength=256)
+                valores = np.arange(len(hist))
+                media = (hist*valores).sum()/hist.sum()
+                medias += [media]
+                desvios += [np.sqrt((hist*(valores - media)**2).sum()/hist.sum())]
+            return medias, desvios
+
+        # Estatísticas das imagens de referência (calculadas uma única vez por imagem)
+        def estatisticasRef(caminho_ref):
+            with Image.open(caminho_ref) as img:
+                return caminho_ref, estatisticas(np.asarray(img))
+
+        def casar(foto):
+            caminho, nome, caminho_ref = foto
+            media_ref, desvio_ref = cache_ref[caminho_ref]
             # Abrir imagem a ser ajustada
-            img = Image.open(caminho)
-            exif = img.info['exif']
-            rgb = np.asarray(img)
-            R = rgb[..., 0]
-            G = rgb[..., 1]
-            B = rgb[..., 2]
-            meanR, stdR = R.mean(), R.std()
-            meanG, stdG = G.mean(), G.std()
-            meanB, stdB = B.mean(), B.std()
-
-            # Normalizar imagem a ser ajustada
-            R_norm = (R - meanR)/stdR
-            G_norm = (G - meanG)/stdG
-            B_norm = (B - meanB)/stdB
-
-            # Calibrar parâmetros de acordo com a imagem de referência
-            R = np.round(R_norm*stdR_ref + meanR_ref)
-            G = np.round(G_norm*stdG_ref + meanG_ref)
-            B = np.round(B_norm*stdB_ref + meanB_ref)
-
-            R = R*((R>0)*(R<256)) + 255*(R>255)
-            G = G*((G>0)*(G<256)) + 255*(G>255)
-            B = B*((B>0)*(B<256)) + 255*(B>255)
-
-            RGB = np.dstack((R,G,B))
-
+            with Image.open(caminho) as img:
+                exif = img.info.get('exif')
+                rgb = np.asarray(img)
+            media, desvio = estatisticas(rgb)
+            # Normalizar e calibrar de acordo com a imagem de referência (tabela de 256 valores por banda)
+            valores = np.arange(256)
+            RGB = np.empty(rgb.shape[:2] + (3,), dtype=np.uint8)
+            for k in range(3):
+                tabela = np.clip(np.round((valores - media[k])/desvio[k]*desvio_ref[k] + media_ref[k]), 0, 255).astype(np.uint8)
+                RGB[..., k] = tabela[rgb[..., k]]
             # Salvar imagem ajustada
-            nova_img = Image.fromarray(np.uint8(RGB))
-            nova_img.save(os.path.join(pasta,nome), quality=90, subsampling=0, exif=exif)
-
-            if feedback.isCanceled():
-                break
-            feedback.setProgress(int((current + 1) * Percent))
+            nova_img = Image.fromarray(RGB)
+            if exif:
+                nova_img.save(os.path.join(pasta,nome), quality=90, subsampling=0, exif=exif)
+            else:
+                nova_img.save(os.path.join(pasta,nome), quality=90, subsampling=0)
 
+        referencias = sorted(set(foto[2] for foto in fotos))
+        feedback.pushInfo(self.tr('Histogram matching...', 'Casamento de histograma...'))
+        Percent = 100.0/len(fotos) if fotos else 0
+        if Paralelo:
+            n_workers = os.cpu_count() or 1
+            feedback.pushInfo(self.tr('Processing with {} threads...', 'Processando com {} threads...').format(n_workers))
+            with ThreadPoolExecutor(max_workers = n_workers) as executor:
+                cache_ref = dict(executor.map(estatisticasRef, referencias))
+                for k in range(0, len(fotos), 2*n_workers):
+                    for current, _ in enumerate(executor.map(casar, fotos[k:k+2*n_workers])):
+                        feedback.setProgress(int((k + current + 1) * Percent))
+                    if feedback.isCanceled():
+                        break
+        else:
+            cache_ref = dict(map(estatisticasRef, referencias))
+            for current, foto in enumerate(fotos):
+                casar(foto)
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(int((current + 1) * Percent))
 
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
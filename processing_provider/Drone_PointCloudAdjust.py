@@ -16,7 +16,6 @@ __date__ = '2023-01-22'
 __copyright__ = '(C) 2023, Leandro França'
 
 from qgis.core import (Qgis,
-                       QgsPointXY,
                        QgsProcessingException,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterNumber,
@@ -30,11 +29,9 @@ from osgeo import osr, gdal_array, gdal #https://gdal.org/python/
 import numpy as np
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
-from lftools.geocapt.dip import Interpolar
 from lftools.geocapt.adjust import AjustVertical, ValidacaoGCP, Ajust2D, ValidacaoVetores
 from lftools.geocapt.cartography import geom2PointList
-import os
-import codecs
+import os, io
 from qgis.PyQt.QtGui import QIcon
 
 class PointCloudAdjust(QgsProcessingAlgorithm):
@@ -195,8 +192,6 @@ class PointCloudAdjust(QgsProcessingAlgorithm):
         if decimal is None or decimal<1:
             raise QgsProcessingException(self.invalidSourceError(parameters, self.DECIMAL))
 
-        format_num = '{:,.Xf}'.replace('X', str(decimal))
-
         arquivo_saida = self.parameterAsFile(
             parameters,
             self.ADJUSTED,
@@ -206,13 +201,6 @@ class PointCloudAdjust(QgsProcessingAlgorithm):
         if 'ADJUSTED.txt' in arquivo_saida: # não permitir arquivo temporário
             raise QgsProcessingException(self.tr('Output file path must be filled!', 'Caminho do arquivo de saída deve ser preenchido!'))
 
-        # Contagem de pontos
-        feedback.pushInfo(self.tr('Opening point cloud file...', 'Abrindo arquivo de nuvem de pontos...'))
-        with codecs.open(nuvem, 'r', encoding='utf-8', errors='ignore') as arq_in:
-            total_lines = sum(1 for line in arq_in)
-
-        feedback.pushInfo(self.tr('Total number of points: ', 'Número total de pontos: ') + self.tr('{:,d}'.format(total_lines), '{:,d}'.format(total_lines).replace(',','.')) )
-
         # Ajustamento Horizontal
         feedback.pushInfo(self.tr('Calculating horizontal adjustment parameters...', 'Calculando parâmetros de ajustamento horizontal...'))
         validacao = ValidacaoVetores(deslc, metodo_Hz)
@@ -234,40 +222,58 @@ class PointCloudAdjust(QgsProcessingAlgorithm):
         # Realizando as correções horizontais e verticais
         feedback.pushInfo(self.tr("Performing horizontal and vertical adjustment...", 'Realizando ajuste horizontal e vertical...'))
 
-        # Abrir arquivo TXT de nuvem de pontos
-        arq_in = codecs.open(nuvem, 'r', encoding='utf-8', errors='ignore')
-        arq_out = open(arquivo_saida, 'w')
-
-        Percent = 100.0/total_lines if total_lines else 0
-
-        for current, line in enumerate(arq_in.readlines()):
-            try:
-                lista = line.split(' ')
-                if len(lista) == 3:
-                    X, Y, Z = lista
-                elif len(lista) == 6:
-                    X, Y, Z, R, G, B = lista
-                else:
-                    X, Y, Z = lista[0], lista[1], lista[2]
-                # Correção HORIZONTAL
-                X_novo, Y_novo = CoordTransf_Hz(QgsPointXY(float(X),float(Y)))
-                dz = CoordTransf_V(X_novo, Y_novo)
-                Z_novo = float(Z) - dz
-                if len(lista) == 3:
-                    arq_out.write('{:.2f} {:.2f} {:.2f}\n'.format(X_novo, Y_novo, Z_novo))
-                elif len(lista) == 6:
-                    arq_out.write('{:.2f} {:.2f} {:.2f} {} {} {}\n'.format(X_novo, Y_novo, Z_novo, int(R), int(G), int(B)))
-                else:
-                    linha = '{:.2f} {:.2f} {:.2f}' + (len(lista)-3)*' {}' + '\n'
-                    arq_out.write(linha.format(X_novo, Y_novo, Z_novo, *lista[3:]))
-            except:
-                pass
-            if feedback.isCanceled():
-                break
-            feedback.setProgress(int((current + 1) * Percent))
-
-        arq_in.close()
-        arq_out.close()
+        # Correções vetorizadas de um conjunto de pontos (arrays X, Y, Z); as demais colunas
+        # de cada linha (caudas) são gravadas exatamente como lidas
+        fmt = ' '.join(['%.{}f'.format(decimal)]*3)
+        def ajustar(dados, caudas):
+            X_novo, Y_novo = CoordTransf_Hz(dados[:,0], dados[:,1])
+            dz = CoordTransf_V(X_novo, Y_novo)
+            dados = np.column_stack((X_novo, Y_novo, dados[:,2] - dz))
+            texto = io.StringIO()
+            np.savetxt(texto, dados, fmt=fmt)
+            linhas_xyz = texto.getvalue().splitlines()
+            arq_out.write(''.join(xyz + ' ' + cauda + '\n' if cauda else xyz + '\n' for xyz, cauda in zip(linhas_xyz, caudas)))
+
+        # Separa as três primeiras colunas (X Y Z) do restante de cada linha.
+        # Apenas linhas com X, Y ou Z inválidos são rejeitadas (e contadas); linhas vazias são ignoradas
+        def separar(linhas):
+            dados, caudas = [], []
+            rejeitadas = 0
+            for linha in linhas:
+                partes = linha.split(None, 3)
+                if not partes:
+                    continue
+                try:
+                    dados += [[float(partes[0]), float(partes[1]), float(partes[2])]]
+                except (ValueError, IndexError):
+                    rejeitadas += 1
+                    continue
+                caudas += [partes[3] if len(partes) > 3 else '']
+            return np.array(dados, dtype=float).reshape(-1, 3), caudas, rejeitadas
+
+        # Leitura em blocos de linhas (~16 MB), com progresso pela posição no arquivo
+        tamanho = os.path.getsize(nuvem)
+        Percent = 100.0/tamanho if tamanho else 0
+        total = 0
+        rejeitadas = 0
+        with open(nuvem, 'rb') as arq_in, open(arquivo_saida, 'w') as arq_out:
+            while True:
+                bloco = arq_in.readlines(2**24)
+                if not bloco:
+                    break
+                linhas = b''.join(bloco).decode('utf-8', errors='ignore').splitlines()
+                dados, caudas, n_rej = separar(linhas)
+                if len(dados):
+                    ajustar(dados, caudas)
+                total += len(dados)
+                rejeitadas += n_rej
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(int(arq_in.tell() * Percent))
+
+        feedback.pushInfo(self.tr('Total number of points: ', 'Número total de pontos: ') + self.tr('{:,d}'.format(total), '{:,d}'.format(total).replace(',','.')))
+        if rejeitadas:
+            feedback.reportError(self.tr('Rejected lines: ', 'Linhas rejeitadas: ') + self.tr('{:,d}'.format(rejeitadas), '{:,d}'.format(rejeitadas).replace(',','.')))
 
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
@@ -20,9 +20,9 @@ from qgis.core import *
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
 from lftools.geocapt.cartography import raioMedioGauss
+from lftools.geocapt.gnss import lerNMEA, NMEA_QUALITY
 import numpy as np
 import datetime
-import codecs
 import os
 from qgis.PyQt.QtGui import QIcon, QColor
 
@@ -168,62 +168,26 @@ Modos:
         if not crs.isGeographic():
             raise QgsProcessingException(self.tr('Choose a geographic CRS!', 'Escolha um SRC geográfico!'))
 
-        arq = codecs.open(caminho, 'r', encoding='utf-8', errors='ignore')
-
         tipo = self.parameterAsEnum(
             parameters,
             self.TYPE,
             context
         )
 
-        lista = []
-        PDOP, HDOP, VDOP = -1, -1, -1
-        nmea_quality = {0:'0: Invalid', 1:'1: Standalone', 2:'2: DGPS', 3:'3: n/a', 4:'4: RTK fixed', 5:'5: RTK float'}
+        # Leitura do arquivo em uma única passada (valores em colunas)
+        dados = lerNMEA(caminho)
+        if len(dados['lat']) == 0:
+            raise QgsProcessingException(self.tr('No valid observations found!', 'Nenhuma observação válida encontrada!'))
+        dados['H'] = dados['H'] - aa
+        dados['h'] = dados['N'] + dados['H']
 
-        for line in arq.readlines():
+        def dataHora(k):
             try:
-                if line[3:6] == 'GSA': # GPS DOP and active satellites
-                    partes = line.split(',')
-                    PDOP = float(partes[-4])
-                    HDOP = float(partes[-3])
-                    VDOP = float(partes[-2])
-
-                if line[3:6] == 'GGA': # global position system fix data
-                    partes = line.split(',')
-                    hora = int(partes[1][0:2])
-                    min = int(partes[1][2:4])
-                    seg = float(partes[1][4:10])
-                    lat = (-1 if partes[3] == 'S' else 1)*( float(partes[2][0:2]) + float(partes[2][2:-1])/60)
-                    lon = (-1 if partes[5] == 'W' else 1)*( float(partes[4][0:3]) + float(partes[4][3:-1])/60)
-                    quality = nmea_quality[int(partes[6])]
-                    num_sat = int(partes[7])
-                    HDOP = float(partes[8])
-                    H = float(partes[9]) - aa
-                    N = float(partes[11])
-                    h = N + H
-                    if quality != nmea_quality[0]: # Only parse if is valid
-                        lista += [[lat, lon, h, H, N, HDOP, VDOP, PDOP, hora, min, seg, quality, num_sat]]
-
-                if line[3:6] == 'ZDA': # Time & Date – UTC, Day, Month, Year and Local Time Zone
-                    partes = line.split(',')
-                    dia = int(partes[2])
-                    mes = int(partes[3])
-                    ano = int(partes[4])
-
-                if line[3:6] == 'RMC': # Position, Time & Date – UTC, Day, Month, Year -- (Get only date)
-                    partes = line.split(',')
-                    if partes[2] == 'A':            # Only parse if is valid
-                        dia = int(partes[9][0:2])
-                        mes = int(partes[9][2:4])
-                        ano = int(partes[9][4:6])+2000
+                ano, mes, dia = dados['data']
+                return str(datetime.datetime(ano, mes, dia, int(dados['hora'][k]), int(dados['minuto'][k]), int(dados['segundo'][k])))
             except:
-                pass
+                return None
 
-        arq.close()
-        if len(lista) == 0:
-            raise QgsProcessingException(self.tr('No valid observations found!', 'Nenhuma observação válida encontrada!'))
-        else:
-            valores = np.array(lista)
         # Campos
         if tipo == 0:
             itens  = {"lat": QMetaType.Type.Double,
@@ -260,68 +224,41 @@ Modos:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
         if tipo == 0: # Cinemático
-            feat = QgsFeature()
-            for pnt in lista:
-                feat.setGeometry(QgsPoint(pnt[1],pnt[0], pnt[2]))
-                try:
-                    data_hora = str(datetime.datetime(ano, mes, dia, pnt[-5], pnt[-4], int(pnt[-3])))
-                except:
-                    data_hora = None
-                feat.setAttributes(pnt[0:5] + [data_hora] + pnt[5:8] + pnt[-2:]  ) # lat, lon, h, H, N, HDOP, VDOP, PDOP, hora, min, seg, quality, num_sat
-                sink.addFeature(feat, QgsFeatureSink.Flag.FastInsert)
-
-        elif tipo == 1: # Estático com solução fixa
-            valores = valores[valores[:,-2] == nmea_quality[4] ] # eliminando observações de baixa qualidade
-            if len(valores) == 0:
-                raise QgsProcessingException(self.tr('There is no observation with RTK correction.', 'Não existe observação com correção RTK.'))
-            # calculo de valores médios
-            lat = valores[:,0].astype('float').mean()
-            s_lat = valores[:,0].astype('float').std()
-            lon = valores[:,1].astype('float').mean()
-            s_lon = valores[:,1].astype('float').std()
-            h = valores[:,2].astype('float').mean()
-            s_h = valores[:,2].astype('float').std()
-            H = valores[:,3].astype('float').mean()
-            N = valores[:,4].astype('float').mean()
-            try:
-                data_hora_ini = str(datetime.datetime(ano, mes, dia, int(valores[0, -5]), int(valores[0, -4]), int(float(valores[0, -3]))))
-                data_hora_fim = str(datetime.datetime(ano, mes, dia, int(valores[-1, -5]), int(valores[-1, -4]), int(float(valores[-1, -3]))))
-            except:
-                data_hora_ini, data_hora_fim = None, None
-            # Raio Médio de Gauss
-            R = raioMedioGauss(lat, self.tr('EPSG:4326','EPSG:4674'))
-            sigma_x = (R+h)*np.radians(s_lon)
-            sigma_y = (R+h)*np.radians(s_lat)
-
-            feat = QgsFeature()
-            feat.setGeometry(QgsPoint(lon, lat, h))
-            feat.setAttributes([float(lat),
-                                float(lon),
-                                float(h),
-                                float(H),
-                                float(N),
-                                data_hora_ini,
-                                data_hora_fim,
-                                float(sigma_x),
-                                float(sigma_y),
-                                float(s_h),
-                                len(valores)])
-            sink.addFeature(feat, QgsFeatureSink.Flag.FastInsert)
-
-        elif tipo == 2: # Estático com todos os valores
+            colunas = [dados[nome].tolist() for nome in ('lat', 'lon', 'h', 'H', 'N', 'HDOP', 'VDOP', 'PDOP', 'num_sat')]
+            quality = [NMEA_QUALITY[q] for q in dados['quality'].tolist()]
+            total = 100.0/len(quality)
+            lote = []
+            for k, (lat, lon, h, H, N, HDOP, VDOP, PDOP, num_sat) in enumerate(zip(*colunas)):
+                feat = QgsFeature(Fields)
+                feat.setGeometry(QgsPoint(lon, lat, h))
+                feat.setAttributes([lat, lon, h, H, N, dataHora(k), HDOP, VDOP, PDOP, quality[k], num_sat])
+                lote += [feat]
+                if len(lote) == 10000:
+                    sink.addFeatures(lote, QgsFeatureSink.Flag.FastInsert)
+                    lote = []
+                    if feedback.isCanceled():
+                        break
+                    feedback.setProgress(int((k+1) * total))
+            sink.addFeatures(lote, QgsFeatureSink.Flag.FastInsert)
+
+        else: # Estático
+            if tipo == 1: # apenas com solução fixa
+                fixas = dados['quality'] == 4 # eliminando observações de baixa qualidade
+                if not fixas.any():
+                    raise QgsProcessingException(self.tr('There is no observation with RTK correction.', 'Não existe observação com correção RTK.'))
+                dados = {nome: (valores[fixas] if isinstance(valores, np.ndarray) else valores) for nome, valores in dados.items()}
             # calculo de valores médios
-            lat = valores[:,0].astype('float').mean()
-            s_lat = valores[:,0].astype('float').std()
-            lon = valores[:,1].astype('float').mean()
-            s_lon = valores[:,1].astype('float').std()
-            h = valores[:,2].astype('float').mean()
-            s_h = valores[:,2].astype('float').std()
-            H = valores[:,3].astype('float').mean()
-            N = valores[:,4].astype('float').mean()
-            try:
-                data_hora_ini = str(datetime.datetime(ano, mes, dia, int(valores[0, -5]), int(valores[0, -4]), int(float(valores[0, -3]))))
-                data_hora_fim = str(datetime.datetime(ano, mes, dia, int(valores[-1, -5]), int(valores[-1, -4]), int(float(valores[-1, -3]))))
-            except:
+            lat = dados['lat'].mean()
+            s_lat = dados['lat'].std()
+            lon = dados['lon'].mean()
+            s_lon = dados['lon'].std()
+            h = dados['h'].mean()
+            s_h = dados['h'].std()
+            H = dados['H'].mean()
+            N = dados['N'].mean()
+            data_hora_ini = dataHora(0)
+            data_hora_fim = dataHora(-1)
+            if data_hora_ini is None or data_hora_fim is None:
                 data_hora_ini, data_hora_fim = None, None
             # Raio Médio de Gauss
             R = raioMedioGauss(lat, self.tr('EPSG:4326','EPSG:4674'))
@@ -340,7 +277,7 @@ Modos:
                                 float(sigma_x),
                                 float(sigma_y),
                                 float(s_h),
-                                len(valores)])
+                                len(dados['lat'])])
             sink.addFeature(feat, QgsFeatureSink.Flag.FastInsert)
 
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
@@ -17,6 +17,7 @@ __copyright__ = '(C) 2022, Leandro França'
 
 from qgis.PyQt.QtCore import QMetaType
 from qgis.core import (Qgis,
+                       QgsFeature,
                        QgsFeatureSink,
                        QgsField,
                        QgsPoint,
@@ -31,11 +32,10 @@ from qgis.core import (Qgis,
 
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
-from lftools.geocapt.topogeo import meters2degrees, str_decimal_to_datetime
+from lftools.geocapt.topogeo import meters2degrees, str_decimal_to_seconds
+from lftools.geocapt.centrality import indiceCentral
 
 import numpy as np
-from datetime import datetime
-import codecs
 import os
 from qgis.PyQt.QtGui import QIcon
 
@@ -192,93 +192,58 @@ Dados de entrada:
         y_min = extensao.yMinimum()
         dist_max = meters2degrees(dist_max, (y_min+y_max)/2, SRC)
 
-        x, y = [],[]
-        pontos = []
-        for feat in layer.getFeatures():
-            x += [feat.geometry().asPoint().x()]
-            y += [feat.geometry().asPoint().y()]
-
-        w = np.ones(len(x))
-
-        def CentralFeature(x, y):
-            dist_soma = 1e15
-            indice = -1
-            for i in range(len(x)):
-                x1 = x[i]
-                y1 = y[i]
-                soma = 0
-                for j in range(len(y)):
-                    x2 = x[j]
-                    y2 = y[j]
-                    soma += np.sqrt((x1 - x2)**2 + (y1 - y2)**2)
-                if soma < dist_soma:
-                    dist_soma = soma
-                    indice = i
-            return x[indice], y[indice]
-
-        # Saber se o ponto está parado em um ponto
-        X, Y = [],[]
+        # Coordenadas, datas e atributos lidos em uma única passada
+        X, Y, Z = [], [], []
         datahora = []
+        atributos = []
+        campo_dh = layer.fields().indexOf(self.tr('datetime', 'datahora'))
+        campo_h = layer.fields().indexOf('h')
         for feat in layer.getFeatures():
-            X += [feat.geometry().asPoint().x()]
-            Y += [feat.geometry().asPoint().y()]
-            datahora += [feat[self.tr('datetime', 'datahora')]]
-
-        cont = 1
+            geom = feat.geometry()
+            pnt = geom.constGet()
+            if geom.isMultipart():
+                pnt = pnt.geometryN(0)
+            X += [pnt.x()]
+            Y += [pnt.y()]
+            Z += [pnt.z()]
+            att = feat.attributes()
+            datahora += [att[campo_dh] if campo_dh >= 0 else None]
+            atributos += [att]
         try:
-            t_ini = datahora[0]
+            segundos = str_decimal_to_seconds(datahora)
+            assert len(X) > 0
         except:
             raise QgsProcessingException(self.tr('Check the input layer!', 'Verifique a camada de entrada!'))
-        grupos = {}
-        x, y = [],[]
-        for i in range(len(X)-1):
-            x1 = X[i]
-            y1 = Y[i]
-            x2 = X[i+1]
-            y2 = Y[i+1]
-            t = datahora[i+1]
-            if np.sqrt((x1 - x2)**2 + (y1 - y2)**2) < dist_max:
-                x += [x1]
-                y += [y1]
-            else:
-                intervalo = str_decimal_to_datetime(t) - str_decimal_to_datetime(t_ini)
-                intervalo = intervalo.total_seconds()
-                if  intervalo > tempo_min: # se ficou parado pelo tempo mínimo
-                    grupos[cont] = {'x': x, 'y': y, 't_ini': t_ini, 't_fim': t}
-                    cont += 1
-                t_ini = t
-                x, y = [],[]
-
-        # Última leva
-        intervalo = str_decimal_to_datetime(t) - str_decimal_to_datetime(t_ini)
-        intervalo = intervalo.total_seconds()
-        if  intervalo > tempo_min:
-            grupos[cont] = {'x': x, 'y': y, 't_ini': t_ini, 't_fim': t}
+        X, Y = np.array(X), np.array(Y)
+
+        # Saber se o ponto está parado em um ponto: trechos entre saltos maiores que a tolerância
+        parado = np.hypot(np.diff(X), np.diff(Y)) < dist_max
+        quebras = np.nonzero(~parado)[0]
+        inicio = np.concatenate(([0], quebras + 1)) # primeiro ponto do trecho
+        fim = np.concatenate((quebras, [len(X) - 1])) # ponto seguinte ao último ponto parado
+        ind_fim = np.concatenate((quebras + 1, [len(X) - 1])) # ponto que encerra o trecho
+        estatico = segundos[ind_fim] - segundos[inicio] > tempo_min # se ficou parado pelo tempo mínimo
+        grupos = np.cumsum(estatico)
 
         # Calcular feição central
         feedback.pushInfo(self.tr('Calculating central features...', 'Calculando feições centrais...'))
-        for grupo in grupos:
-            x = grupos[grupo]['x']
-            y = grupos[grupo]['y']
-            if len(x) > 0:
-                central_X, central_Y = CentralFeature(x, y)
-                # Pegar atributos do ponto central
-                for feat in layer.getFeatures():
-                    geom = feat.geometry()
-                    if geom.isMultipart():
-                        pnt = geom.asMultiPoint()[0]
-                    else:
-                        pnt = geom.asPoint()
-                    if pnt.x() == central_X and pnt.y() == central_Y:
-                        att = feat.attributes()
-                        break
-                pnt = QgsGeometry(QgsPoint(float(central_X), float(central_Y), float(feat['h'])))
-                att += [grupos[grupo]['t_ini'], grupos[grupo]['t_fim'], len(x), str(grupo)]
-                feat.setGeometry(pnt)
-                feat.setAttributes(att)
-                sink.addFeature(feat, QgsFeatureSink.Flag.FastInsert)
-                if feedback.isCanceled():
-                    break
+        selecionados = np.nonzero(estatico & (fim > inicio))[0]
+        total = 100.0/len(selecionados) if len(selecionados) else 0
+        feat = QgsFeature(Fields)
+        for current, k in enumerate(selecionados):
+            ini, n = inicio[k], fim[k] - inicio[k]
+            central = ini + indiceCentral(X[ini:ini+n], Y[ini:ini+n])
+            # Atributos do ponto central pelo índice
+            att = list(atributos[central])
+            z = att[campo_h] if campo_h >= 0 else Z[central]
+            pnt = QgsGeometry(QgsPoint(float(X[central]), float(Y[central]), float(z)))
+            att += [datahora[inicio[k]], datahora[ind_fim[k]], int(n), int(grupos[k])]
+            feat.setGeometry(pnt)
+            feat.setAttributes(att)
+            sink.addFeature(feat, QgsFeatureSink.Flag.FastInsert)
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(int((current+1) * total))
 
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
@@ -21,8 +21,8 @@ from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
 from lftools.geocapt.vemos import vemos
 from lftools.geocapt.topogeo import meters2degrees, datetime_decimal_str, str_decimal_to_datetime
-import codecs
-import math
+from lftools.geocapt.gnss import lerPOS, POS_QUALITY
+import numpy as np
 import os
 from qgis.PyQt.QtGui import QIcon, QColor
 
@@ -261,143 +261,74 @@ Para posicionamento relativo (RTK/PPK), os desvios-padrão da estação base pod
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
-        arq = codecs.open(caminho, 'r', encoding='utf-8', errors='ignore')
-
         saida = self.parameterAsEnum(
             parameters,
             self.TYPE,
             context
         )
-        quality_dic = {1:'1: fix', 2:'2: float', 3:'3: sbas', 4:'4: dgps', 5: '5: single', 6: '6: ppp'}
-
-        # IBGE ou RTKLIB
-        for linha in arq.readlines():
-            break
-        arq.close()
-        if linha[0] == '%':
-            tipo = 'rtklib'
+
+        # IBGE ou RTKLIB, lido em uma única passada (valores em colunas)
+        dados = lerPOS(caminho)
+        tipo = dados['tipo']
+        if tipo == 'rtklib':
             feedback.pushInfo(self.tr("It's a RTKLIB file!", 'É um arquivo do RTKLIB!'))
-        elif linha[0] == '-':
-            tipo = 'ibge'
+            # Calcula sigmas propagados
+            dados['slon'] = np.sqrt(dados['slon']**2 + sigma_x_base**2)
+            dados['slat'] = np.sqrt(dados['slat']**2 + sigma_y_base**2)
+            dados['sh'] = np.sqrt(dados['sh']**2 + sigma_z_base**2)
+            quality = [POS_QUALITY[q] for q in dados['quality'].tolist()]
+        elif tipo == 'ibge':
             feedback.pushInfo(self.tr("It's a IBGE-PPP file!", 'É um arquivo do PPP-IBGE!'))
+            quality = ['ppp-ibge']*len(dados['lat'])
         else:
             raise QgsProcessingException(self.tr('Unrecognized POS file format!', 'Formato de arquivo POS não reconhecido!'))
 
-        arq = codecs.open(caminho, 'r', encoding='utf-8', errors='ignore')
-        lista = []
-        dic = {}
-        if tipo == 'rtklib':
-            for linha in arq.readlines():
-                if linha[0] != '%':
-                    while '  ' in linha:
-                        linha = linha.replace('  ', ' ')
-                    lista += [linha.split(' ')]
-            arq.close()
-            for k,pnt in enumerate(lista):
-                lat = float(pnt[2])
-                lon = float(pnt[3])
-                h = float(pnt[4])
-                ano, mes, dia = pnt[0].split('/')
-                hora, minuto, segundo = pnt[1].split(':')
-                datahora = datetime_decimal_str(int(ano), int(mes), int(dia), int(hora), int(minuto), float(segundo))
-                quality = quality_dic[int(pnt[5])]
-                nsat = int(pnt[6])
-                slat = float(pnt[7])
-                slon = float(pnt[8])
-                sh = float(pnt[9])
-
-                # Calcula sigmas propagados
-                sigma_x_prop = math.sqrt(slon**2 + sigma_x_base**2)
-                sigma_y_prop = math.sqrt(slat**2 + sigma_y_base**2)
-                sigma_z_prop = math.sqrt(sh**2 + sigma_z_base**2)
-
-                dic[k+1] = {'lat': lat, 'lon':lon, 'h': h, 'datahora': datahora, 'quality': quality, 'nsat': nsat,
-                          'slat': sigma_y_prop, 'slon': sigma_x_prop, 'sh':sigma_z_prop   }
-        elif tipo == 'ibge':
-            for linha in arq.readlines():
-                if linha[0:3] == 'FWD':
-                    while '  ' in linha:
-                        linha = linha.replace('  ', ' ')
-                    lista += [linha.split(' ')]
-            arq.close()
-            for k,pnt in enumerate(lista):
-                lat = float(pnt[20]) + (-1 if float(pnt[20]) < 0 else 1)*(float(pnt[21])/60. + float(pnt[22])/3600)
-                lon = float(pnt[23]) + (-1 if float(pnt[23]) < 0 else 1)*(float(pnt[24])/60. + float(pnt[25])/3600)
-                h = float(pnt[26])
-                ano, mes, dia = pnt[4].split('-')
-                hora, minuto, segundo = pnt[5].split(':')
-                if int(float(segundo)) != 60:
-                    datahora = datetime_decimal_str(int(ano), int(mes), int(dia), int(hora), int(minuto), float(segundo))
-                else:
-                    if int(minuto) < 59:
-                        datahora = datetime_decimal_str(int(ano), int(mes), int(dia), int(hora), int(minuto) + 1, 0)
-                    else:
-                        datahora = datetime_decimal_str(int(ano), int(mes), int(dia), int(hora) + 1, 0, 0)
-                quality = 'ppp-ibge'
-                nsat = int(pnt[6])
-                slat = float(pnt[15])
-                slon = float(pnt[16])
-                sh = float(pnt[17])
-                dic[k+1] = {'lat': lat, 'lon':lon, 'h': h, 'datahora': datahora, 'quality': quality, 'nsat': nsat,
-                          'slat': slat, 'slon': slon, 'sh':sh   }
-        # Salvando os resultados
-        tam = len(lista)
-        total = 100./tam if tam>0 else 0
-        for k, item in enumerate(dic):
-            lat = dic[item]['lat']
-            lon = dic[item]['lon']
-            h = dic[item]['h'] - aa
-            datahora = dic[item]['datahora']
-            quality = dic[item]['quality']
-            nsat = dic[item]['nsat']
-            slat = dic[item]['slat']
-            slon = dic[item]['slon']
-            sh = dic[item]['sh']
+        tam = len(dados['lat'])
+        if tam == 0:
+            raise QgsProcessingException(self.tr('No valid observations found!', 'Nenhuma observação válida encontrada!'))
+        datahora = [datetime_decimal_str(*data) for data in zip(*[dados[nome].tolist() for nome in ('ano', 'mes', 'dia', 'hora', 'minuto', 'segundo')])]
+        lat = dados['lat']
+        lon = dados['lon']
+        h = dados['h'] - aa
+
+        # Ponto de saída: todos (cinemático) ou apenas o último (estático)
+        indices = np.arange(tam) if saida == 0 else np.array([tam - 1])
+
+        if model_vel > 0:
+            lat = lat[indices]
+            lon = lon[indices]
+            SIRGAS = QgsCoordinateReferenceSystem('EPSG:4674')
+            ref = str_decimal_to_datetime('2000-04-24 12:00:00')
+            modelo = ['vemos2009','vemos2017','vemos2022'][model_vel-1]
+            vel = np.array([vemos(lat[k], lon[k], modelo) for k in range(len(indices))]).reshape(-1, 2)
+            anos = np.array([(str_decimal_to_datetime(datahora[ind]) - ref).days/365.25 for ind in indices])
+            dLat = meters2degrees(vel[:,0]*anos, lat, SIRGAS)
+            dLon = meters2degrees(vel[:,1]*anos, lat, SIRGAS)
+            lat = lat - dLat
+            lon = lon - dLon
+            lat_full = dados['lat'].copy()
+            lon_full = dados['lon'].copy()
+            lat_full[indices] = lat
+            lon_full[indices] = lon
+            lat, lon = lat_full, lon_full
+
+        # Salvando os resultados em lotes
+        colunas = [lat.tolist(), lon.tolist(), h.tolist(), dados['slon'].tolist(), dados['slat'].tolist(), dados['sh'].tolist(), dados['nsat'].tolist()]
+        total = 100./len(indices)
+        lote = []
+        for cont, k in enumerate(indices.tolist()):
             feat = QgsFeature(Fields)
-            feat['ord'] = item
-            feat['lat'] = lat
-            feat['lon'] = lon
-            feat['h'] = h
-            feat[self.tr("datetime","datahora")] = datahora
-            feat['sigma_x'] = slon
-            feat['sigma_y'] = slat
-            feat['sigma_z'] = sh
-            feat['num_sat'] = nsat
-            feat['quality'] = quality
-            feat['h_reduction'] = aa
-
-            if model_vel > 0 and saida == 0:
-                vlat, vlon = vemos(lat, lon, ['vemos2009','vemos2017','vemos2022'][model_vel-1])
-                delta_tempo = str_decimal_to_datetime(datahora) - str_decimal_to_datetime('2000-04-24 12:00:00')
-                anos = delta_tempo.days/365.25
-                dLat = meters2degrees(vlat*anos, lat, QgsCoordinateReferenceSystem('EPSG:4674'))
-                dLon = meters2degrees(vlon*anos, lat, QgsCoordinateReferenceSystem('EPSG:4674'))
-                lat -= dLat
-                lon -= dLon
-                feat['lat'] = float(lat)
-                feat['lon'] = float(lon)
-
-            if saida == 0:
-                feat.setGeometry(QgsPoint(lon, lat, h))
-                sink.addFeature(feat, QgsFeatureSink.Flag.FastInsert)
-            if feedback.isCanceled():
-                break
-            feedback.setProgress(int((k+1) * total))
-
-
-        if saida == 1:
-            if model_vel > 0:
-                vlat, vlon = vemos(lat, lon, ['vemos2009','vemos2017','vemos2022'][model_vel-1])
-                delta_tempo = str_decimal_to_datetime(datahora) - str_decimal_to_datetime('2000-04-24 12:00:00')
-                anos = delta_tempo.days/365.25
-                dLat = meters2degrees(vlat*anos, lat, QgsCoordinateReferenceSystem('EPSG:4674'))
-                dLon = meters2degrees(vlon*anos, lat, QgsCoordinateReferenceSystem('EPSG:4674'))
-                lat -= dLat
-                lon -= dLon
-                feat['lat'] = float(lat)
-                feat['lon'] = float(lon)
-            feat.setGeometry(QgsPoint(lon, lat, h))
-            sink.addFeature(feat, QgsFeatureSink.Flag.FastInsert)
+            feat.setAttributes([k+1, colunas[0][k], colunas[1][k], colunas[2][k], datahora[k],
+                                colunas[3][k], colunas[4][k], colunas[5][k], colunas[6][k], quality[k], aa])
+            feat.setGeometry(QgsPoint(colunas[1][k], colunas[0][k], colunas[2][k]))
+            lote += [feat]
+            if len(lote) == 10000:
+                sink.addFeatures(lote, QgsFeatureSink.Flag.FastInsert)
+                lote = []
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(int((cont+1) * total))
+        sink.addFeatures(lote, QgsFeatureSink.Flag.FastInsert)
 
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
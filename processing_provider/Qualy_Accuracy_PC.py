@@ -26,6 +26,7 @@ from lftools.geocapt.imgs import *
 from lftools.translations.translate import translate
 from lftools.geocapt.topogeo import str2HTML
 from lftools.geocapt.cartography import PEC
+from lftools.geocapt.nuvem import blocosXYZ, VizinhancaQuadrada, maisProximo3D
 import os
 from qgis.PyQt.QtGui import QIcon, QColor, QFont
 from lftools.dependencies import (
@@ -295,77 +296,52 @@ class Accuracy_PC(QgsProcessingAlgorithm):
         
         Escalas = [ esc for esc in dicionario]
         
-        # função cálculo das distâncias
-        def QuadDist3D (pnt1, pnt2):
-            return (pnt1.x() - pnt2.x())**2 + (pnt1.y() - pnt2.y())**2 + (pnt1.z() - pnt2.z())**2
-        
-        
-        # Número de pontos
-        with open(caminho) as myfile:
-            total_pnts = sum(1 for line in myfile)
-        feedback.pushInfo(self.tr('Total number of points: ', 'Número total de pontos: ') + '{}'.format(total_pnts))
-    
-        
-        # Filtrando os pontos mais próximos
+        # Pontos de verificação (coordenadas no SRC de saída)
         feedback.pushInfo(self.tr('Filtering nearest points...', 'Filtrando os pontos mais próximos...'))
         pontos_ref = []
+        cotas_ref = []
+        atributos = []
         for feat in source.getFeatures():
             geom = feat.geometry()
             if coordTransf and crs != SRC:
                 geom.transform(coordinateTransf)
             pnt = geom.asPoint()
-            x_ref, y_ref = pnt.x(), pnt.y()
-            pontos_ref += [[x_ref, y_ref]]
-        
-        arquivo = open(caminho, 'r')
+            pontos_ref += [[pnt.x(), pnt.y()]]
+            cotas_ref += [float(feat[columnIndex])]
+            atributos += [feat.attributes()]
+        pontos_ref = np.array(pontos_ref, dtype=float)
+        cotas_ref = np.array(cotas_ref, dtype=float)
+
+        # Leitura da nuvem em blocos, mantendo apenas os pontos na vizinhança dos pontos de verificação
+        vizinhanca = VizinhancaQuadrada(pontos_ref[:,0], pontos_ref[:,1], distProx)
         pontos_teste = []
-        total = 100.0/total_pnts if total_pnts else 0
-        cont = 0
-        for linha in arquivo:
-            lista = linha.replace('\n', '').split(' ')
-            x = float(lista[0])
-            y = float(lista[1])
-            z = float(lista[2])
-            for pnt in pontos_ref:
-                x_ref, y_ref = pnt
-                if abs(x - x_ref) < distProx and abs(y - y_ref) < distProx:
-                    pontos_teste += [[x,y,z]]
-                    break
+        total_pnts = 0
+        for xyz, lidos, tamanho in blocosXYZ(caminho):
+            total_pnts += len(xyz)
+            pontos_teste += [xyz[vizinhanca.mascara(xyz[:,0], xyz[:,1])]]
             if feedback.isCanceled():
                 break
-            cont += 1
-            feedback.setProgress(int(cont * total))
-        
+            feedback.setProgress(int(100.0*lidos/tamanho) if tamanho else 100)
+        pontos_teste = np.concatenate(pontos_teste) if pontos_teste else np.zeros((0,3))
+        feedback.pushInfo(self.tr('Total number of points: ', 'Número total de pontos: ') + '{}'.format(total_pnts))
+        feedback.pushInfo(self.tr('Filtered points: ', 'Pontos filtrados: ') + '{}'.format(len(pontos_teste)))
+        if not len(pontos_teste):
+            raise QgsProcessingException(self.tr('No point cloud points near the checkpoints!', 'Nenhum ponto da nuvem próximo aos pontos de verificação!'))
+
         # Cálculo das discrepâncias
         feedback.pushInfo(self.tr('Altimetric calculation...', 'Cálculo das discrepâncias altimétricas...'))
+        dist, ind = maisProximo3D(pontos_teste, np.column_stack((pontos_ref, cotas_ref)))
         DISCREP = []
         DISTANCES = []
-        total = 100.0 / source.featureCount() if source.featureCount() else 0
-        for w, feat in enumerate(source.getFeatures()):
-            geom = feat.geometry()
-            if coordTransf and crs != SRC:
-                geom.transform(coordinateTransf)
-            pnt = geom.asPoint()
-            z_ref = float(feat[columnIndex])
-            att = feat.attributes()
-            nearestPoint = (0,0,0)
-            distMin = 1e12
-            arquivo = open(caminho, 'r')
-            for teste in pontos_teste:
-                x = teste[0]
-                y = teste[1]
-                z = teste[2]
-                dist2 = QuadDist3D(QgsPoint(x, y, z), QgsPoint(pnt.x(), pnt.y(), z_ref))
-                if dist2 < distMin:
-                    distMin = dist2
-                    nearestPoint = (x,y,z)
-            arquivo.close()
-            discrep = nearestPoint[2] - float(z_ref)
+        total = 100.0 / len(cotas_ref) if len(cotas_ref) else 0
+        for w, att in enumerate(atributos):
+            x, y, z = pontos_teste[ind[w]]
+            discrep = z - cotas_ref[w]
             DISCREP += [discrep]
-            DISTANCES += [float(np.sqrt(distMin))]
+            DISTANCES += [float(dist[w])]
             fet = QgsFeature(Fields)
-            fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(float(nearestPoint[0]),float(nearestPoint[1]))))
-            fet.setAttributes(att + [float(np.sqrt(distMin)), float(nearestPoint[2]), float(discrep)])
+            fet.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(float(x), float(y))))
+            fet.setAttributes(att + [float(dist[w]), float(z), float(discrep)])
             sink.addFeature(fet, QgsFeatureSink.Flag.FastInsert)
             if feedback.isCanceled():
                 break
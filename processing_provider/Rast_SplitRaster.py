@@ -20,6 +20,7 @@ from qgis.core import (Qgis,
                        QgsProcessingException,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterBoolean,
+                       QgsProcessingParameterEnum,
                        QgsProcessingParameterFile,
                        QgsProcessingParameterNumber,
                        QgsProcessingParameterRasterLayer,
@@ -27,8 +28,8 @@ from qgis.core import (Qgis,
                        QgsProject,
                        QgsRasterLayer)
 
-from math import floor, ceil
 from osgeo import osr, gdal_array, gdal #https://gdal.org/python/
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
@@ -82,6 +83,9 @@ class SplitRaster(QgsProcessingAlgorithm):
     INPUT ='INPUT'
     VERTICAL = 'VERTICAL'
     HORIZONTAL = 'HORIZONTAL'
+    FORMAT = 'FORMAT'
+    PARALLEL = 'PARALLEL'
+    VRT = 'VRT'
     OUTPUT_FOLDER = 'OUTPUT_FOLDER'
     OPEN = 'OPEN'
 
@@ -115,6 +119,35 @@ class SplitRaster(QgsProcessingAlgorithm):
                 )
             )
 
+        formatos = [self.tr('GeoTIFF'),
+                    self.tr('Tiled GeoTIFF (DEFLATE compression)', 'GeoTIFF em blocos (compressão DEFLATE)'),
+                    self.tr('Cloud Optimized GeoTIFF - COG (DEFLATE compression)', 'GeoTIFF otimizado para nuvem - COG (compressão DEFLATE)')]
+
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.FORMAT,
+                self.tr('Output format', 'Formato de saída'),
+				options = formatos,
+                defaultValue= 0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.PARALLEL,
+                self.tr('Parallel processing', 'Processamento paralelo'),
+                defaultValue = False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.VRT,
+                self.tr('Create VRT index of the tiles', 'Criar índice VRT dos recortes'),
+                defaultValue = False
+            )
+        )
+
         # OUTPUT
         self.addParameter(
             QgsProcessingParameterFile(
@@ -165,61 +198,96 @@ class SplitRaster(QgsProcessingAlgorithm):
             context
         )
 
+        formato = self.parameterAsEnum(
+            parameters,
+            self.FORMAT,
+            context
+        )
+
+        Paralelo = self.parameterAsBool(
+            parameters,
+            self.PARALLEL,
+            context
+        )
+
+        criar_vrt = self.parameterAsBool(
+            parameters,
+            self.VRT,
+            context
+        )
+
         Carregar = self.parameterAsBool(
             parameters,
             self.OPEN,
             context
         )
 
-        # Abrir Raster layer como array
+        # Abrir Raster layer
         feedback.pushInfo(self.tr('Opening raster...', 'Abrindo raster...'))
         image = gdal.Open(RasterIN)
-        prj = image.GetProjection()
-        banda = image.GetRasterBand(1).ReadAsArray()
-        Pixel_Nulo = image.GetRasterBand(1).GetNoDataValue()
-        n_bands = image.RasterCount
-        # Origem e resolucao da imagem
-        geotransform  = image.GetGeoTransform()
-        ulx, xres, xskew, uly, yskew, yres  = geotransform
-        origem = [ulx, uly]
-        # Pegar tipo de dado do array
-        GDT = gdal_array.NumericTypeCodeToGDALTypeCode(banda.dtype)
+        n_lin = image.RasterYSize # numero de linhas
+        n_col = image.RasterXSize # numero de colunas
+        tipo = image.GetRasterBand(1).DataType
+        image = None # Close dataset
 
+        # Formato de saída
+        if formato == 0:
+            driver, opcoes = 'GTiff', []
+        elif formato == 1:
+            # Preditor horizontal (2) para inteiros e de ponto flutuante (3) para reais
+            preditor = 3 if gdal.GetDataTypeName(tipo).startswith('Float') else 2
+            driver, opcoes = 'GTiff', ['TILED=YES', 'COMPRESS=DEFLATE', 'PREDICTOR={}'.format(preditor), 'BIGTIFF=IF_SAFER']
+        else:
+            driver, opcoes = 'COG', ['COMPRESS=DEFLATE', 'PREDICTOR=YES', 'BIGTIFF=IF_SAFER']
 
         # Retalhar imagem
-        n_lin = image.RasterYSize # numero de linhas
-        n_col = image.RasterXSize # numero de colunas
-        linhas = np.round(np.linspace(0, n_lin, n_clip_lin+1))
-        colunas = np.round(np.linspace(0, n_col, n_clip_col+1))
-        lista = []
+        linhas = np.round(np.linspace(0, n_lin, n_clip_lin+1)).astype(int)
+        colunas = np.round(np.linspace(0, n_col, n_clip_col+1)).astype(int)
+        recortes = []
         for i in range(n_clip_lin):
             for j in range(n_clip_col):
                 new_name = nome + '_' + '{:02}'.format(j+1) +'_' + '{:02}'.format(i+1) + '.tif'
-                feedback.pushInfo(self.tr('Exporting file {} ...', 'Exportando arquivo {} ...').format(new_name))
                 Output = os.path.join(pasta_out, new_name)
-                cols = colunas[j+1] - colunas[j]
-                rows = linhas[i+1] - linhas[i]
-                ulx = origem[0] + abs(xres)*colunas[j]
-                uly = origem[1] - abs(yres)*linhas[i]
-                geotransform = [ulx, xres, 0, uly, 0, yres]
-                # Arquivo de saída
-                Driver = gdal.GetDriverByName('GTiff').Create(Output, int(cols), int(rows), n_bands, GDT)
-                Driver.SetGeoTransform(geotransform)
-                Driver.SetProjection(prj)
-
-                for k in range(n_bands):
-                    banda = image.GetRasterBand(k+1).ReadAsArray()
-                    split_banda = banda[int(linhas[i]):int(linhas[i+1]), int(colunas[j]):int(colunas[j+1])]
-                    outband = Driver.GetRasterBand(k+1)
-                    feedback.pushInfo(self.tr('Writing Band {}...'.format(k+1), 'Escrevendo Banda {}...'.format(k+1)))
-                    outband.WriteArray(split_banda)
-                    if Pixel_Nulo or Pixel_Nulo == 0:
-                        outband.SetNoDataValue(Pixel_Nulo)
-                    del banda, split_banda
-                lista += [Output]
-                Driver.FlushCache() # write to disk
-                Driver = None  # save, close
-        image = None # Close dataset
+                janela = [colunas[j], linhas[i], colunas[j+1] - colunas[j], linhas[i+1] - linhas[i]]
+                recortes += [(Output, janela)]
+
+        def exportar(recorte):
+            # Cada recorte abre o seu próprio dataset GDAL
+            Output, janela = recorte
+            ds = gdal.Translate(Output, RasterIN, srcWin = [int(v) for v in janela], format = driver, creationOptions = opcoes)
+            ds = None  # save, close
+            return Output
+
+        lista = []
+        total = 100.0/len(recortes)
+        if Paralelo:
+            n_workers = os.cpu_count() or 1
+            feedback.pushInfo(self.tr('Exporting files with {} threads...', 'Exportando arquivos com {} threads...').format(n_workers))
+            with ThreadPoolExecutor(max_workers = n_workers) as executor:
+                futuros = [executor.submit(exportar, recorte) for recorte in recortes]
+                for current, futuro in enumerate(as_completed(futuros)):
+                    lista += [futuro.result()]
+                    if feedback.isCanceled():
+                        for futuro in futuros:
+                            futuro.cancel()
+                        break
+                    feedback.setProgress(int((current+1) * total))
+            concluidos = set(lista)
+            lista = [recorte[0] for recorte in recortes if recorte[0] in concluidos]
+        else:
+            for current, recorte in enumerate(recortes):
+                feedback.pushInfo(self.tr('Exporting file {} ...', 'Exportando arquivo {} ...').format(os.path.basename(recorte[0])))
+                lista += [exportar(recorte)]
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(int((current+1) * total))
+
+        # Índice VRT dos recortes
+        if criar_vrt and lista:
+            vrt_path = os.path.join(pasta_out, nome + '.vrt')
+            feedback.pushInfo(self.tr('Creating VRT index {} ...', 'Criando índice VRT {} ...').format(vrt_path))
+            vrt = gdal.BuildVRT(vrt_path, lista)
+            vrt = None
 
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
@@ -31,6 +31,7 @@ from qgis.core import (Qgis,
 from osgeo import osr, gdal_array, gdal #https://gdal.org/python/
 import numpy as np
 from lftools.geocapt.imgs import Imgs
+from lftools.geocapt.dip import FontePoligonos, MascaraPoligonos
 from lftools.translations.translate import translate
 import os
 from qgis.PyQt.QtGui import QIcon
@@ -126,14 +127,6 @@ class CreateHolesInRaster(QgsProcessingAlgorithm):
 
     def processAlgorithm(self, parameters, context, feedback):
 
-        from lftools.dependencies import ensure_matplotlib
-        path = ensure_matplotlib(feedback)
-        if path is None:
-            raise QgsProcessingException(
-                "The 'matplotlib' library is required for this tool but could not be installed automatically. "
-                "Please install it manually using: pip install matplotlib"
-            )
-
         RasterIN = self.parameterAsRasterLayer(
             parameters,
             self.RasterIN,
@@ -163,7 +156,7 @@ class CreateHolesInRaster(QgsProcessingAlgorithm):
             context
         )
 
-        # Abrir Raster layer como array
+        # Abrir Raster layer
         image = gdal.Open(RasterIN)
         prj=image.GetProjection()
         CRS=osr.SpatialReference(wkt=prj)
@@ -171,32 +164,12 @@ class CreateHolesInRaster(QgsProcessingAlgorithm):
         n_bands = image.RasterCount # Número de bandas
         cols = image.RasterXSize # Number of columns
         rows = image.RasterYSize # Number of rows
-        # Origem e resolucao da imagem
-        ulx, xres, xskew, uly, yskew, yres  = geotransform
-        origem = (ulx, uly)
-        resol_X = abs(xres)
-        resol_Y = abs(yres)
-        if n_bands > 1:
-            feedback.pushInfo(self.tr('Opening Band R...', 'Abrindo Banda R...'))
-            band1 = image.GetRasterBand(1).ReadAsArray()
-            feedback.pushInfo(self.tr('Opening Band G...', 'Abrindo Banda G...'))
-            band2 = image.GetRasterBand(2).ReadAsArray()
-            feedback.pushInfo(self.tr('Opening Band B...', 'Abrindo Banda B...'))
-            band3 = image.GetRasterBand(3).ReadAsArray()
-        else:
-            feedback.pushInfo(self.tr('Opening band...', 'Abrindo banda...'))
-            band1 = image.GetRasterBand(1).ReadAsArray()
-        # Transparência
-        if n_bands == 4:
-            feedback.pushInfo(self.tr('Opening Band Alpha...', 'Abrindo Banda Alfa...'))
-            band4 = image.GetRasterBand(4).ReadAsArray()
+        if n_bands not in (1, 3, 4):
+            raise QgsProcessingException(self.tr('The raster layer must have 1, 3 or 4 bands!', 'A camada raster deve ter 1, 3 ou 4 bandas!'))
+        GDT = image.GetRasterBand(1).DataType
         Pixel_Nulo = image.GetRasterBand(1).GetNoDataValue()
         if Pixel_Nulo == None:
             Pixel_Nulo = 0
-        image=None # Fechar imagem
-
-        # Remendos
-        total = 100.0 /layer.featureCount() if layer.featureCount() else 0
 
         # Transformação de coordenadas
         crsSrc = layer.sourceCrs()
@@ -207,89 +180,47 @@ class CreateHolesInRaster(QgsProcessingAlgorithm):
         else:
             transf_SRC = False
 
-        for cont, feat in enumerate(layer.getFeatures()):
+        # Polígonos dos buracos em camada de memória para rasterização
+        feedback.pushInfo(self.tr('Rasterizing holes...', 'Rasterizando buracos...'))
+        wkts = []
+        for feat in layer.getFeatures():
             geom = feat.geometry()
             if transf_SRC:
                 geom.transform(coordTransf)
-            coords = geom.asPolygon()[0]
-            caminho = []
-            for ponto in coords:
-                linha = (origem[1]-ponto.y())/resol_Y
-                coluna = (ponto.x() - origem[0])/resol_X
-                caminho += [(linha, coluna)]
-            p = path.Path(caminho)
-            box = geom.boundingBox()
-            uly = box.yMaximum()
-            lry = box.yMinimum()
-            ulx = box.xMinimum()
-            lrx = box.xMaximum()
-
-            # Limites de Varredura
-            row_ini = int(round((origem[1]-uly)/resol_Y - 0.5))-1
-            row_fim = int(round((origem[1]-lry)/resol_Y - 0.5))+1
-            col_ini = int(round((ulx - origem[0])/resol_X - 0.5))-1
-            col_fim = int(round((lrx - origem[0])/resol_X - 0.5))+1
-
-            # Varrer Raster
-            if n_bands == 4:
-                for lin in range(row_ini, row_fim):
-                    for col in range(col_ini, col_fim):
-                        pixel = (lin+0.5, col+0.5)
-                        if p.contains_points([pixel]):
-                            band4[lin][col] = 0
-            elif n_bands == 3:
-                for lin in range(row_ini, row_fim):
-                    for col in range(col_ini, col_fim):
-                        pixel = (lin+0.5, col+0.5)
-                        if p.contains_points([pixel]):
-                            band1[lin][col] = Pixel_Nulo
-                            band2[lin][col] = Pixel_Nulo
-                            band3[lin][col] = Pixel_Nulo
-            elif n_bands == 1:
-                for lin in range(row_ini, row_fim):
-                    for col in range(col_ini, col_fim):
-                        pixel = (lin+0.5, col+0.5)
-                        if p.contains_points([pixel]):
-                            band1[lin][col] = Pixel_Nulo
-
-            feedback.setProgress(int(cont * total))
-
-        # Criar imagem RGB
-        feedback.pushInfo(self.tr('Saving Raster...', 'Salvando Raster...'))
-        GDT = gdal_array.NumericTypeCodeToGDALTypeCode(band1.dtype)
-        if n_bands == 4:
-            RGB = gdal.GetDriverByName('GTiff').Create(RGB_Output, cols, rows, 4, GDT)
-        elif n_bands == 3:
-            RGB = gdal.GetDriverByName('GTiff').Create(RGB_Output, cols, rows, 3, GDT)
-        elif n_bands == 1:
-            RGB = gdal.GetDriverByName('GTiff').Create(RGB_Output, cols, rows, 1, GDT)
+            wkts += [geom.asWkt()]
+        poligonos = FontePoligonos(wkts, prj)
+
+        # Criar imagem de saída
+        RGB = gdal.GetDriverByName('GTiff').Create(RGB_Output, cols, rows, n_bands, GDT)
         RGB.SetGeoTransform(geotransform)    # specify coords
         RGB.SetProjection(CRS.ExportToWkt()) # export coords to file
-        if n_bands >= 3:
-            feedback.pushInfo(self.tr('Writing Band R...', 'Escrevendo Banda R...'))
-            bandaR = RGB.GetRasterBand(1)
-            bandaR.WriteArray(band1)
-            feedback.pushInfo(self.tr('Writing Band G...', 'Escrevendo Banda G...'))
-            bandaG = RGB.GetRasterBand(2)
-            bandaG.WriteArray(band2)
-            feedback.pushInfo(self.tr('Writing Band B...', 'Escrevendo Banda B...'))
-            bandaB = RGB.GetRasterBand(3)
-            bandaB.WriteArray(band3)
-            if n_bands == 4:
-                feedback.pushInfo(self.tr('Writing Alpha Band...', 'Escrevendo Banda Alfa...'))
-                bandaAlpha = RGB.GetRasterBand(4)
-                bandaAlpha.WriteArray(band4)
-            else:
-                bandaR.SetNoDataValue(Pixel_Nulo)
-                bandaG.SetNoDataValue(Pixel_Nulo)
-                bandaB.SetNoDataValue(Pixel_Nulo)
-        elif n_bands == 1:
-            feedback.pushInfo(self.tr('Writing raster band...', 'Escrevendo banda do raster...'))
-            bandaR = RGB.GetRasterBand(1)
-            bandaR.WriteArray(band1)
-            bandaR.SetNoDataValue(Pixel_Nulo)
+        if n_bands != 4:
+            for k in range(n_bands):
+                RGB.GetRasterBand(k+1).SetNoDataValue(Pixel_Nulo)
+
+        # Varrer Raster em blocos de linhas
+        bloco = max(1, int(2**22/cols))
+        total = 100.0/rows
+        for lin in range(0, rows, bloco):
+            n_lin = min(bloco, rows - lin)
+            mascara = MascaraPoligonos(poligonos, geotransform, 0, lin, cols, n_lin)
+            for k in range(n_bands):
+                banda = image.GetRasterBand(k+1).ReadAsArray(0, lin, cols, n_lin)
+                if n_bands == 4:
+                    if k == 3:
+                        banda[mascara] = 0
+                else:
+                    banda[mascara] = Pixel_Nulo
+                RGB.GetRasterBand(k+1).WriteArray(banda, 0, lin)
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(int((lin + n_lin) * total))
+
+        image=None # Fechar imagem
+        feedback.pushInfo(self.tr('Saving Raster...', 'Salvando Raster...'))
         RGB.FlushCache()   # Escrever no disco
         RGB = None   # Salvar e fechar
+        poligonos = None
 
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
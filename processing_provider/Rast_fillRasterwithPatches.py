@@ -28,9 +28,8 @@ from qgis.core import (Qgis,
                        QgsRasterLayer)
 
 from osgeo import osr, gdal_array, gdal #https://gdal.org/python/
-from math import floor, ceil
 import numpy as np
-from lftools.geocapt.dip import Interpolar
+from lftools.geocapt.dip import InterpolarArray
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
 import os
@@ -178,7 +177,7 @@ class FillRasterwithPatches(QgsProcessingAlgorithm):
 
         #limiar = 240
 
-        # Abrir Raster layer como array
+        # Abrir Raster layer
         image = gdal.Open(RasterIN)
         prj=image.GetProjection()
         CRS=osr.SpatialReference(wkt=prj)
@@ -186,147 +185,100 @@ class FillRasterwithPatches(QgsProcessingAlgorithm):
         n_bands = image.RasterCount # Número de bandas
         cols = image.RasterXSize # Number of columns
         rows = image.RasterYSize # Number of rows
+        if n_bands not in (1, 3, 4):
+            raise QgsProcessingException(self.tr('The raster layer must have 1, 3 or 4 bands!', 'A camada raster deve ter 1, 3 ou 4 bandas!'))
         # Origem e resolucao da imagem
         ulx, xres, xskew, uly, yskew, yres  = geotransform
         origem = (ulx, uly)
         resol_X = abs(xres)
         resol_Y = abs(yres)
-        if n_bands ==1:
-            feedback.pushInfo(self.tr('Opening raster band...', 'Abrindo banda do raster...'))
-            band1 = image.GetRasterBand(1).ReadAsArray()
-        if n_bands >=3:
-            feedback.pushInfo(self.tr('Opening Band R...', 'Abrindo Banda R...'))
-            band1 = image.GetRasterBand(1).ReadAsArray()
-            feedback.pushInfo(self.tr('Opening Band G...', 'Abrindo Banda G...'))
-            band2 = image.GetRasterBand(2).ReadAsArray()
-            feedback.pushInfo(self.tr('Opening Band B...', 'Abrindo Banda B...'))
-            band3 = image.GetRasterBand(3).ReadAsArray()
-        # Transparência
-        if n_bands == 4:
-            feedback.pushInfo(self.tr('Opening Band Alpha...', 'Abrindo Banda Alfa...'))
-            band4 = image.GetRasterBand(4).ReadAsArray()
+        GDT = image.GetRasterBand(1).DataType
         Pixel_Nulo = image.GetRasterBand(1).GetNoDataValue()
         if Pixel_Nulo == None:
             Pixel_Nulo = 0
-        image=None # Fechar imagem
-
-        # Número de pixels para processamento
-        TAM =  0
-        for Remendo in PatchesLayers:
-            Rem_Path = Remendo.dataProvider().dataSourceUri()
-            Rem = gdal.Open(Rem_Path)
-        #    Rem_cols = Rem.RasterXSize # Number of columns
-            Rem_rows = Rem.RasterYSize # Number of rows
-            TAM += Rem_rows
 
         # Remendos
-        total = 100.0 / TAM
-        cont = 0
+        remendos = []
         for Remendo in PatchesLayers:
-            feedback.pushInfo((self.tr('Processing Layer: {}', 'Processando Camada: {}')).format(Remendo))
-            Rem_Path = Remendo.dataProvider().dataSourceUri()
-            Rem = gdal.Open(Rem_Path)
+            Rem = gdal.Open(Remendo.dataProvider().dataSourceUri())
             ulx, xres, xskew, uly, yskew, yres  = Rem.GetGeoTransform()
-            Rem_origem = (ulx, uly)
-            Rem_resol_X = abs(xres)
-            Rem_resol_Y = abs(yres)
             Rem_cols = Rem.RasterXSize # Number of columns
             Rem_rows = Rem.RasterYSize # Number of rows
             lrx = ulx + (Rem_cols * xres)
             lry = uly + (Rem_rows * yres)
-            bbox = [ulx, lrx, lry, uly]
             Rem_nulo = Rem.GetRasterBand(1).GetNoDataValue()
             if Rem_nulo == None:
                 Rem_nulo = 0
-            Rem_band1 = Rem.GetRasterBand(1).ReadAsArray()
-            if n_bands >1:
-                Rem_band2 = Rem.GetRasterBand(2).ReadAsArray()
-                Rem_band3 = Rem.GetRasterBand(3).ReadAsArray()
-
             # Limites de Varredura
-            row_ini = int(round((origem[1]-uly)/resol_Y - 0.5))
-            row_fim = int(round((origem[1]-lry)/resol_Y - 0.5))
-            col_ini = int(round((ulx - origem[0])/resol_X - 0.5))
-            col_fim = int(round((lrx - origem[0])/resol_X - 0.5))
-            # Varrer Raster
-            if n_bands == 4:
-                for lin in range(row_ini, row_fim):
-                    for col in range(col_ini, col_fim):
-                        px_value = band4[lin][col]
-                        if px_value == 0: # or band1[lin][col] > limiar: # Verificar Limiar
-                            X = origem[0] + resol_X*(col + 0.5)
-                            Y = origem[1] - resol_Y*(lin + 0.5)
-                            R = Interpolar(X, Y, Rem_band1, Rem_origem, Rem_resol_X, Rem_resol_Y, reamostragem, Rem_nulo)
-                            G = Interpolar(X, Y, Rem_band2, Rem_origem, Rem_resol_X, Rem_resol_Y, reamostragem, Rem_nulo)
-                            B = Interpolar(X, Y, Rem_band3, Rem_origem, Rem_resol_X, Rem_resol_Y, reamostragem, Rem_nulo)
-                            if R != Rem_nulo:
-                                band1[lin][col] = R
-                            if G != Rem_nulo:
-                                band2[lin][col] = G
-                            if B != Rem_nulo:
-                                band3[lin][col] = B
-                    cont += 1
-                    feedback.setProgress(int(cont * total))
-                    if feedback.isCanceled():
-                        break
-            elif n_bands == 3:
-                for lin in range(row_ini, row_fim):
-                    for col in range(col_ini, col_fim):
-                        px_value = band1[lin][col]
-                        if px_value == Pixel_Nulo: # or band1[lin][col] > limiar: # Verificar Limiar
-                            X = origem[0] + resol_X*(col + 0.5)
-                            Y = origem[1] - resol_Y*(lin + 0.5)
-                            R = Interpolar(X, Y, Rem_band1, Rem_origem, Rem_resol_X, Rem_resol_Y, reamostragem, Rem_nulo)
-                            G = Interpolar(X, Y, Rem_band2, Rem_origem, Rem_resol_X, Rem_resol_Y, reamostragem, Rem_nulo)
-                            B = Interpolar(X, Y, Rem_band3, Rem_origem, Rem_resol_X, Rem_resol_Y, reamostragem, Rem_nulo)
-                            if R != Rem_nulo:
-                                band1[lin][col] = R
-                            if G != Rem_nulo:
-                                band2[lin][col] = G
-                            if B != Rem_nulo:
-                                band3[lin][col] = B
-                    cont += 1
-                    feedback.setProgress(int(cont * total))
-                    if feedback.isCanceled():
-                        break
-            elif n_bands == 1:
-                for lin in range(row_ini, row_fim):
-                    for col in range(col_ini, col_fim):
-                        px_value = band1[lin][col]
-                        if px_value == Pixel_Nulo: # or band1[lin][col] > limiar: # Verificar Limiar
-                            X = origem[0] + resol_X*(col + 0.5)
-                            Y = origem[1] - resol_Y*(lin + 0.5)
-                            band1[lin][col] = Interpolar(X, Y, Rem_band1, Rem_origem, Rem_resol_X, Rem_resol_Y, reamostragem, Rem_nulo)
-                    cont += 1
-                    feedback.setProgress(int(cont * total))
-                    if feedback.isCanceled():
-                        break
-            Rem = None # Fechar imagem
-
-        # Criar imagem RGB
-        feedback.pushInfo(self.tr('Saving Raster...', 'Salvando Raster...'))
-        GDT = gdal_array.NumericTypeCodeToGDALTypeCode(band1.dtype)
-        if n_bands ==1:
-            RASTER = gdal.GetDriverByName('GTiff').Create(RGB_Output, cols, rows, 1, GDT)
-        else:
-            RASTER = gdal.GetDriverByName('GTiff').Create(RGB_Output, cols, rows, 3, GDT)
+            remendos += [{'image': Rem,
+                          'origem': (ulx, uly),
+                          'xres': abs(xres),
+                          'yres': abs(yres),
+                          'cols': Rem_cols,
+                          'rows': Rem_rows,
+                          'nulo': Rem_nulo,
+                          'row_ini': max(int(round((origem[1]-uly)/resol_Y - 0.5)), 0),
+                          'row_fim': min(int(round((origem[1]-lry)/resol_Y - 0.5)), rows),
+                          'col_ini': max(int(round((ulx - origem[0])/resol_X - 0.5)), 0),
+                          'col_fim': min(int(round((lrx - origem[0])/resol_X - 0.5)), cols)}]
+
+        # Criar imagem de saída
+        n_out = 1 if n_bands == 1 else 3
+        RASTER = gdal.GetDriverByName('GTiff').Create(RGB_Output, cols, rows, n_out, GDT)
         RASTER.SetGeoTransform(geotransform)    # specify coords
         RASTER.SetProjection(CRS.ExportToWkt()) # export coords to file
         if n_bands ==1:
-            feedback.pushInfo(self.tr('Writing rater band...', 'Escrevendo banda do raster...'))
-            banda = RASTER.GetRasterBand(1)
-            banda.WriteArray(band1)
-            banda.SetNoDataValue(Pixel_Nulo)
-        else:
-            feedback.pushInfo(self.tr('Writing Band R...', 'Escrevendo Banda R...'))
-            bandaR = RASTER.GetRasterBand(1)
-            bandaR.WriteArray(band1)
-            feedback.pushInfo(self.tr('Writing Band G...', 'Escrevendo Banda G...'))
-            bandaG = RASTER.GetRasterBand(2)
-            bandaG.WriteArray(band2)
-            feedback.pushInfo(self.tr('Writing Band B...', 'Escrevendo Banda B...'))
-            bandaB = RASTER.GetRasterBand(3)
-            bandaB.WriteArray(band3)
+            RASTER.GetRasterBand(1).SetNoDataValue(Pixel_Nulo)
+
+        # Varrer Raster em blocos de linhas
+        bloco = max(1, int(2**22/cols))
+        total = 100.0/rows
+        for lin in range(0, rows, bloco):
+            n_lin = min(bloco, rows - lin)
+            bandas = [image.GetRasterBand(k+1).ReadAsArray(0, lin, cols, n_lin) for k in range(n_bands)]
+            for rem in remendos:
+                r0 = max(rem['row_ini'], lin)
+                r1 = min(rem['row_fim'], lin + n_lin)
+                c0, c1 = rem['col_ini'], rem['col_fim']
+                if r1 <= r0 or c1 <= c0:
+                    continue
+                # Pixels vazios na região do remendo
+                if n_bands == 4:
+                    vazio = bandas[3][r0-lin:r1-lin, c0:c1] == 0
+                else:
+                    vazio = bandas[0][r0-lin:r1-lin, c0:c1] == Pixel_Nulo
+                if not vazio.any():
+                    continue
+                LIN, COL = np.nonzero(vazio)
+                LIN += r0
+                COL += c0
+                X = origem[0] + resol_X*(COL + 0.5)
+                Y = origem[1] - resol_Y*(LIN + 0.5)
+                # Janela do remendo que cobre os pixels, com margem para a interpolação
+                Rem_c0 = max(int(np.floor((X.min() - rem['origem'][0])/rem['xres'])) - 2, 0)
+                Rem_c1 = min(int(np.ceil((X.max() - rem['origem'][0])/rem['xres'])) + 2, rem['cols'])
+                Rem_r0 = max(int(np.floor((rem['origem'][1] - Y.max())/rem['yres'])) - 2, 0)
+                Rem_r1 = min(int(np.ceil((rem['origem'][1] - Y.min())/rem['yres'])) + 2, rem['rows'])
+                if Rem_c1 <= Rem_c0 or Rem_r1 <= Rem_r0:
+                    continue
+                Rem_origem = (rem['origem'][0] + Rem_c0*rem['xres'], rem['origem'][1] - Rem_r0*rem['yres'])
+                for k in range(n_out):
+                    Rem_band = rem['image'].GetRasterBand(k+1).ReadAsArray(Rem_c0, Rem_r0, Rem_c1 - Rem_c0, Rem_r1 - Rem_r0)
+                    valores = InterpolarArray(X, Y, Rem_band, Rem_origem, rem['xres'], rem['yres'], reamostragem, rem['nulo'])
+                    if n_bands == 1:
+                        bandas[0][LIN - lin, COL] = valores
+                    else:
+                        ok = valores != rem['nulo']
+                        bandas[k][LIN[ok] - lin, COL[ok]] = valores[ok]
+            for k in range(n_out):
+                RASTER.GetRasterBand(k+1).WriteArray(bandas[k], 0, lin)
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(int((lin + n_lin) * total))
+
+        image = None # Fechar imagem
+        for rem in remendos:
+            rem['image'] = None
 
         feedback.pushInfo(self.tr('Saving raster...', 'Salvando raster...'))
         RASTER.FlushCache()   # Escrever no disco
@@ -27,6 +27,7 @@ from qgis.core import (Qgis,
                        QgsApplication,
                        QgsProject,
                        QgsRasterLayer,
+                       QgsSpatialIndex,
                        QgsCoordinateTransform,
                        QgsCoordinateReferenceSystem)
 
@@ -34,6 +35,7 @@ from osgeo import osr, gdal_array, gdal #https://gdal.org/python/
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
 from lftools.geocapt.cartography import reprojectPoints
+from lftools.geocapt.footprints import indexarRasters, rastersNaExtensao
 import os, shutil
 import numpy as np
 from qgis.PyQt.QtGui import QIcon
@@ -193,19 +195,34 @@ class LoadRasterByLocation(QgsProcessingAlgorithm):
                 if item[-1*len(formato):] == formato:
                     lista += [os.path.join(pasta, item)]
 
-        total = 100.0 / len(lista) if len(lista)>0 else 0
+        # Indexar extensões dos rasters (apenas arquivos novos ou modificados são abertos)
+        feedback.pushInfo(self.tr('Indexing raster footprints...', 'Indexando extensões dos rasters...'))
+        footprints = indexarRasters(lista, feedback)
+
+        # Candidatos pela extensão da camada vetorial em WGS84
+        WGS84 = QgsCoordinateReferenceSystem('EPSG:4326')
+        extensao = QgsGeometry.fromRect(source.sourceExtent()).densifyByCount(10)
+        if crs != WGS84:
+            extensao.transform(QgsCoordinateTransform(crs, WGS84, QgsProject.instance()))
+        box = extensao.boundingBox()
+        candidatos = rastersNaExtensao(list(footprints.keys()), box.xMinimum(), box.xMaximum(), box.yMinimum(), box.yMaximum())
+
+        # Índice espacial das feições
+        index = QgsSpatialIndex()
+        feicoes = {}
+        for feat in source.getFeatures():
+            index.addFeature(feat)
+            feicoes[feat.id()] = feat.geometry()
 
         # Verify raster to be loaded
         feedback.pushInfo(self.tr('Verifying raster files...', 'Verificando arquivos raster...'))
+        total = 100.0 / len(candidatos) if len(candidatos)>0 else 0
         selecao = []
-        for current, file_path in enumerate(lista):
+        for current, file_path in enumerate(candidatos):
             try:
-                image = gdal.Open(file_path)
-                prj = image.GetProjection() # wkt
-                ulx, xres, xskew, uly, yskew, yres = image.GetGeoTransform()
-                cols = image.RasterXSize # Number of columns
-                rows = image.RasterYSize # Number of rows
-                image=None # Close image
+                meta = footprints[file_path]
+                ulx, xres, uly, yres = meta['ulx'], meta['xres'], meta['uly'], meta['yres']
+                cols, rows = meta['cols'], meta['rows']
 
                 # Creating BBox
                 coord = [[QgsPointXY(ulx, uly),
@@ -216,28 +233,30 @@ class LoadRasterByLocation(QgsProcessingAlgorithm):
                 geom = QgsGeometry.fromPolygonXY(coord)
 
                 # CRS transformation
-                CRS= QgsCoordinateReferenceSystem(prj) # Create image CRS
+                CRS= QgsCoordinateReferenceSystem(meta['crs']) # Create image CRS
                 coordinateTransformer = QgsCoordinateTransform()
                 coordinateTransformer.setDestinationCrs(crs)
                 coordinateTransformer.setSourceCrs(CRS)
                 geom_transf = reprojectPoints(geom, coordinateTransformer)
+                if geom_transf is None:
+                    raise ValueError(file_path)
 
-                for feat in source.getFeatures():
-                    if geom_transf.intersects(feat.geometry()):
+                for fid in index.intersects(geom_transf.boundingBox()):
+                    if geom_transf.intersects(feicoes[fid]):
                         selecao += [file_path]
                         break
-
-                if saida and os.path.exists(saida):
-                    for caminho in selecao:
-                        head, tail = os.path.split(caminho)
-                        shutil.copy2(caminho, os.path.join(saida, tail))
-            except:
+            except Exception:
                 feedback.pushInfo(self.tr('Problem opening the file: {}'.format(file_path), 'Problema para abrir o arquivo: {}'.format(file_path)))
 
             if feedback.isCanceled():
                 break
             feedback.setProgress(int((current+1) * total))
 
+        if saida and os.path.exists(saida):
+            for caminho in selecao:
+                head, tail = os.path.split(caminho)
+                shutil.copy2(caminho, os.path.join(saida, tail))
+
         self.LISTA = selecao
         self.FORMATO = formato
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
@@ -30,6 +30,8 @@ from qgis.core import (Qgis,
                        QgsApplication,
                        QgsProject,
                        QgsRasterLayer,
+                       QgsRectangle,
+                       QgsSpatialIndex,
                        QgsCoordinateReferenceSystem)
 
 from osgeo import osr, gdal_array, gdal #https://gdal.org/python/
@@ -37,7 +39,8 @@ from itertools import combinations
 import numpy as np
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
-from lftools.geocapt.dip import Interpolar
+from lftools.geocapt.dip import InterpolarArray
+from lftools.geocapt.footprints import indexarRasters, metadadosRaster
 import os
 from qgis.PyQt.QtGui import QIcon
 
@@ -96,6 +99,7 @@ class MosaicRaster(QgsProcessingAlgorithm):
     NULLVALUE = 'NULLVALUE'
     RESAMPLING = 'RESAMPLING'
     FRAME = 'FRAME'
+    WINDOWED = 'WINDOWED'
     MOSAIC = 'MOSAIC'
     OPEN = 'OPEN'
 
@@ -166,6 +170,14 @@ class MosaicRaster(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.WINDOWED,
+                self.tr('Windowed processing (low memory)', 'Processamento em janelas (pouca memória)'),
+                defaultValue= False
+            )
+        )
+
         # OUTPUT
         self.addParameter(
             QgsProcessingParameterFileDestination(
@@ -235,6 +247,12 @@ class MosaicRaster(QgsProcessingAlgorithm):
             context
         )
 
+        janelado = self.parameterAsBool(
+            parameters,
+            self.WINDOWED,
+            context
+        )
+
         # output
 
         Output = self.parameterAsFileOutput(
@@ -265,18 +283,23 @@ class MosaicRaster(QgsProcessingAlgorithm):
         GDT = []
         nulos = []
         XRES, YRES = [], []
+        GEOTRANSF, SIZES = [], []
+        footprints = indexarRasters(lista)
         for item in lista:
-            image = gdal.Open(item)
-            SRC += [QgsCoordinateReferenceSystem(image.GetProjection())] # wkt
-            ulx, xres, xskew, uly, yskew, yres  = image.GetGeoTransform()
-            cols = image.RasterXSize
-            rows = image.RasterYSize
-            n_bands += [image.RasterCount]
-            GDT += [image.GetRasterBand(1).DataType]
-            nulos += [image.GetRasterBand(1).GetNoDataValue()]
+            meta = footprints.get(os.path.abspath(item)) or metadadosRaster(item)
+            if meta is None:
+                raise QgsProcessingException(self.tr('Problem opening the file: {}'.format(item), 'Problema para abrir o arquivo: {}'.format(item)))
+            SRC += [QgsCoordinateReferenceSystem(meta['crs'])] # wkt
+            ulx, xres, uly, yres = meta['ulx'], meta['xres'], meta['uly'], meta['yres']
+            cols = meta['cols']
+            rows = meta['rows']
+            n_bands += [meta['bands']]
+            GDT += [meta['datatype']]
+            nulos += [meta['nodata']]
             XRES += [xres]
             YRES += [yres]
-            image=None # Close image
+            GEOTRANSF += [(ulx, xres, uly, yres)]
+            SIZES += [(cols, rows)]
             # Creating BBox
             coord = [[QgsPointXY(ulx, uly),
                       QgsPointXY(ulx+cols*xres, uly),
@@ -378,6 +401,116 @@ class MosaicRaster(QgsProcessingAlgorithm):
         origem = (ulx, uly)
         resol_X = abs(xres)
         resol_Y = abs(yres)
+        if janelado:
+            # Mosaico em janelas: apenas as janelas das imagens que sobrepõem cada bloco de saída são lidas
+            tipo = gdal_array.GDALTypeCodeToNumericTypeCode(GDT)
+            inteiro = True if GDT in (gdal.GDT_Byte,
+                                      gdal.GDT_UInt16,
+                                      gdal.GDT_Int16,
+                                      gdal.GDT_UInt32,
+                                      gdal.GDT_Int32) else False
+            if vlayer:
+                if moldura_geom.isMultipart():
+                    coords = moldura_geom.asMultiPolygon()[0][0]
+                else:
+                    coords = moldura_geom.asPolygon()[0]
+                moldura_path = path.Path([(ponto.x(), ponto.y()) for ponto in coords])
+
+            Driver = gdal.GetDriverByName('GTiff').Create(Output, n_col, n_lin, n_bands, GDT, ['TILED=YES', 'BIGTIFF=IF_SAFER'])
+            Driver.SetGeoTransform(geotransform)
+            Driver.SetProjection(prj)
+            for k in range(n_bands):
+                Driver.GetRasterBand(k+1).Fill(valor_nulo)
+                if NULO != -1:
+                    Driver.GetRasterBand(k+1).SetNoDataValue(valor_nulo)
+
+            # Índice espacial das extensões das imagens
+            index = QgsSpatialIndex()
+            for ind, geom in enumerate(geoms):
+                index.addFeature(ind, geom.boundingBox())
+
+            bloco = 1024
+            blocos = [(lin, col) for lin in range(0, n_lin, bloco) for col in range(0, n_col, bloco)]
+            Percent = 100.0/len(blocos)
+            feedback.pushInfo(self.tr('Mosaicking {} blocks...', 'Mosaicando {} blocos...').format(len(blocos)))
+            for current, (lin, col) in enumerate(blocos):
+                b_lin = min(bloco, n_lin - lin)
+                b_col = min(bloco, n_col - col)
+                # Coordenadas dos centros dos pixels do bloco
+                X = origem[0] + resol_X*(np.arange(col, col + b_col) + 0.5)
+                Y = origem[1] - resol_Y*(np.arange(lin, lin + b_lin) + 0.5)
+                X, Y = np.meshgrid(X, Y)
+                if vlayer:
+                    dentro = moldura_path.contains_points(np.column_stack((X.ravel(), Y.ravel()))).reshape(b_lin, b_col)
+                    if not dentro.any():
+                        feedback.setProgress(int((current+1) * Percent))
+                        continue
+                x_min_b, x_max_b = origem[0] + resol_X*col, origem[0] + resol_X*(col + b_col)
+                y_max_b, y_min_b = origem[1] - resol_Y*lin, origem[1] - resol_Y*(lin + b_lin)
+                # Valores interpolados de cada imagem que sobrepõe o bloco
+                valores_img = []
+                for ind in sorted(index.intersects(QgsRectangle(x_min_b, y_min_b, x_max_b, y_max_b))):
+                    img_path = lista[ind]
+                    img_ulx, img_xres, img_uly, img_yres = GEOTRANSF[ind]
+                    img_cols, img_rows = SIZES[ind]
+                    img_xres, img_yres = abs(img_xres), abs(img_yres)
+                    # Janela da imagem com margem para a interpolação
+                    c0 = max(int(np.floor((x_min_b - img_ulx)/img_xres)) - 2, 0)
+                    c1 = min(int(np.ceil((x_max_b - img_ulx)/img_xres)) + 2, img_cols)
+                    r0 = max(int(np.floor((img_uly - y_max_b)/img_yres)) - 2, 0)
+                    r1 = min(int(np.ceil((img_uly - y_min_b)/img_yres)) + 2, img_rows)
+                    if c1 <= c0 or r1 <= r0:
+                        continue
+                    image = gdal.Open(img_path)
+                    janela = image.ReadAsArray(c0, r0, c1 - c0, r1 - r0)
+                    image = None
+                    if janela.ndim == 2:
+                        janela = janela[np.newaxis, :, :]
+                    img_origem = (img_ulx + c0*img_xres, img_uly - r0*img_yres)
+                    valores_img += [np.stack([InterpolarArray(X, Y, janela[k], img_origem, img_xres, img_yres, reamostragem, valor_nulo) for k in range(n_bands)])]
+                if not valores_img:
+                    feedback.setProgress(int((current+1) * Percent))
+                    continue
+                valores_img = np.stack(valores_img) # (imagens, bandas, linhas, colunas)
+                nulos_img = (valores_img == valor_nulo).any(axis=1)
+                # Regra de sobreposição (0:first, 1:average, 2:median, 3:min, 4:max)
+                if sobrep == 0:
+                    primeira = np.argmax(~nulos_img, axis=0)
+                    result = np.take_along_axis(valores_img, primeira[np.newaxis, np.newaxis, :, :], axis=0)[0]
+                    valido = ~nulos_img.all(axis=0)
+                else:
+                    valores_img[np.broadcast_to(nulos_img[:, np.newaxis, :, :], valores_img.shape)] = np.nan
+                    valido = ~nulos_img.all(axis=0)
+                    valores_img[:, :, ~valido] = 0
+                    if sobrep == 1:
+                        result = np.nanmean(valores_img, axis=0)
+                    elif sobrep == 2:
+                        result = np.nanmedian(valores_img, axis=0)
+                    elif sobrep == 3:
+                        result = np.nanmin(valores_img, axis=0)
+                    elif sobrep == 4:
+                        result = np.nanmax(valores_img, axis=0)
+                if vlayer:
+                    valido = valido & dentro
+                if inteiro:
+                    result = np.round(result)
+                for k in range(n_bands):
+                    banda = np.where(valido, result[k], valor_nulo).astype(tipo)
+                    Driver.GetRasterBand(k+1).WriteArray(banda, col, lin)
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(int((current+1) * Percent))
+
+            # Salvar e Fechar Raster
+            Driver.FlushCache()   # Escrever no disco
+            Driver = None   # Salvar e fechar
+
+            feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
+            feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
+            self.CAMINHO = Output
+            self.CARREGAR = Carregar
+            return {self.MOSAIC: Output}
+
         # Numeração das Imagens
         valores = list(range(1,len(lista)+1))
 
@@ -553,60 +686,53 @@ class MosaicRaster(QgsProcessingAlgorithm):
                                      'origem': img_origem }
                         image = None
 
+                # Pixels da classe dentro do mosaico
+                pixels = classes[classe]['pixels']
+                pixels = pixels[(pixels[:,0] >= 0) & (pixels[:,0] < n_lin) & (pixels[:,1] >= 0) & (pixels[:,1] < n_col)]
+                lin, col = pixels[:,0], pixels[:,1]
+                X = origem[0] + resol_X*(col + 0.5)
+                Y = origem[1] - resol_Y*(lin + 0.5)
+
                 if sobrep == 0: # Se for "primeiro", interpolar apenas da primeira img da comb, caso contrário
                     img = classe[0]
-                    # Para cada pixel da classe
-                    for px in classes[classe]['pixels']:
-                        lin,col = px
-                        X = origem[0] + resol_X*(col + 0.5)
-                        Y = origem[1] - resol_Y*(lin + 0.5)
-                        Interpolado = Interpolar(X, Y,
-                                                imgs[img]['band'],
-                                                imgs[img]['origem'],
-                                                imgs[img]['xres'],
-                                                imgs[img]['yres'],
-                                                reamostragem,
-                                                valor_nulo)
-                        if Interpolado != valor_nulo:
-                            banda[lin][col] = round(Interpolado) if inteiro else Interpolado
-
-                        if feedback.isCanceled():
-                            break
-                        current += 1
-                        feedback.setProgress(int(current * Percent))
+                    Interpolado = InterpolarArray(X, Y,
+                                                  imgs[img]['band'],
+                                                  imgs[img]['origem'],
+                                                  imgs[img]['xres'],
+                                                  imgs[img]['yres'],
+                                                  reamostragem,
+                                                  valor_nulo)
+                    valido = Interpolado != valor_nulo
+                    banda[lin[valido], col[valido]] = np.round(Interpolado[valido]) if inteiro else Interpolado[valido]
 
                 else: # Para cada pixel da classe interpolar o valor da banda de cada img
-                    for px in classes[classe]['pixels']:
-                        lin,col = px
-                        X = origem[0] + resol_X*(col + 0.5)
-                        Y = origem[1] - resol_Y*(lin + 0.5)
-                        interp_values = []
-                        for img in imgs:
-                            Interpolado = Interpolar(X, Y,
-                                                     imgs[img]['band'],
-                                                     imgs[img]['origem'],
-                                                     imgs[img]['xres'],
-                                                     imgs[img]['yres'],
-                                                     reamostragem,
-                                                     valor_nulo)
-                            if Interpolado != valor_nulo:
-                                interp_values += [Interpolado]
-                        # Calcular o valor agregado (0:first, 1:average, 2:median, 3:min, 4:max) e inserir na banda (se byte, arredondar)
-                        if interp_values:
-                            if sobrep == 1:
-                                result = np.mean(interp_values)
-                            elif sobrep == 2:
-                                result = np.median(interp_values)
-                            elif sobrep == 3:
-                                result = np.min(interp_values)
-                            elif sobrep == 4:
-                                result = np.max(interp_values)
-                            banda[lin][col] = round(result) if inteiro else result
-
-                        if feedback.isCanceled():
-                            break
-                        current += 1
-                        feedback.setProgress(int(current * Percent))
+                    interp_values = np.empty((len(imgs), len(lin)))
+                    for ind, img in enumerate(imgs):
+                        interp_values[ind] = InterpolarArray(X, Y,
+                                                             imgs[img]['band'],
+                                                             imgs[img]['origem'],
+                                                             imgs[img]['xres'],
+                                                             imgs[img]['yres'],
+                                                             reamostragem,
+                                                             valor_nulo)
+                    interp_values[interp_values == valor_nulo] = np.nan
+                    valido = ~np.isnan(interp_values).all(axis=0)
+                    interp_values = interp_values[:, valido]
+                    # Calcular o valor agregado (0:first, 1:average, 2:median, 3:min, 4:max) e inserir na banda (se byte, arredondar)
+                    if sobrep == 1:
+                        result = np.nanmean(interp_values, axis=0)
+                    elif sobrep == 2:
+                        result = np.nanmedian(interp_values, axis=0)
+                    elif sobrep == 3:
+                        result = np.nanmin(interp_values, axis=0)
+                    elif sobrep == 4:
+                        result = np.nanmax(interp_values, axis=0)
+                    banda[lin[valido], col[valido]] = np.round(result) if inteiro else result
+
+                if feedback.isCanceled():
+                    break
+                current += len(classes[classe]['pixels'])
+                feedback.setProgress(int(current * Percent))
 
             # Salvar banda
             outband = Driver.GetRasterBand(k+1)
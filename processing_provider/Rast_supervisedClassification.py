@@ -31,10 +31,11 @@ from qgis.core import (Qgis,
                        QgsCoordinateTransform,
                        QgsCoordinateReferenceSystem)
 
-from math import floor, ceil
 from osgeo import osr, gdal_array, gdal #https://gdal.org/python/
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from lftools.geocapt.imgs import Imgs
+from lftools.geocapt.dip import ClassificarBloco
 from lftools.translations.translate import translate
 import os
 from qgis.PyQt.QtGui import QIcon
@@ -94,6 +95,7 @@ class SupervisedClassification(QgsProcessingAlgorithm):
     FIELD = 'FIELD'
     METHOD = 'METHOD'
     SIZE = 'SIZE'
+    PARALLEL = 'PARALLEL'
     OPEN = 'OPEN'
 
     def initAlgorithm(self, config=None):
@@ -150,6 +152,14 @@ class SupervisedClassification(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.PARALLEL,
+                self.tr('Parallel processing', 'Processamento paralelo'),
+                defaultValue= False
+            )
+        )
+
         # OUTPUT
         self.addParameter(
             QgsProcessingParameterFileDestination(
@@ -215,6 +225,12 @@ class SupervisedClassification(QgsProcessingAlgorithm):
         )
         fator = size+1
 
+        Paralelo = self.parameterAsBool(
+            parameters,
+            self.PARALLEL,
+            context
+        )
+
         Carregar = self.parameterAsBool(
             parameters,
             self.OPEN,
@@ -227,16 +243,13 @@ class SupervisedClassification(QgsProcessingAlgorithm):
             context
         )
 
-        # Abrir Raster layer como array
+        # Abrir Raster layer
         image = gdal.Open(RasterIN)
         prj=image.GetProjection()
         geotransform = image.GetGeoTransform()
         n_bands = image.RasterCount
         if n_bands < 2:
             raise QgsProcessingException(self.tr('The raster layer must have more than 1 band!', 'A camada raster deve ter mais de 1 banda!'))
-        bandas = []
-        for k in range(n_bands):
-            bandas += [image.GetRasterBand(k+1).ReadAsArray()]
         Pixel_Nulo = image.GetRasterBand(1).GetNoDataValue()
         if Pixel_Nulo == None:
             Pixel_Nulo = 0
@@ -247,10 +260,6 @@ class SupervisedClassification(QgsProcessingAlgorithm):
         origem = (ulx, uly)
         resol_X = abs(xres)
         resol_Y = abs(yres)
-        lrx = ulx + (cols * xres)
-        lry = uly + (rows * yres)
-        bbox = [ulx, lrx, lry, uly]
-        image=None # Fechar imagem
 
         # Transformação de coordenadas
         crsSrc = layer.sourceCrs()
@@ -261,7 +270,7 @@ class SupervisedClassification(QgsProcessingAlgorithm):
         else:
             transf_SRC = False
 
-        # Amostra de Raster por poligono
+        # Amostra de Raster por poligono (lendo apenas a janela de cada polígono)
         dic = {}
         for feat in layer.getFeatures():
             code = feat[campo[0]]
@@ -277,52 +286,24 @@ class SupervisedClassification(QgsProcessingAlgorithm):
                 poly = geom.asMultiPolygon()[0][0]
             else:
                 poly = geom.asPolygon()[0]
-            caminho = []
-            lin_min = 1e8
-            col_min = 1e8
-            lin_max = -1e8
-            col_max = -1e8
-            for ponto in poly:
-                linha = (origem[1]-ponto.y())/resol_Y
-                if linha > lin_max:
-                    lin_max = linha
-                if linha < lin_min:
-                    lin_min = linha
-                coluna = (ponto.x() - origem[0])/resol_X
-                if coluna > col_max:
-                    col_max = coluna
-                if coluna < col_min:
-                    col_min = coluna
-                caminho += [(linha, coluna)]
+            caminho = np.array([((origem[1]-ponto.y())/resol_Y, (ponto.x() - origem[0])/resol_X) for ponto in poly])
             p = path.Path(caminho)
-            lin_min = int(np.floor(lin_min))
-            lin_max = int(np.floor(lin_max))
-            col_min = int(np.floor(col_min))
-            col_max = int(np.floor(col_max))
+            lin_min = max(int(np.floor(caminho[:,0].min())), 0)
+            lin_max = min(int(np.floor(caminho[:,0].max())), rows - 1)
+            col_min = max(int(np.floor(caminho[:,1].min())), 0)
+            col_max = min(int(np.floor(caminho[:,1].max())), cols - 1)
+            if lin_max < lin_min or col_max < col_min:
+                continue
             nx, ny = (lin_max-lin_min+1, col_max-col_min+1)
-            lin = np.linspace(lin_min, lin_max, nx)
-            col = np.linspace(col_min, col_max, ny)
-            COL, LIN = np.meshgrid(col, lin)
-            recorte = np.zeros((int(nx), int(ny)), dtype=bool)
-            for x in range(int(nx)):
-                for y in range(int(ny)):
-                    pixel = (LIN[x][y]+0.5, COL[x][y]+0.5) # 0.5 eh o centro do pixel
-                    contem = p.contains_points([pixel])
-                    recorte[x][y] = contem[0]
+            COL, LIN = np.meshgrid(np.arange(col_min, col_max+1), np.arange(lin_min, lin_max+1))
+            pixels = np.column_stack((LIN.ravel()+0.5, COL.ravel()+0.5)) # 0.5 eh o centro do pixel
+            recorte = p.contains_points(pixels).reshape(nx, ny)
             # Recorte de cada banda
             for k in range(n_bands):
-                banda = bandas[k]
-                recorte_img = banda[lin_min:lin_max+1, col_min:col_max+1]
-                if np.shape(recorte)!=np.shape(recorte_img):
-                    # chegou no fim do recorte
-                    recorte = recorte[0:np.shape(recorte_img)[0], 0:np.shape(recorte_img)[1]]
-                tam = np.shape(recorte_img)
-                valores = []
-                for x in range(tam[0]):
-                    for y in range(tam[1]):
-                        if recorte[x][y]:
-                            valores += [float(recorte_img[x][y])]
+                recorte_img = image.GetRasterBand(k+1).ReadAsArray(col_min, lin_min, ny, nx)
+                valores = recorte_img[recorte].astype('float64').tolist()
                 dic[code]['valores'][k+1] = dic[code]['valores'][k+1] + valores
+        image=None # Fechar imagem
 
         # Cálculo da Média por banda e MVC de cada classe
         ordem = []
@@ -335,7 +316,7 @@ class SupervisedClassification(QgsProcessingAlgorithm):
                 media += [[np.mean(valores)]]
                 desvpad += [[np.std(valores)]]
                 val_list += [valores]
-            MVC = np.matrix(np.cov(np.array(val_list)))
+            MVC = np.cov(np.array(val_list))
             media = np.array(media)
             desvpad = np.array(desvpad)
             dic[code]['media'] = media
@@ -349,106 +330,48 @@ class SupervisedClassification(QgsProcessingAlgorithm):
             ordem += [[np.trace(MVC), code]]
         ordem = sorted(ordem, reverse = True)
 
-        # Varrer imagem e classificar cada pixel
-        img_class = np.zeros((rows, cols), dtype=np.byte)
-        total = 100.0/rows
-
-        if metodo == 0: # Paralelepípedo
-            for lin in range(rows):
-                for col in range(cols):
-                    px = []
-                    for k in range(n_bands):
-                        px += [[float(bandas[k][lin][col])]]
-                    px = np.array(px)
-                    classe = None
-                    for item in ordem:
-                        m = dic[item[1]]['media']
-                        s = dic[item[1]]['desvpad']
-                        cond = (m-fator*s < px) * (px < m+fator*s)
-                        if cond.sum() == len(px):
-                            classe = item[1]
-                    if classe:
-                        img_class[lin,col] = classe
-                feedback.setProgress(int((lin+1) * total))
-                if feedback.isCanceled():
-                    break
+        # Criar imagem classificada
+        classified_img = gdal.GetDriverByName('GTiff').Create(Raster_Output, cols, rows, 1, gdal.GDT_Byte, ['TILED=YES', 'BIGTIFF=IF_SAFER'])
+        classified_img.SetGeoTransform(geotransform)
+        classified_img.SetProjection(prj)
+        banda = classified_img.GetRasterBand(1)
+        banda.SetNoDataValue(Pixel_Nulo)
 
-        elif metodo == 1: # Elipsoide
-            for lin in range(rows):
-                for col in range(cols):
-                    px = []
-                    for k in range(n_bands):
-                        px += [[float(bandas[k][lin][col])]]
-                    px = np.array(px)
-                    classe = None
-                    for item in ordem:
-                        m = dic[item[1]]['media']
-                        mvc = dic[item[1]]['mvc']
-                        det = dic[item[1]]['det']
-                        pos = (px - m).T*mvc*(px - m) - det
-                        if pos <= 0:
-                            classe = item[1]
-                    if classe:
-                        img_class[lin,col] = classe
-                feedback.setProgress(int((lin+1) * total))
-                if feedback.isCanceled():
-                    break
+        # Varrer imagem em blocos de linhas e classificar todos os pixels de cada bloco
+        bloco = max(1, int(2**20/cols))
+        blocos = [(lin, min(bloco, rows - lin)) for lin in range(0, rows, bloco)]
 
-        elif metodo == 2: # Distância Euclidiana
-            for lin in range(rows):
-                for col in range(cols):
-                    px = []
-                    for k in range(n_bands):
-                        px += [[float(bandas[k][lin][col])]]
-                    px = np.array(px)
-                    min_dist = 1e9
-                    classe = None
-                    for code in dic:
-                        m = dic[code]['media']
-                        dist = (px - m).T*(px - m)
-                        if dist[0][0] < min_dist:
-                            min_dist = dist[0][0]
-                            classe = code
-                    img_class[lin,col] = classe
-                feedback.setProgress(int((lin+1) * total))
-                if feedback.isCanceled():
-                    break
+        def classificar(janela):
+            lin, n_lin = janela
+            # Cada bloco abre o seu próprio dataset GDAL
+            img = gdal.Open(RasterIN)
+            PIXELS = img.ReadAsArray(0, lin, cols, n_lin)
+            img = None
+            return lin, ClassificarBloco(PIXELS, dic, ordem, metodo, fator)
 
-        elif metodo == 3: # Distância de Mahalanobis
-            for lin in range(rows):
-                for col in range(cols):
-                    px = []
-                    for k in range(n_bands):
-                        px += [[float(bandas[k][lin][col])]]
-                    px = np.array(px)
-                    min_dist = 1e9
-                    classe = None
-                    for code in dic:
-                        m = dic[code]['media']
-                        MVC_inv = dic[code]['MVC_inv']
-                        dist_Mah = (px - m).T*MVC_inv*(px - m)
-                        if dist_Mah[0][0] < min_dist:
-                            min_dist = dist_Mah[0][0]
-                            classe = code
-                    img_class[lin,col] = classe
-                feedback.setProgress(int((lin+1) * total))
+        total = 100.0/rows
+        if Paralelo:
+            n_workers = os.cpu_count() or 1
+            feedback.pushInfo(self.tr('Classifying with {} threads...', 'Classificando com {} threads...').format(n_workers))
+            with ThreadPoolExecutor(max_workers = n_workers) as executor:
+                for k in range(0, len(blocos), 2*n_workers):
+                    for lin, img_class in executor.map(classificar, blocos[k:k+2*n_workers]):
+                        banda.WriteArray(img_class, 0, lin)
+                        feedback.setProgress(int((lin + img_class.shape[0]) * total))
+                    if feedback.isCanceled():
+                        break
+        else:
+            for janela in blocos:
+                lin, img_class = classificar(janela)
+                banda.WriteArray(img_class, 0, lin)
+                feedback.setProgress(int((lin + img_class.shape[0]) * total))
                 if feedback.isCanceled():
                     break
 
-
         # Salvando Resultado
-        GDT = gdal_array.NumericTypeCodeToGDALTypeCode(img_class.dtype)
-        classified_img = gdal.GetDriverByName('GTiff').Create(Raster_Output, cols, rows, 1, GDT)
-        classified_img.SetGeoTransform(geotransform)
-        classified_img.SetProjection(prj)
-        banda = classified_img.GetRasterBand(1)
-        banda.WriteArray(img_class)
-        banda.SetNoDataValue(Pixel_Nulo)
         classified_img.FlushCache()   # Escrever no disco
         classified_img = None   # Salvar e fechar
 
-
-
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
         self.CAMINHO = Raster_Output
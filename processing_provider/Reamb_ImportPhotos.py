@@ -38,6 +38,7 @@ import shutil
 from lftools.geocapt.imgs import Imgs
 from lftools.geocapt.topogeo import azimute as CalAZ
 from lftools.geocapt.cartography import simbologiaPontos3D
+from lftools.geocapt.photometa import metadadosFotos, NAO_LIDO
 from lftools.translations.translate import translate
 import os, re
 import processing
@@ -224,7 +225,6 @@ class ImportPhotos(QgsProcessingAlgorithm):
                 if (item).lower().endswith(('.jpg', '.jpeg', '.tif', '.tiff', '.dng')):
                     lista += [os.path.join(pasta, item)]
 
-        tam = len(lista)
         copy_ngeo = False
         if os.path.isdir(fotos_nao_geo):
             copy_ngeo = True
@@ -280,7 +280,7 @@ class ImportPhotos(QgsProcessingAlgorithm):
             hora = int(data_hora[3])
             minuto = int(data_hora[4])
             segundo = int(data_hora[5])
-            data_hora = unicode(datetime.datetime(ano, mes, dia, hora, minuto, segundo))
+            data_hora = str(datetime.datetime(ano, mes, dia, hora, minuto, segundo))
             return data_hora
         
         # Mensagem de erro
@@ -318,164 +318,128 @@ class ImportPhotos(QgsProcessingAlgorithm):
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
-        Percent = 100.0/tam if tam!=0 else 0
-
-        for index, filepath in enumerate(lista):
-            
+        # Extração dos metadados de um arquivo (executada em threads)
+        def extrair(filepath, ypr):
+            dados = {'lon': 0, 'lat': 0, 'altitude': None, 'Az': None, 'date_time': None,
+                     'fabricante': '', 'modelo': '', 'ypr': None, 'tipo': 'jpg'}
             if (filepath).lower().endswith(('.jpg', '.jpeg')):
-                caminho, arquivo = os.path.split(filepath)
-                
                 try:
-                    img = Image.open(os.path.join(caminho,arquivo))
-                    if img._getexif():
+                    with Image.open(filepath) as img:
+                        exif = img._getexif()
+                    if exif:
                         exif = {
                             ExifTags.TAGS[k]: v
-                            for k, v in img._getexif().items()
+                            for k, v in exif.items()
                             if k in ExifTags.TAGS
                         }
                     else:
                         exif = {}
-                    lon, lat = 0, 0
-                    Az = None
-                    date_time = None
-                    altitude = None
-                    img.close()
                 except:
-                    lon = 0
                     exif = {}
                 if 'GPSInfo' in exif:
                     lat, lon = coordenadas(exif)
+                    dados['lat'], dados['lon'] = float(lat), float(lon)
                     if lat != 0:
                         if 17 in exif['GPSInfo']:
-                            Az = float(azimute(exif))
+                            dados['Az'] = float(azimute(exif))
                         if 6 in exif['GPSInfo']:
                             try:
-                                altitude = float(exif['GPSInfo'][6][0])/exif['GPSInfo'][6][1]
+                                dados['altitude'] = float(exif['GPSInfo'][6][0])/exif['GPSInfo'][6][1]
                             except:
-                                altitude = float(exif['GPSInfo'][6])
+                                dados['altitude'] = float(exif['GPSInfo'][6])
                 if 'DateTimeOriginal' in exif:
-                    date_time = data_hora(exif['DateTimeOriginal'])
+                    dados['date_time'] = data_hora(exif['DateTimeOriginal'])
                 elif 'DateTime' in exif:
-                    date_time = data_hora(exif['DateTime'])
-
+                    dados['date_time'] = data_hora(exif['DateTime'])
                 if 'Make' in exif:
-                    fabricante = str(exif['Make'].replace('\x00', ''))
-                else:
-                    fabricante = ''
-
+                    dados['fabricante'] = str(exif['Make'].replace('\x00', ''))
                 if 'Model' in exif:
-                    modelo = str(exif['Model'].replace('\x00', ''))
-                else:
-                    modelo = ''
-
-                if lon != 0:
-                    if YPR:
-                        FlightYaw, FlightPitch, FlightRoll, GimbalYaw, GimbalPitch, GimbalRoll = self.extract_dji_orientation(filepath)
-                    if not CalcAz:
-                        feature = QgsFeature(fields)
-                        feature.setGeometry(QgsGeometry(QgsPoint(lon, lat, altitude if altitude != None else 0)))
-                        att = [arquivo, lon, lat, altitude, Az, date_time, filepath, fabricante, modelo]
-                        if YPR:
-                            att[4] = FlightYaw
-                            att += [FlightYaw, FlightPitch, FlightRoll, GimbalYaw, GimbalPitch, GimbalRoll]
-                        feature.setAttributes(att)
-                        sink.addFeature(feature, QgsFeatureSink.Flag.FastInsert)
-                    else:
-                        if YPR:
-                            Atributos += [[arquivo, lon, lat, altitude, Az, date_time, filepath, fabricante, modelo, FlightYaw, FlightPitch, FlightRoll, GimbalYaw, GimbalPitch, GimbalRoll]]
-                        else:
-                            Atributos += [[arquivo, lon, lat, altitude, Az, date_time, filepath, fabricante, modelo]]
-                else:
-                    feedback.reportError(erro_msg(arquivo))
-                    if copy_ngeo:
-                        shutil.copy2(os.path.join(pasta, arquivo), os.path.join(fotos_nao_geo, arquivo))
+                    dados['modelo'] = str(exif['Model'].replace('\x00', ''))
+                dados['geo'] = dados['lon'] != 0
+                dados['copiar'] = not dados['geo']
 
-            elif (filepath).lower().endswith(('.tif', '.tiff', '.dng')):
-                caminho, arquivo = os.path.split(filepath)
-                img = Image.open(os.path.join(caminho,arquivo))
-
-                try:
-                    meta_dict = {TAGS[key] : img.tag[key] for key in img.tag_v2}
-                except:
-                    exif = img.getexif()
-                    meta_dict = {}
-                    for tag_id, value in exif.items():
-                        tag_name = TAGS.get(tag_id)
-                        meta_dict[tag_name] = value
-
-                gps_offset = img.tag_v2.get(0x8825)
-                tags = {}
-                if gps_offset:
-                    ifh = b"II\x2A\x00\x08\x00\x00\x00" if img.tag_v2._endian == "<" else "MM\x00\x2A\x00\x00\x00\x08"
-                    info = ImageFileDirectory_v2(ifh)
-                    img.fp.seek(gps_offset)
-                    info.load(img.fp)
-                    gps_keys = ['GPSVersionID','GPSLatitudeRef','GPSLatitude','GPSLongitudeRef','GPSLongitude','GPSAltitudeRef','GPSAltitude','GPSTimeStamp','GPSSatellites','GPSStatus','GPSMeasureMode','GPSDOP','GPSSpeedRef','GPSSpeed','GPSTrackRef','GPSTrack','GPSImgDirectionRef','GPSImgDirection','GPSMapDatum','GPSDestLatitudeRef','GPSDestLatitude','GPSDestLongitudeRef','GPSDestLongitude','GPSDestBearingRef','GPSDestBearing','GPSDestDistanceRef','GPSDestDistance','GPSProcessingMethod','GPSAreaInformation','GPSDateStamp','GPSDifferential']
-                    for k, v in info.items():
-                        tags[gps_keys[k]] = str(v)
-                
-
-                lon, lat = 0, 0
-                Az = None
-                date_time = None
-                altitude = None
+            else: # '.tif', '.tiff', '.dng'
+                dados['tipo'] = 'tif'
+                with Image.open(filepath) as img:
+                    try:
+                        meta_dict = {TAGS[key] : img.tag[key] for key in img.tag_v2}
+                    except:
+                        exif = img.getexif()
+                        meta_dict = {}
+                        for tag_id, value in exif.items():
+                            tag_name = TAGS.get(tag_id)
+                            meta_dict[tag_name] = value
+
+                    gps_offset = img.tag_v2.get(0x8825)
+                    tags = {}
+                    if gps_offset:
+                        ifh = b"II\x2A\x00\x08\x00\x00\x00" if img.tag_v2._endian == "<" else "MM\x00\x2A\x00\x00\x00\x08"
+                        info = ImageFileDirectory_v2(ifh)
+                        img.fp.seek(gps_offset)
+                        info.load(img.fp)
+                        gps_keys = ['GPSVersionID','GPSLatitudeRef','GPSLatitude','GPSLongitudeRef','GPSLongitude','GPSAltitudeRef','GPSAltitude','GPSTimeStamp','GPSSatellites','GPSStatus','GPSMeasureMode','GPSDOP','GPSSpeedRef','GPSSpeed','GPSTrackRef','GPSTrack','GPSImgDirectionRef','GPSImgDirection','GPSMapDatum','GPSDestLatitudeRef','GPSDestLatitude','GPSDestLongitudeRef','GPSDestLongitude','GPSDestBearingRef','GPSDestBearing','GPSDestDistanceRef','GPSDestDistance','GPSProcessingMethod','GPSAreaInformation','GPSDateStamp','GPSDifferential']
+                        for k, v in info.items():
+                            tags[gps_keys[k]] = str(v)
 
                 if 'GPSLatitudeRef' in tags:
                     lat_ref = str(tags['GPSLatitudeRef'])
                     lat = eval(str(tags['GPSLatitude']))
-                    lat = (-1 if lat_ref.upper() == 'S' else 1)*(lat[0] + lat[1]/60 + lat[2]/3600)
+                    dados['lat'] = float((-1 if lat_ref.upper() == 'S' else 1)*(lat[0] + lat[1]/60 + lat[2]/3600))
                     lon_ref = str(tags['GPSLongitudeRef'])
                     lon = eval(str(tags['GPSLongitude']))
-                    lon = (-1 if lon_ref.upper() == 'W' else 1)*(lon[0] + lon[1]/60 + lon[2]/3600)
-                    alt_ref = str(tags['GPSAltitudeRef'])
-                    altitude = eval(str(tags['GPSAltitude']))
+                    dados['lon'] = float((-1 if lon_ref.upper() == 'W' else 1)*(lon[0] + lon[1]/60 + lon[2]/3600))
+                    dados['altitude'] = float(eval(str(tags['GPSAltitude'])))
                     try:
-                        date_time = data_hora(meta_dict['DateTime'][0])
+                        dados['date_time'] = data_hora(meta_dict['DateTime'][0])
                     except:
-                        date_time = data_hora(meta_dict['DateTime'])
+                        dados['date_time'] = data_hora(meta_dict['DateTime'])
                     if 'Make' in meta_dict:
                         if isinstance(meta_dict['Make'], tuple):
-                            fabricante = str(meta_dict['Make'][0])
+                            dados['fabricante'] = str(meta_dict['Make'][0])
                         else:
-                            fabricante = str(meta_dict['Make'])
-                    else:
-                        fabricante = ''
-
+                            dados['fabricante'] = str(meta_dict['Make'])
                     if 'Model' in meta_dict:
                         if isinstance(meta_dict['Model'], tuple):
-                            modelo = str(meta_dict['Model'][0])
+                            dados['modelo'] = str(meta_dict['Model'][0])
                         else:
-                            modelo = str(meta_dict['Model'])
-                    else:
-                        modelo = ''
-
-                    if lon != 0:
-                        if YPR:
-                            FlightYaw, FlightPitch, FlightRoll, GimbalYaw, GimbalPitch, GimbalRoll = self.extract_dji_orientation(filepath)
-                        if not CalcAz:
-                            feature = QgsFeature(fields)
-                            feature.setGeometry(QgsGeometry(QgsPoint(lon, lat, altitude if altitude != None else 0)))
-                            att = [arquivo, lon, lat, altitude, Az, date_time, filepath, fabricante, modelo]
-                            if YPR:
-                                att += [FlightYaw, FlightPitch, FlightRoll, GimbalYaw, GimbalPitch, GimbalRoll]
-                            feature.setAttributes(att)
-                            sink.addFeature(feature, QgsFeatureSink.Flag.FastInsert)
-                        else:
-                            if YPR:
-                                Atributos += [[arquivo, lon, lat, altitude, Az, date_time, filepath, fabricante, modelo, FlightYaw, FlightPitch, FlightRoll, GimbalYaw, GimbalPitch, GimbalRoll]]
-                            else:
-                                Atributos += [[arquivo, lon, lat, altitude, Az, date_time, filepath, fabricante, modelo]]
-                    else:
-                        feedback.reportError(erro_msg(arquivo))
+                            dados['modelo'] = str(meta_dict['Model'])
+                dados['geo'] = dados['lon'] != 0
+                dados['copiar'] = 'GPSLatitudeRef' not in tags
+
+            if dados['geo'] and ypr:
+                dados['ypr'] = list(self.extract_dji_orientation(filepath))
+            return dados
+
+        # Metadados lidos do cache ou extraídos em paralelo
+        Image.init()
+        feedback.pushInfo(self.tr('Reading metadata...', 'Lendo metadados...'))
+        metadados = metadadosFotos(lista, extrair, YPR, feedback=feedback)
+
+        for filepath, dados in zip(lista, metadados):
+            if dados is NAO_LIDO:
+                continue
+            caminho, arquivo = os.path.split(filepath)
+            if dados is None:
+                dados = {'geo': False, 'copiar': True}
+            if dados['geo']:
+                att = [arquivo, dados['lon'], dados['lat'], dados['altitude'], dados['Az'], dados['date_time'], filepath, dados['fabricante'], dados['modelo']]
+                if YPR:
+                    if dados['tipo'] == 'jpg':
+                        att[4] = dados['ypr'][0] # FlightYaw
+                    att += dados['ypr'] # FlightYaw, FlightPitch, FlightRoll, GimbalYaw, GimbalPitch, GimbalRoll
+                if not CalcAz:
+                    feature = QgsFeature(fields)
+                    feature.setGeometry(QgsGeometry(QgsPoint(dados['lon'], dados['lat'], dados['altitude'] if dados['altitude'] != None else 0)))
+                    feature.setAttributes(att)
+                    sink.addFeature(feature, QgsFeatureSink.Flag.FastInsert)
                 else:
-                    feedback.reportError(erro_msg(arquivo))
-                    if copy_ngeo:
-                        shutil.copy2(os.path.join(pasta, arquivo), os.path.join(fotos_nao_geo, arquivo))
-                img.close()
+                    Atributos += [att]
+            else:
+                feedback.reportError(erro_msg(arquivo))
+                if copy_ngeo and dados['copiar']:
+                    shutil.copy2(filepath, os.path.join(fotos_nao_geo, arquivo))
             if feedback.isCanceled():
                 break
-            feedback.setProgress(int((index+1) * Percent))
-
 
         if CalcAz and len(Atributos) > 0:
             # Calcular azimutes
@@ -514,10 +478,13 @@ class ImportPhotos(QgsProcessingAlgorithm):
         Extrai yaw, pitch e roll de imagens DJI (JPEG, DNG, etc.) analisando o bloco XMP embutido.
         """
         try:
-            # Lê o conteúdo binário e tenta localizar o bloco XMP
+            # Lê o conteúdo binário e tenta localizar o bloco XMP (primeiro no início do arquivo)
             with open(image_path, "rb") as fb:
-                data = fb.read()
-            m = re.search(br"<x:xmpmeta[\s\S]*?</x:xmpmeta>", data, re.IGNORECASE)
+                data = fb.read(2**20)
+                m = re.search(br"<x:xmpmeta[\s\S]*?</x:xmpmeta>", data, re.IGNORECASE)
+                if not m:
+                    data += fb.read()
+                    m = re.search(br"<x:xmpmeta[\s\S]*?</x:xmpmeta>", data, re.IGNORECASE)
             if not m:
                 m = re.search(br"<xmpmeta[\s\S]*?</xmpmeta>", data, re.IGNORECASE)
             if not m:
@@ -27,8 +27,8 @@ from osgeo import osr, gdal_array, gdal #https://gdal.org/python/
 import numpy as np
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
-from lftools.geocapt.dip import Interpolar
-import os
+from lftools.geocapt.dip import InterpolarArray
+import os, gzip, struct
 from qgis.PyQt.QtGui import QIcon
 
 class DEM2txt(QgsProcessingAlgorithm):
@@ -60,9 +60,11 @@ class DEM2txt(QgsProcessingAlgorithm):
         return QIcon(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'images/contours.png'))
 
     txt_en = '''This tool exports a Digital Elevation Model (DEM) as a text file (txt) for later transformation into a point cloud.
-Optionally, the associated Orthomosaic RGB colors can be taken to the text file.'''
+Optionally, the associated Orthomosaic RGB colors can be taken to the text file.
+The output can also be saved as gzip-compressed text (.txt.gz) or as a NumPy binary file (.npy).'''
     txt_pt = '''Esta ferramenta exporta um Modelo Digital de Elevação (MDE) como um arquivo de texto (txt) para posterior transformação em nuvem de pontos.
-Opcionalmente, as cores RGB associadas do Ortomosaico podem ser levadas para o arquivo de texto.'''
+Opcionalmente, as cores RGB associadas do Ortomosaico podem ser levadas para o arquivo de texto.
+A saída também pode ser salva como texto compactado com gzip (.txt.gz) ou como arquivo binário do NumPy (.npy).'''
     figure = 'images/tutorial/relief_dem2txt.jpg'
 
     def shortHelpString(self):
@@ -116,7 +118,7 @@ Opcionalmente, as cores RGB associadas do Ortomosaico podem ser levadas para o a
             QgsProcessingParameterFileDestination(
                 self.TXT,
                 self.tr('X,Y,Z Points as Text', 'Pontos X,Y,Z como Texto'),
-                fileFilter = 'Text (*.txt)'
+                fileFilter = 'Text (*.txt);;Compressed text (*.txt.gz);;NumPy binary (*.npy)'
             )
         )
 
@@ -148,8 +150,6 @@ Opcionalmente, as cores RGB associadas do Ortomosaico podem ser levadas para o a
         if decimal is None or decimal<1:
             raise QgsProcessingException(self.invalidSourceError(parameters, self.DECIMAL))
 
-        format_num = '{:.Xf}'.replace('X', str(decimal))
-
         # output
         arquivo_saida = self.parameterAsFile(
             parameters,
@@ -159,16 +159,15 @@ Opcionalmente, as cores RGB associadas do Ortomosaico podem ser levadas para o a
         if 'TXT.txt' in arquivo_saida: # não permitir arquivo temporário
             raise QgsProcessingException(self.tr('Output file path must be filled!', 'Caminho do arquivo de saída deve ser preenchido!'))
 
-        # Abrir MDE como array
+        # Abrir MDE
         feedback.pushInfo(self.tr('Opening DEM raster file...', 'Abrindo arquivo Raster do MDE...'))
         image = gdal.Open(MDE)
-        prj = image.GetProjection()
         geotransform = image.GetGeoTransform()
         num_bands = image.RasterCount
         if num_bands != 1:
             raise QgsProcessingException(self.tr('The raster layer should only have 1 band!','A camada raster deve ter apenas 1 banda!'))
-        dem = image.GetRasterBand(1).ReadAsArray()
-        nulo = image.GetRasterBand(1).GetNoDataValue()
+        dem_band = image.GetRasterBand(1)
+        nulo = dem_band.GetNoDataValue()
         cols = image.RasterXSize
         rows = image.RasterYSize
         # Origem e resolucao da imagem
@@ -176,58 +175,105 @@ Opcionalmente, as cores RGB associadas do Ortomosaico podem ser levadas para o a
         origem = (ulx, uly)
         resol_X = abs(xres)
         resol_Y = abs(yres)
-        image = None # Fechar imagem
 
         # Abrir ORTO
         if ORTO:
             feedback.pushInfo(self.tr('Opening Orthomosaic raster file...', 'Abrindo arquivo Raster do Ortomosaico...'))
             ORTO = ORTO.dataProvider().dataSourceUri()
-            image = gdal.Open(ORTO)
-            geotransform = image.GetGeoTransform()
-            num_bands = image.RasterCount
+            orto = gdal.Open(ORTO)
+            num_bands = orto.RasterCount
             if num_bands < 3:
                 raise QgsProcessingException(self.tr('The raster layer should have RBG bands!','A camada raster deve ter 3 bandas RBG!'))
-            R = image.GetRasterBand(1).ReadAsArray()
-            G = image.GetRasterBand(2).ReadAsArray()
-            B = image.GetRasterBand(3).ReadAsArray()
-            orto_nulo = image.GetRasterBand(1).GetNoDataValue()
-            orto_cols = image.RasterXSize
-            orto_rows = image.RasterYSize
-            ulx, xres, xskew, uly, yskew, yres  = geotransform
+            orto_nulo = orto.GetRasterBand(1).GetNoDataValue()
+            orto_cols = orto.RasterXSize
+            orto_rows = orto.RasterYSize
+            ulx, xres, xskew, uly, yskew, yres  = orto.GetGeoTransform()
             orto_origem = (ulx, uly)
             orto_resol_X = abs(xres)
             orto_resol_Y = abs(yres)
-            image = None # Fechar imagem
-
-        feedback.pushInfo(self.tr('Creating output file...', 'Criando arquivo de saída...'))
-
-        Percent = 100.0/cols if cols > 0 else 0
-        cont = 0
-        arq_out = open(arquivo_saida, 'w')
 
-        for col in range(cols):
-            for lin in range(rows):
-                Z = dem[lin,col]
-                if Z != nulo:
-                    X = origem[0] + resol_X*(col + 0.5)
-                    Y = origem[1] - resol_Y*(lin + 0.5)
-
-                    if ORTO:
-                        red   = Interpolar(X, Y, R, orto_origem, orto_resol_X, orto_resol_Y, 'nearest', orto_nulo)
-                        green = Interpolar(X, Y, G, orto_origem, orto_resol_X, orto_resol_Y, 'nearest', orto_nulo)
-                        blue  = Interpolar(X, Y, B, orto_origem, orto_resol_X, orto_resol_Y, 'nearest', orto_nulo)
-
-                        if red != orto_nulo and green != orto_nulo and blue != orto_nulo:
-                            arq_out.write('{} {} {} {} {} {}\n'.format(format_num.format(X), format_num.format(Y), format_num.format(Z), int(red), int(green), int(blue)))
+        # Gerar pontos em blocos de linhas
+        bloco = max(1, int(2**20/cols))
+        X_lin = origem[0] + resol_X*(np.arange(cols) + 0.5)
+
+        def pontos():
+            for lin in range(0, rows, bloco):
+                n_lin = min(bloco, rows - lin)
+                Z = dem_band.ReadAsArray(0, lin, cols, n_lin)
+                LIN, COL = np.nonzero(Z != nulo) if nulo is not None else np.nonzero(np.ones(Z.shape, dtype=bool))
+                Z = Z[LIN, COL].astype('float64')
+                X = X_lin[COL]
+                Y = origem[1] - resol_Y*(LIN + lin + 0.5)
+                if ORTO:
+                    RGB = np.zeros((3, len(X)))
+                    valido = np.ones(len(X), dtype=bool)
+                    # Janela do ortomosaico que cobre o bloco
+                    r0 = max(int(np.floor((orto_origem[1] - (origem[1] - resol_Y*lin))/orto_resol_Y)) - 1, 0)
+                    r1 = min(int(np.ceil((orto_origem[1] - (origem[1] - resol_Y*(lin + n_lin)))/orto_resol_Y)) + 1, orto_rows)
+                    if r1 > r0 and len(X) > 0:
+                        janela_origem = (orto_origem[0], orto_origem[1] - r0*orto_resol_Y)
+                        for k in range(3):
+                            banda = orto.GetRasterBand(k+1).ReadAsArray(0, r0, orto_cols, r1 - r0)
+                            RGB[k] = InterpolarArray(X, Y, banda, janela_origem, orto_resol_X, orto_resol_Y, 'nearest', orto_nulo)
+                            valido &= (RGB[k] != orto_nulo) & np.isfinite(RGB[k])
                     else:
-                        arq_out.write('{} {} {}\n'.format(format_num.format(X), format_num.format(Y), format_num.format(Z)))
+                        valido[:] = False
+                    yield lin + n_lin, np.column_stack((X[valido], Y[valido], Z[valido], RGB[:, valido].T))
+                else:
+                    yield lin + n_lin, np.column_stack((X, Y, Z))
 
-            if feedback.isCanceled():
-                break
-            cont += 1
-            feedback.setProgress(int(cont * Percent))
+        feedback.pushInfo(self.tr('Creating output file...', 'Criando arquivo de saída...'))
+        Percent = 100.0/rows if rows > 0 else 0
+        if ORTO:
+            # Tipo das bandas RGB igual ao do ortomosaico (ex.: 8 ou 16 bits)
+            tipo_rgb = np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(orto.GetRasterBand(1).DataType))
+            fmt_rgb = '%d' if np.issubdtype(tipo_rgb, np.integer) else '%.{}f'.format(decimal)
+            fmt = ' '.join(['%.{}f'.format(decimal)]*3 + [fmt_rgb]*3)
+            dtype = [('x', 'f8'), ('y', 'f8'), ('z', 'f4'), ('red', tipo_rgb), ('green', tipo_rgb), ('blue', tipo_rgb)]
+        else:
+            fmt = ' '.join(['%.{}f'.format(decimal)]*3)
+            dtype = [('x', 'f8'), ('y', 'f8'), ('z', 'f4')]
+
+        if arquivo_saida.lower().endswith('.npy'):
+            # Binário NumPy: registros gravados em sequência, em uma única passada; o cabeçalho é
+            # reservado para o número máximo de pontos e reescrito (mesmo tamanho) com a contagem final
+            registro = np.dtype(dtype)
+            def cabecalho(n, tamanho=0):
+                texto = repr({'descr': np.lib.format.dtype_to_descr(registro), 'fortran_order': False, 'shape': (n,)})
+                tamanho = max(tamanho, 64*int(np.ceil((len(texto) + 11)/64.0)))
+                texto = texto.ljust(tamanho - 11) + '\n'
+                return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(texto)) + texto.encode('latin1')
+            reservado = cabecalho(rows*cols)
+            n_pontos = 0
+            with open(arquivo_saida, 'wb') as arq_out:
+                arq_out.write(reservado)
+                for fim, dados in pontos():
+                    registros = np.empty(len(dados), dtype=registro)
+                    for k, campo in enumerate(registro.names):
+                        registros[campo] = dados[:, k]
+                    arq_out.write(registros.tobytes())
+                    n_pontos += len(dados)
+                    if feedback.isCanceled():
+                        break
+                    feedback.setProgress(int(fim * Percent))
+                arq_out.seek(0)
+                arq_out.write(cabecalho(n_pontos, len(reservado)))
+        else:
+            # Texto (ou texto compactado com gzip), um bloco por escrita
+            if arquivo_saida.lower().endswith('.gz'):
+                arq_out = gzip.open(arquivo_saida, 'wt')
+            else:
+                arq_out = open(arquivo_saida, 'w', buffering = 2**20)
+            for fim, dados in pontos():
+                if len(dados):
+                    np.savetxt(arq_out, dados, fmt=fmt)
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(int(fim * Percent))
+            arq_out.close()
 
-        arq_out.close()
+        image = None # Fechar imagem
+        orto = None
 
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
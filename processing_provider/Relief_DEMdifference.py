@@ -16,8 +16,6 @@ __date__ = '2023-05-30'
 __copyright__ = '(C) 2023, Leandro França'
 
 from qgis.core import (Qgis,
-                       QgsPointXY,
-                       QgsGeometry,
                        QgsProcessingException,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterBoolean,
@@ -27,14 +25,14 @@ from qgis.core import (Qgis,
                        QgsApplication,
                        QgsProject,
                        QgsRasterLayer,
-                       QgsCoordinateTransform,
                        QgsCoordinateReferenceSystem)
 
 from osgeo import osr, gdal_array, gdal #https://gdal.org/python/
 import numpy as np
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
-from lftools.geocapt.dip import Interpolar
+from lftools.geocapt.dip import InterpolarArray
+from lftools.geocapt.cartography import reprojectArrays
 import os
 from qgis.PyQt.QtGui import QIcon
 
@@ -264,76 +262,55 @@ Subtraendo é o rastar que está subtraindo.'''
         crsDest = QgsCoordinateReferenceSystem(prjRef)
         if crsSrc != crsDest:
             transf_SRC = True
-            coordTransf = QgsCoordinateTransform(crsSrc, crsDest, QgsProject.instance())
-            InvCoordTransf = QgsCoordinateTransform(crsDest, crsSrc, QgsProject.instance())
+            coordTransf = reprojectArrays(crsSrc, crsDest)
+            InvCoordTransf = reprojectArrays(crsDest, crsSrc)
         else:
             transf_SRC = False
 
         # Diferença
         feedback.pushInfo(self.tr('Calculating the difference...', 'Calculando a diferença...'))
         if grade_ref == 0: # Referencia é o minuendo
-            DIFER = -9999.*np.ones([rows,cols])
-            Percent = 100./rows
-            for current, lin in enumerate(range(rows)):
-                for col in range(cols):
-                    X = origem[0] + resol_X*(col + 0.5)
-                    Y = origem[1] - resol_Y*(lin + 0.5)
-                    Z = banda[lin, col]
-                    if transf_SRC:
-                        geom = QgsGeometry.fromPointXY(QgsPointXY(X,Y))
-                        geom.transform(coordTransf)
-                        pnt = geom.asPoint()
-                        X, Y = pnt.x(), pnt.y()
-                    Z_ref = Interpolar(X, Y, bandRef, origemRef, resol_XRef, resol_YRef, metodo = 'nearest', nulo = nuloRef)
-                    if Z != -9999 and Z_ref != -9999:
-                        DIFER[lin,col] = (Z - Z_ref)*(-1 if negativo else 1)
-                if feedback.isCanceled():
-                    break
-                feedback.setProgress(int((current+1) * Percent))
-
-            # Verificar novos valores de número de linhas e colunas
-            # Verificar nova extensão
-
-            new_img = gdal.GetDriverByName('GTiff').Create(Output, cols, rows, 1, gdal.GDT_Float32)
-            new_img.SetGeoTransform(geotransform)
-            new_img.SetProjection(prj)
-            new_band = new_img.GetRasterBand(1)
-            new_band.SetNoDataValue(nulo)
-            new_band.WriteArray(DIFER)
-            new_img.FlushCache()
-            new_img = None
-
+            grade = (banda, origem, resol_X, resol_Y, nulo, cols, rows)
+            outra = (bandRef, origemRef, resol_XRef, resol_YRef, nuloRef)
+            transf = coordTransf if transf_SRC else None
+            sinal = -1 if negativo else 1
+            geotransform_out, prj_out = geotransform, prj
         elif grade_ref == 1: # Referência é o subtraendo
-            DIFER = -9999.*np.ones([rowsRef,colsRef])
-            Percent = 100./rowsRef
-            for current, lin in enumerate(range(rowsRef)):
-                for col in range(colsRef):
-                    X = origemRef[0] + resol_XRef*(col + 0.5)
-                    Y = origemRef[1] - resol_YRef*(lin + 0.5)
-                    Z = bandRef[lin, col]
-                    if transf_SRC:
-                        geom = QgsGeometry.fromPointXY(QgsPointXY(X,Y))
-                        geom.transform(InvCoordTransf)
-                        pnt = geom.asPoint()
-                        X, Y = pnt.x(), pnt.y()
-                    Z_ref = Interpolar(X, Y, banda, origem, resol_X, resol_Y, metodo = 'nearest', nulo = nulo)
-                    if Z != -9999 and Z_ref != -9999:
-                        DIFER[lin,col] = (Z_ref - Z) * (-1 if negativo else 1)
-                if feedback.isCanceled():
-                    break
-                feedback.setProgress(int((current+1) * Percent))
-
-            # Verificar novos valores de número de linhas e colunas
-            # Verificar nova extensão
-
-            new_img = gdal.GetDriverByName('GTiff').Create(Output, colsRef, rowsRef, 1, gdal.GDT_Float32)
-            new_img.SetGeoTransform(geotransformRef)
-            new_img.SetProjection(prjRef)
-            new_band = new_img.GetRasterBand(1)
-            new_band.SetNoDataValue(nuloRef)
-            new_band.WriteArray(DIFER)
-            new_img.FlushCache()
-            new_img = None
+            grade = (bandRef, origemRef, resol_XRef, resol_YRef, nuloRef, colsRef, rowsRef)
+            outra = (banda, origem, resol_X, resol_Y, nulo)
+            transf = InvCoordTransf if transf_SRC else None
+            sinal = 1 if negativo else -1
+            geotransform_out, prj_out = geotransformRef, prjRef
+        band_grade, origem_grade, resol_X_grade, resol_Y_grade, nulo_grade, cols_grade, rows_grade = grade
+        band_outra, origem_outra, resol_X_outra, resol_Y_outra, nulo_outra = outra
+
+        # Cálculo em blocos de linhas, com as coordenadas dos centros dos pixels transformadas de uma só vez
+        DIFER = nulo_grade*np.ones([rows_grade, cols_grade])
+        X_lin = origem_grade[0] + resol_X_grade*(np.arange(cols_grade) + 0.5)
+        bloco = max(1, int(2**20/cols_grade))
+        Percent = 100./rows_grade
+        for lin in range(0, rows_grade, bloco):
+            n_lin = min(bloco, rows_grade - lin)
+            Y_col = origem_grade[1] - resol_Y_grade*(np.arange(lin, lin + n_lin) + 0.5)
+            X, Y = np.meshgrid(X_lin, Y_col)
+            Z = band_grade[lin:lin + n_lin, :]
+            if transf:
+                X, Y = transf(X, Y)
+            Z_outra = InterpolarArray(X, Y, band_outra, origem_outra, resol_X_outra, resol_Y_outra, interpolacao, nulo_outra)
+            valido = (Z != nulo_grade) & (Z_outra != nulo_outra)
+            DIFER[lin:lin + n_lin][valido] = (Z[valido] - Z_outra[valido])*sinal
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(int((lin + n_lin) * Percent))
+
+        new_img = gdal.GetDriverByName('GTiff').Create(Output, cols_grade, rows_grade, 1, gdal.GDT_Float32)
+        new_img.SetGeoTransform(geotransform_out)
+        new_img.SetProjection(prj_out)
+        new_band = new_img.GetRasterBand(1)
+        new_band.SetNoDataValue(nulo_grade)
+        new_band.WriteArray(DIFER)
+        new_img.FlushCache()
+        new_img = None
 
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
@@ -19,12 +19,10 @@ from qgis.core import *
 from lftools.geocapt.imgs import Imgs
 from lftools.geocapt.cartography import reprojectPoints, gerar_tiles, folder_10x10_for_tile
 from lftools.geocapt.dem import *
+from lftools.geocapt.tilecache import TileCache, gunzip
 from lftools.translations.translate import translate
 import os
-import gzip
-import shutil
 import processing
-import urllib.request
 from qgis.PyQt.QtGui import QIcon
 
 class DEMdownloader(QgsProcessingAlgorithm):
@@ -82,6 +80,7 @@ class DEMdownloader(QgsProcessingAlgorithm):
     OUTPUT = 'OUTPUT'
     OPEN = 'OPEN'
     STYLE = 'STYLE'
+    CACHE = 'CACHE'
 
     dataset = ['SRTM - Global - 1 arc sec',
                'Copernicus DEM GLO-30 - Global - 1 arc sec',
@@ -125,6 +124,16 @@ class DEMdownloader(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CACHE,
+                self.tr('Tile cache size (GB)', 'Tamanho do cache de tiles (GB)'),
+                type = QgsProcessingParameterNumber.Type.Double,
+                minValue = 0,
+                defaultValue = 2
+            )
+        )
+
         self.addParameter(
             QgsProcessingParameterBoolean(
                 self.OPEN,
@@ -201,6 +210,12 @@ class DEMdownloader(QgsProcessingAlgorithm):
             context
         )
 
+        cache_gb = self.parameterAsDouble(
+            parameters,
+            self.CACHE,
+            context
+        )
+
         # Listar datasets a partir da extensão
         if mde in [0, 1, 2, 3]:  # SRTM, Copernicus, FABDEM, ANADEM
             tiles = gerar_tiles(lat_min, lat_max, lon_min, lon_max)
@@ -220,21 +235,17 @@ class DEMdownloader(QgsProcessingAlgorithm):
                         "Defina uma extensão menor no mapa!")
             )
         
-        out_folder = os.path.dirname(Output)
-        rasters = []
-
+        # Montar nome e URL de cada tile conforme o dataset
+        itens = []
         for k, tile in enumerate(tiles):
 
-            if feedback.isCanceled():
-                break
-
             tile_exists = tile in dataset
 
             if not tile_exists:
                 feedback.reportError(f"[{k+1}/{len(tiles)}] {tile} is not in the dataset!")
                 continue
 
-            # Montar nome e URL conforme o dataset
+            transformar = None
             if mde == 2:  # FABDEM
                 pasta = folder_10x10_for_tile(tile) + '_FABDEM_V1-2'
                 tile_name = f"{tile}_FABDEM_V1-2.tif"
@@ -249,43 +260,31 @@ class DEMdownloader(QgsProcessingAlgorithm):
                 tile_name = f"{tile}_GMTED2010_be30.tif"
                 url = f"https://huggingface.co/datasets/GeoOne/GMTED2010/resolve/main/{tile_name}?download=1"
 
-            elif mde == 0:  # SRTM
+            elif mde == 0:  # SRTM (descompactado ao entrar no cache)
                 tile_name, url = self.srtm_url(tile)
+                tile_name = tile_name[:-3]  # remove .gz
+                transformar = gunzip
 
             elif mde == 1:  # Copernicus DEM
                 tile_name, url = self.copdem_url(tile)
 
-            try:
-                out_path = os.path.join(out_folder, tile_name)
-                feedback.pushInfo(
-                    f"[{k+1}/{len(tiles)}] " +
-                    self.tr("Downloading file", "Baixando arquivo") +
-                    f" {tile_name} ..."
-                )
-                urllib.request.urlretrieve(url, out_path)
-
-                # Tratamento específico do SRTM
-                if mde == 0:
-                    feedback.pushInfo(
-                         f"[{k+1}/{len(tiles)}] " +
-                         self.tr("Decompressing file", "Descompactando arquivo") +
-                         f" {tile_name} ..."
-                    )
-                    hgt_path = self.gunzip_file(out_path)
-                    try:
-                        os.remove(out_path)  # remove o .gz após descompactar
-                    except:
-                        pass
-                    rasters += [hgt_path]
-                else:
-                    rasters += [out_path]
-
-            except Exception as e:
+            itens += [(url, tile_name, transformar)]
+
+        # Tiles já presentes no cache local são reaproveitados e os demais são baixados em paralelo
+        feedback.pushInfo(self.tr("Getting tiles...", "Obtendo tiles..."))
+        cache = TileCache(os.path.join(QgsApplication.qgisSettingsDirPath(), 'lftools', 'dem_cache'),
+                          max_bytes = int(cache_gb*1024**3))
+        baixados = cache.get_many(itens, feedback)
+        rasters = []
+        for url, tile_name, transformar in itens:
+            resultado = baixados.get(url)
+            if isinstance(resultado, Exception):
                 feedback.reportError(
-                    f"[{k+1}/{len(tiles)}] " +
                     self.tr("Problem downloading", "Problema ao baixar") +
-                    f" {tile_name}! {str(e)}"
+                    f" {tile_name}! {str(resultado)}"
                 )
+            elif resultado:
+                rasters += [resultado]
 
         # Mesclar arquivos temporários baixados (gera VRT se > 1)
         if not rasters:
@@ -332,13 +331,9 @@ class DEMdownloader(QgsProcessingAlgorithm):
             feedback=feedback
         )
 
-        for rst in rasters:
-            try:
-                os.remove(rst)
-            except:
-                pass
+        # Limitar o tamanho do cache (LRU), mantendo os tiles desta execução
+        cache.evict(manter = [item[0] for item in itens])
 
-        
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
 
@@ -370,14 +365,6 @@ class DEMdownloader(QgsProcessingAlgorithm):
         url = f"https://copernicus-dem-30m.s3.amazonaws.com/{tile_name}/{tile_name}.tif"
         return tile_name + '.tif', url
 
-    def gunzip_file(self, gz_path):
-        out_path = gz_path[:-3]  # remove .gz
-        with gzip.open(gz_path, 'rb') as f_in:
-            with open(out_path, 'wb') as f_out:
-                shutil.copyfileobj(f_in, f_out)
-        return out_path
-
-    
     def postProcessAlgorithm(self, context, feedback):
         if self.CARREGAR:
             rlayer = QgsRasterLayer(self.CAMINHO, self.datasetName)
@@ -27,9 +27,8 @@ from qgis.core import (Qgis,
                        QgsRasterLayer)
 
 from osgeo import osr, gdal_array, gdal #https://gdal.org/python/
-import numpy as np
-from math import floor, ceil
 from lftools.geocapt.imgs import Imgs
+from lftools.geocapt.dip import FiltroJanela
 from lftools.translations.translate import translate
 import os
 from qgis.PyQt.QtGui import QIcon
@@ -167,98 +166,54 @@ O processo de filtragem é feito utilizando matrizes denominadas máscaras (ou k
         # Abrir arquivo Raster
         feedback.pushInfo(self.tr('Opening raster file...', 'Abrindo arquivo Raster...'))
 
-        # Abrir Raster layer como array
+        # Abrir Raster layer
         image = gdal.Open(RasterIN)
         prj=image.GetProjection()
         geotransform = image.GetGeoTransform()
         num_bands = image.RasterCount
         if num_bands != 1:
             raise QgsProcessingException(self.tr('The raster layer should only have 1 band!','A camada raster deve ter apenas 1 banda!'))
-        banda = image.GetRasterBand(1).ReadAsArray()
-        nulo = image.GetRasterBand(1).GetNoDataValue()
+        band_in = image.GetRasterBand(1)
+        nulo = band_in.GetNoDataValue()
         cols = image.RasterXSize
         rows = image.RasterYSize
-        # Origem e resolucao da imagem
         ulx, xres, xskew, uly, yskew, yres  = image.GetGeoTransform()
-        origem = (ulx, uly)
-        resol_X = abs(xres)
-        resol_Y = abs(yres)
-        image=None # Fechar imagem
 
         # Novo geotransform
         new_ulx = ulx + abs(xres)*(size -1)/2
         new_uly = uly - abs(yres)*(size -1)/2
         new_geotransform = (new_ulx, xres, xskew, new_uly, yskew, yres)
 
-        # Kernel (filtro da média)
-        kernel = 1.0/(size**2)*np.ones((size, size))
-
-        # Convolução 2D
-        m, n = kernel.shape # n = m
-        y, x = banda.shape
-        y = y - m + 1
-        x = x - m + 1
-        RESULT = np.zeros((y,x))
-        Percent = 100.0/y
-        current = 0
-        feedback.pushInfo(self.tr('Raster filtering...', 'Executando filtro em raster...'))
-        if tipo in [0,1]: #Filtro da média
-            for i in range(y):
-                for j in range(x):
-                    if np.sum(banda[i:i+m, j:j+m] == nulo) > 0:
-                        RESULT[i][j] = nulo
-                    else:
-                        RESULT[i][j] = np.sum(banda[i:i+m, j:j+m]*kernel)
-                if feedback.isCanceled():
-                    break
-                current += 1
-                feedback.setProgress(int(current * Percent))
-        elif tipo in [2,3]: #Filtro da mediana
-            for i in range(y):
-                for j in range(x):
-                    if np.sum(banda[i:i+m, j:j+m] == nulo) > 0:
-                        RESULT[i][j] = nulo
-                    else:
-                        RESULT[i][j] = np.median(banda[i:i+m, j:j+m])
-                if feedback.isCanceled():
-                    break
-                current += 1
-                feedback.setProgress(int(current * Percent))
-        elif tipo in [4,5]: #Filtro do Mínimo
-            for i in range(y):
-                for j in range(x):
-                    if np.sum(banda[i:i+m, j:j+m] == nulo) > 0:
-                        RESULT[i][j] = nulo
-                    else:
-                        RESULT[i][j] = np.min(banda[i:i+m, j:j+m])
-                if feedback.isCanceled():
-                    break
-                current += 1
-                feedback.setProgress(int(current * Percent))
-        elif tipo in [6,7]: #Filtro do Máximo
-            for i in range(y):
-                for j in range(x):
-                    if np.sum(banda[i:i+m, j:j+m] == nulo) > 0:
-                        RESULT[i][j] = nulo
-                    else:
-                        RESULT[i][j] = np.max(banda[i:i+m, j:j+m])
-                if feedback.isCanceled():
-                    break
-                current += 1
-                feedback.setProgress(int(current * Percent))
-
-        # Salvando Resultado
+        # Criar Raster de saída
         ncols = cols - (size - 1)
         nrows = rows - (size - 1)
-        new_img = gdal.GetDriverByName('GTiff').Create(Output, ncols, nrows, 1, gdal.GDT_Float32)
+        if ncols < 1 or nrows < 1:
+            raise QgsProcessingException(self.tr('The raster layer is smaller than the kernel!','A camada raster é menor que a máscara!'))
+        new_img = gdal.GetDriverByName('GTiff').Create(Output, ncols, nrows, 1, gdal.GDT_Float32, ['TILED=YES', 'BIGTIFF=IF_SAFER'])
         new_img.SetGeoTransform(new_geotransform)
         new_img.SetProjection(prj)
         new_band = new_img.GetRasterBand(1)
         if nulo:
             new_band.SetNoDataValue(nulo)
-        new_band.WriteArray(RESULT)
+
+        # Filtragem em blocos de linhas, com sobreposição de (size - 1) linhas entre blocos
+        metodo = ['mean', 'median', 'min', 'max'][tipo//2]
+        bloco = max(1, int(2**24/(cols*size*size)))
+        Percent = 100.0/nrows
+        feedback.pushInfo(self.tr('Raster filtering...', 'Executando filtro em raster...'))
+        for lin in range(0, nrows, bloco):
+            n_lin = min(bloco, nrows - lin)
+            banda = band_in.ReadAsArray(0, lin, cols, n_lin + size - 1)
+            RESULT = FiltroJanela(banda, size, metodo, nulo)
+            new_band.WriteArray(RESULT, 0, lin)
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(int((lin + n_lin) * Percent))
+
+        # Salvando Resultado
         new_img.FlushCache()
         new_img = None
+        image = None # Fechar imagem
 
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
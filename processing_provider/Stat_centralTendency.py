@@ -38,6 +38,7 @@ from numpy import pi, cos, sin, sqrt
 #from scipy.stats import chi2
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
+from lftools.geocapt.centrality import pontosPorGrupo, indiceCentral, feicoesPorId
 import os
 from qgis.PyQt.QtGui import QIcon
 
@@ -282,66 +283,11 @@ Observação: Camada em um SRC projetado obtém resultado mais acurados.'''
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
-        if Campo_Agrupar != []:
-            dic = {}
-            for feat in layer.getFeatures():
-                geom = feat.geometry()
-                if TemZ:
-                    pnt = geom.constGet()
-                else:
-                    if geom.isMultipart():
-                        pnt = geom.asMultiPoint()[0]
-                    else:
-                        pnt = geom.asPoint()
-                grupo = feat[Campo_Agrupar]
-                if grupo in dic:
-                    dic[grupo]['x'] = dic[grupo]['x'] + [pnt.x()]
-                    dic[grupo]['y'] = dic[grupo]['y'] + [pnt.y()]
-                    if TemZ:
-                        dic[grupo]['z'] = dic[grupo]['z'] + [pnt.z()]
-                    if Campo_Peso:
-                        dic[grupo]['w'] = dic[grupo]['w'] + [int(feat[Campo_Peso])]
-                else:
-                    if Campo_Peso:
-                        if TemZ:
-                            dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()], 'z':[pnt.z()], 'w':[int(feat[Campo_Peso])]}
-                        else:
-                            dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()], 'w':[int(feat[Campo_Peso])]}
-                    else:
-                        if TemZ:
-                            dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()], 'z':[pnt.z()]}
-                        else:
-                            dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()]}
-        else:
-            dic = {}
-            for feat in layer.getFeatures():
-                geom = feat.geometry()
-                if TemZ:
-                    pnt = geom.constGet()
-                else:
-                    if geom.isMultipart():
-                        pnt = geom.asMultiPoint()[0]
-                    else:
-                        pnt = geom.asPoint()
-                grupo = 'ungrouped'
-                if grupo in dic:
-                    dic[grupo]['x'] = dic[grupo]['x'] + [pnt.x()]
-                    dic[grupo]['y'] = dic[grupo]['y'] + [pnt.y()]
-                    if TemZ:
-                        dic[grupo]['z'] = dic[grupo]['z'] + [pnt.z()]
-                    if Campo_Peso:
-                        dic[grupo]['w'] = dic[grupo]['w'] + [int(feat[Campo_Peso])]
-                else:
-                    if Campo_Peso:
-                        if TemZ:
-                            dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()], 'z':[pnt.z()], 'w':[int(feat[Campo_Peso])]}
-                        else:
-                            dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()], 'w':[int(feat[Campo_Peso])]}
-                    else:
-                        if TemZ:
-                            dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()], 'z':[pnt.z()]}
-                        else:
-                            dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()]}
+        # Coordenadas por grupo
+        dic = pontosPorGrupo(layer,
+                             Campo_Agrupar if Campo_Agrupar != [] else None,
+                             Campo_Peso if Campo_Peso else None,
+                             TemZ)
 
         # Função para calcular a Mediana Ponderada
         def quantis_ponderados(valores, quantis, pesos):
@@ -356,25 +302,14 @@ Observação: Camada em um SRC projetado obtém resultado mais acurados.'''
             q = 1.*pesos.cumsum()/pesos.sum() # quantis ponderados
             return np.interp(quantis, q, valores)
 
-        # Função para retornar a feição central
-        def CentralFeature(x, y, w):
-            dist_soma = 1e15
-            indice = -1
-            for i in range(len(x)):
-                x1 = x[i]
-                y1 = y[i]
-                soma = 0
-                for j in range(len(y)):
-                    x2 = x[j]
-                    y2 = y[j]
-                    peso = w[j]
-                    soma += peso*np.sqrt((x1 - x2)**2 + (y1 - y2)**2)
-                if soma < dist_soma:
-                    dist_soma = soma
-                    indice = i
-                if feedback.isCanceled():
-                    break
-            return x[indice], y[indice]
+        # Feição central de cada grupo e suas feições originais (pelo id)
+        if estat == 2:
+            centrais = {}
+            for grupo in dic:
+                w = dic[grupo]['w'] if Campo_Peso else None
+                k = indiceCentral(dic[grupo]['x'], dic[grupo]['y'], w)
+                centrais[grupo] = k
+            feicoes = feicoesPorId(layer, [dic[grupo]['id'][centrais[grupo]] for grupo in centrais])
 
         # Cálculo
         feature = QgsFeature()
@@ -426,8 +361,6 @@ Observação: Camada em um SRC projetado obtém resultado mais acurados.'''
                     perc25Y, medianY, perc75Y = np.quantile(y, [0.25, 0.5, 0.75])
                     if TemZ:
                         perc25Z, medianZ, perc75Z = np.quantile(z, [0.25, 0.5, 0.75])
-            elif estat == 2:
-                central_X, central_Y = CentralFeature(x, y, w)
 
             max_x = np.max(x)
             max_y = np.max(y)
@@ -471,20 +404,14 @@ Observação: Camada em um SRC projetado obtém resultado mais acurados.'''
                         float(perc75X), float(perc75Y), float(perc75Z),
                         float(max_x), float(max_y), float(max_z)]
             elif estat == 2:
-                # Pegar atributos do ponto central
-                for feat in layer.getFeatures():
-                    geom = feat.geometry()
-                    if geom.isMultipart():
-                        coord = geom.asMultiPoint()[0]
-                    else:
-                        coord = geom.asPoint()
-                    if coord.x() == central_X and coord.y() == central_Y:
-                        att = feat.attributes()
-                        if TemZ:
-                            pnt = geom
-                        else:
-                            pnt = QgsGeometry.fromPointXY(QgsPointXY(float(central_X), float(central_Y)))
-                        break
+                # Atributos do ponto central
+                k = centrais[grupo]
+                central = feicoes[int(dic[grupo]['id'][k])]
+                att = central.attributes()
+                if TemZ:
+                    pnt = central.geometry()
+                else:
+                    pnt = QgsGeometry.fromPointXY(QgsPointXY(float(x[k]), float(y[k])))
                 att += [str(grupo), len(x)]
 
             feat.setGeometry(pnt)
@@ -36,6 +36,7 @@ from numpy import pi, cos, sin, sqrt
 #from scipy.stats import chi2
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
+from lftools.geocapt.centrality import pontosPorGrupo
 import os
 from qgis.PyQt.QtGui import QIcon
 
@@ -209,51 +210,11 @@ class ConfidenceEllipse(QgsProcessingAlgorithm):
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
-        total = 100.0 / layer.featureCount() if layer.featureCount() else 0
-        if Campo_Agrupar:
-            dic = {}
-            for current, feat in enumerate(layer.getFeatures()):
-                geom = feat.geometry()
-                if geom.isMultipart():
-                    pnt = geom.asMultiPoint()[0]
-                else:
-                    pnt = geom.asPoint()
-                grupo = feat[Campo_Agrupar]
-                if grupo in dic:
-                    dic[grupo]['x'] = dic[grupo]['x'] + [pnt.x()]
-                    dic[grupo]['y'] = dic[grupo]['y'] + [pnt.y()]
-                    if Campo_Peso:
-                        dic[grupo]['w'] = dic[grupo]['w'] + [int(feat[Campo_Peso])]
-                else:
-                    if Campo_Peso:
-                        dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()], 'w':[int(feat[Campo_Peso])]}
-                    else:
-                        dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()]}
-                if feedback.isCanceled():
-                    break
-                feedback.setProgress(int(current * total))
-        else:
-            dic = {}
-            for current, feat in enumerate(layer.getFeatures()):
-                geom = feat.geometry()
-                if geom.isMultipart():
-                    pnt = geom.asMultiPoint()[0]
-                else:
-                    pnt = geom.asPoint()
-                grupo = 'ungrouped'
-                if grupo in dic:
-                    dic[grupo]['x'] = dic[grupo]['x'] + [pnt.x()]
-                    dic[grupo]['y'] = dic[grupo]['y'] + [pnt.y()]
-                    if Campo_Peso:
-                        dic[grupo]['w'] = dic[grupo]['w'] + [int(feat[Campo_Peso])]
-                else:
-                    if Campo_Peso:
-                        dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()], 'w':[int(feat[Campo_Peso])]}
-                    else:
-                        dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()]}
-                if feedback.isCanceled():
-                    break
-                feedback.setProgress(int(current * total))
+        # Coordenadas por grupo
+        dic = pontosPorGrupo(layer,
+                             Campo_Agrupar if Campo_Agrupar else None,
+                             Campo_Peso if Campo_Peso else None,
+                             feedback = feedback)
 
         feature = QgsFeature()
         for current, grupo in enumerate(dic):
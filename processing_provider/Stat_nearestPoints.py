@@ -29,12 +29,16 @@ from qgis.core import (Qgis,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterFeatureSink,
                        QgsApplication,
-                       QgsCoordinateTransform,
-                       QgsCoordinateReferenceSystem)
+                       QgsFeatureRequest,
+                       QgsMultiPoint,
+                       QgsPoint)
 import numpy as np
+import warnings
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
 from lftools.geocapt.topogeo import meters2degrees, degrees2meters
+from lftools.geocapt.cartography import reprojectArrays
+from lftools.geocapt.vizinhos import IndiceVizinhos
 import os
 from qgis.PyQt.QtGui import QIcon
 
@@ -263,143 +267,126 @@ Saída: Camada de multipoint com precisões posicionais em metros e outras estat
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
-        # Transformação de SRC das camadas
-        mesmoSRC = True
-        if ref.sourceCrs() != pnts.sourceCrs():
-            mesmoSRC = False
-            coordinateTransformer = QgsCoordinateTransform()
-            coordinateTransformer.setDestinationCrs(ref.sourceCrs())
-            coordinateTransformer.setSourceCrs(pnts.sourceCrs())
-
-        # Pegar latitude média da extensão da camada de referência
-        if not SRC.isGeographic():
-            GRS = QgsCoordinateReferenceSystem(SRC.geographicCrsAuthId())
-            transf_layer = QgsCoordinateTransform()
-            transf_layer.setDestinationCrs(GRS)
-            transf_layer.setSourceCrs(SRC)
-            geom = QgsGeometry.fromPointXY(ref.sourceExtent().center())
-            geom.transform(coordinateTransformer)
-            pnt = geom.asPoint()
-            lat = pnt.y()
-        else:
-            lat = ref.sourceExtent().center().y()
-
+        # Latitude média da extensão da camada de referência
         if SRC.isGeographic():
+            lat = ref.sourceExtent().center().y()
             dist = meters2degrees(dist, lat, SRC)
 
-        def distancia2D (pnt1, pnt2):
-            return np.sqrt((pnt1.x() - pnt2.x())**2 + (pnt1.y() - pnt2.y())**2)
-
-        dtype = [('id', int),('dist',float)]
-
-        # Colocar camada de pontos em dicionário
-        dic = {}
-        for feat in pnts.getFeatures():
-            dic[feat.id()] = feat
-
-        cont = 0
-        total = ref.featureCount()
-        total = 100.0/total if total else 0
-        for cont, feat1 in enumerate(ref.getFeatures()):
-            geom1 = feat1.geometry()
-            pnt1 = geom1.asPoint()
-            valores = []
-            # Calculando distâncias
-            for feat2 in pnts.getFeatures():
-                geom2 = feat2.geometry()
-                if not mesmoSRC:
-                    geom2.transform(coordinateTransformer)
-                pnt2 = geom2.asPoint()
-                dist2D = distancia2D (pnt1, pnt2)
-                valores += [(feat2.id(), dist2D)]
-            # Ordenando valores
-            estr = np.array(valores, dtype=dtype)
-            ordenado = np.sort(estr, order=['dist'])
+        # Carregar pontos a serem analisados em arrays (uma única leitura)
+        feedback.pushInfo(self.tr('Loading points...', 'Carregando pontos...'))
+        request = QgsFeatureRequest()
+        if campo:
+            request.setSubsetOfAttributes([nome_campo], pnts.fields())
+        else:
+            request.setNoAttributes()
+        X, Y, Z, A = [], [], [], []
+        for feat in pnts.getFeatures(request):
+            pnt = feat.geometry().constGet()
+            X.append(pnt.x())
+            Y.append(pnt.y())
+            if possuiZ:
+                Z.append(pnt.z())
+            if campo:
+                try:
+                    A.append(float(feat[nome_campo]))
+                except (TypeError, ValueError):
+                    A.append(np.nan)
+        n = len(X)
+        X, Y = np.array(X, dtype=float), np.array(Y, dtype=float)
+
+        # Transformação de SRC das camadas (uma única vez)
+        if ref.sourceCrs() != pnts.sourceCrs():
+            X, Y = reprojectArrays(pnts.sourceCrs(), ref.sourceCrs())(X, Y)
+
+        # Arrays com uma posição extra (nan) para os índices sem vizinho
+        X = np.append(X, np.nan)
+        Y = np.append(Y, np.nan)
+        Z = np.append(np.array(Z, dtype=float), np.nan) if possuiZ else None
+        A = np.append(np.array(A, dtype=float), np.nan) if campo else None
+
+        indice = IndiceVizinhos(X[:-1], Y[:-1])
+
+        # Camada de referência
+        referencias = []
+        for feat1 in ref.getFeatures():
+            pnt1 = feat1.geometry().asPoint()
+            referencias += [(feat1.attributes(), pnt1.x(), pnt1.y())]
+
+        funcoes = {'sum': np.nansum, 'mean': np.nanmean, 'median': np.nanmedian,
+                   'std': np.nanstd, 'min': np.nanmin, 'max': np.nanmax}
+
+        # Sub-blocos com matrizes de índices (preenchidas com n) limitadas a max_celulas posições,
+        # para que uma referência com muitos vizinhos não amplie todas as linhas do bloco
+        max_celulas = 2**20
+        def subblocos(listas):
+            ini, maior = 0, 1
+            for k in range(len(listas) + 1):
+                if k < len(listas):
+                    novo = max(maior, len(listas[k]))
+                    if k == ini or novo*(k + 1 - ini) <= max_celulas:
+                        maior = novo
+                        continue
+                IDS = np.full((k - ini, maior), n, dtype=np.int64)
+                for j, lista in enumerate(listas[ini:k]):
+                    IDS[j, :len(lista)] = lista
+                yield ini, IDS
+                if k < len(listas):
+                    ini, maior = k, max(1, len(listas[k]))
+
+        total = 100.0/len(referencias) if referencias else 0
+        bloco = 2048
+        for ini_bloco in range(0, len(referencias), bloco):
+            lote = referencias[ini_bloco:ini_bloco+bloco]
+            x = np.array([item[1] for item in lote])
+            y = np.array([item[2] for item in lote])
             # Selecionando pontos
             if cond == 0: # Condição 1 - Distância máxima
-                IDS = []
-                for item in ordenado:
-                    IDS += [item[0]]
-                    if item[-1] > dist:
-                        break
+                partes = subblocos(indice.raio(x, y, dist))
             elif cond == 1: # Condição 2 - Quantidade mínima de pontos
-                IDS = []
-                for k in range(qnt):
-                    IDS += [ordenado[k][0]]
+                partes = [(0, indice.knn(x, y, qnt)[1])]
             elif cond == 2: # Condição 3 - Ambas
-                IDS = []
-                cont = 0
-                for item in ordenado:
-                    cont += 1
-                    if cont > qnt:
-                        break
-                    else:
-                        if item[-1] <= dist:
-                            IDS += [item[0]]
-                        else:
-                            break
-
-            if len(IDS) > 0:
-                # Calcular estatísticas
-                X, Y, Z = [],[],[]
-                atributos = []
-                for ID in IDS:
-                    pnt = dic[ID].geometry().constGet()
+                partes = [(0, indice.knn(x, y, qnt, dist)[1])]
+
+            for ini, IDS in partes:
+                # Calcular estatísticas por vizinhança
+                contagem = (IDS < n).sum(axis=1)
+                with np.errstate(all='ignore'), warnings.catch_warnings():
+                    warnings.simplefilter('ignore', category=RuntimeWarning)
+                    sigmaX = np.nanstd(X[IDS], axis=1)
+                    sigmaY = np.nanstd(Y[IDS], axis=1)
+                    if SRC.isGeographic():
+                        sigmaX = degrees2meters(sigmaX, lat, SRC)
+                        sigmaY = degrees2meters(sigmaY, lat, SRC)
                     if possuiZ:
-                        x, y, z = pnt.x(), pnt.y(), pnt.z()
-                        X.append(x)
-                        Y.append(y)
-                        Z.append(z)
-                    else:
-                        x, y = pnt.x(), pnt.y()
-                        X.append(x)
-                        Y.append(y)
+                        sigmaZ = np.nanstd(Z[IDS], axis=1)
+                    colunas_stats = []
                     if campo:
-                        atributos.append(dic[ID][nome_campo])
-
-                sigmaX = np.std(np.array(X))
-                sigmaY = np.std(np.array(Y))
-                if SRC.isGeographic():
-                    sigmaX = degrees2meters(sigmaX, lat, SRC)
-                    sigmaY = degrees2meters(sigmaY, lat, SRC)
-                if possuiZ:
-                   sigmaZ = np.std(np.array(Z))
-
-                atributos = np.array(atributos)
-                lista_stats = []
-                if campo:
-                    for st in stats:
-                        if self.OPTIONS[st] == 'count':
-                            lista_stats += [int(len(atributos))]
-                        if self.OPTIONS[st] == 'sum':
-                            lista_stats += [float(atributos.sum())]
-                        if self.OPTIONS[st] == 'mean':
-                            lista_stats += [float(atributos.mean())]
-                        if self.OPTIONS[st] == 'median':
-                            lista_stats += [float(np.median(atributos))]
-                        if self.OPTIONS[st] == 'std':
-                            lista_stats += [float(atributos.std())]
-                        if self.OPTIONS[st] == 'min':
-                            lista_stats += [float(atributos.min())]
-                        if self.OPTIONS[st] == 'max':
-                            lista_stats += [float(atributos.max())]
-
-                # Criar feição multiponto
-                geom = QgsGeometry(dic[IDS[0]].geometry())
-                for ID in IDS[1:]:
-                    geom0  = dic[ID].geometry()
-                    geom = geom.combine(geom0) # adicinar pontos
-
-                feat = QgsFeature(Fields)
-                feat.setGeometry(geom)
-
-                att = feat1.attributes() + [len(IDS), float(sigmaX), float(sigmaY)] + [float(sigmaZ)] if possuiZ else []
-                att += lista_stats
-                feat.setAttributes(att)
-                sink.addFeature(feat, QgsFeatureSink.Flag.FastInsert)
+                        valores = A[IDS]
+                        for st in stats:
+                            if self.OPTIONS[st] == 'count':
+                                colunas_stats += [contagem]
+                            else:
+                                colunas_stats += [funcoes[self.OPTIONS[st]](valores, axis=1)]
+
+                for k, (atributos, x1, y1) in enumerate(lote[ini:ini+len(IDS)]):
+                    if contagem[k] > 0:
+                        ids = IDS[k, :contagem[k]]
+                        # Criar feição multiponto
+                        multiponto = QgsMultiPoint()
+                        for ID in ids:
+                            if possuiZ:
+                                multiponto.addGeometry(QgsPoint(X[ID], Y[ID], Z[ID]))
+                            else:
+                                multiponto.addGeometry(QgsPoint(X[ID], Y[ID]))
+                        feat = QgsFeature(Fields)
+                        feat.setGeometry(QgsGeometry(multiponto))
+                        att = atributos + [int(contagem[k]), float(sigmaX[k]), float(sigmaY[k])] + ([float(sigmaZ[k])] if possuiZ else [])
+                        att += [int(coluna[k]) if self.OPTIONS[st] == 'count' else float(coluna[k]) for st, coluna in zip(stats, colunas_stats)]
+                        feat.setAttributes(att)
+                        sink.addFeature(feat, QgsFeatureSink.Flag.FastInsert)
             if feedback.isCanceled():
                 break
-            feedback.setProgress(int((cont+1) * total))
+            feedback.setProgress(int((ini_bloco + len(lote)) * total))
 
         feedback.pushInfo(self.tr('Operation completed successfully!', 'Operação finalizada com sucesso!'))
         feedback.pushInfo(self.tr('Leandro Franca - Cartographic Engineer', 'Leandro França - Eng Cart'))
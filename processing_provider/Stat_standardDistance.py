@@ -36,6 +36,7 @@ from numpy import pi, cos, sin, sqrt
 #from scipy.stats import chi2
 from lftools.geocapt.imgs import Imgs
 from lftools.translations.translate import translate
+from lftools.geocapt.centrality import pontosPorGrupo
 import os
 from qgis.PyQt.QtGui import QIcon
 
@@ -204,44 +205,10 @@ class StandardDistance(QgsProcessingAlgorithm):
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
-        if Campo_Agrupar:
-            dic = {}
-            for feat in layer.getFeatures():
-                geom = feat.geometry()
-                if geom.isMultipart():
-                    pnt = geom.asMultiPoint()[0]
-                else:
-                    pnt = geom.asPoint()
-                grupo = feat[Campo_Agrupar]
-                if grupo in dic:
-                    dic[grupo]['x'] = dic[grupo]['x'] + [pnt.x()]
-                    dic[grupo]['y'] = dic[grupo]['y'] + [pnt.y()]
-                    if Campo_Peso:
-                        dic[grupo]['w'] = dic[grupo]['w'] + [int(feat[Campo_Peso])]
-                else:
-                    if Campo_Peso:
-                        dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()], 'w':[int(feat[Campo_Peso])]}
-                    else:
-                        dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()]}
-        else:
-            dic = {}
-            for feat in layer.getFeatures():
-                geom = feat.geometry()
-                if geom.isMultipart():
-                    pnt = geom.asMultiPoint()[0]
-                else:
-                    pnt = geom.asPoint()
-                grupo = 'ungrouped'
-                if grupo in dic:
-                    dic[grupo]['x'] = dic[grupo]['x'] + [pnt.x()]
-                    dic[grupo]['y'] = dic[grupo]['y'] + [pnt.y()]
-                    if Campo_Peso:
-                        dic[grupo]['w'] = dic[grupo]['w'] + [int(feat[Campo_Peso])]
-                else:
-                    if Campo_Peso:
-                        dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()], 'w':[int(feat[Campo_Peso])]}
-                    else:
-                        dic[grupo] = {'x':[pnt.x()], 'y':[pnt.y()]}
+        # Coordenadas por grupo
+        dic = pontosPorGrupo(layer,
+                             Campo_Agrupar if Campo_Agrupar else None,
+                             Campo_Peso if Campo_Peso else None)
 
         feature = QgsFeature()
         total = 100.0 / len(dic) if len(dic) else 0
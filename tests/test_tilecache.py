@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_tilecache.py
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Leandro França'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2026, Leandro França'
+
+# Testes do cache de tiles contra um servidor HTTP local com tiles falsos
+# Execução: python -m unittest discover tests
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import http.server
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'geocapt'))
+from tilecache import TileCache
+
+
+class TileCacheTest(unittest.TestCase):
+    # Servidor HTTP local que serve tiles falsos
+
+    tiles = {'/a.tif': b'A'*1000, '/b.tif': b'A'*1000, '/c.tif': b'C'*1000}
+
+    @classmethod
+    def setUpClass(cls):
+        tiles = cls.tiles
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def do_GET(self):
+                dados = tiles.get(self.path)
+                self.send_response(200 if dados else 404)
+                self.send_header('Content-Length', str(len(dados or b'')))
+                self.end_headers()
+                self.wfile.write(dados or b'')
+            def log_message(self, *args):
+                pass
+        cls.servidor = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+        cls.base = 'http://127.0.0.1:{}'.format(cls.servidor.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.cache = TileCache(self.pasta, max_bytes=1500, workers=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def test_download_and_reuse(self):
+        itens = [(self.base + nome, nome[1:], None) for nome in ('/a.tif', '/c.tif', '/x.tif')]
+        resultado = self.cache.get_many(itens)
+        self.assertIsInstance(resultado[self.base + '/x.tif'], Exception)
+        with open(resultado[self.base + '/a.tif'], 'rb') as arq:
+            self.assertEqual(arq.read(), self.tiles['/a.tif'])
+        self.servidor.shutdown()
+        try:
+            self.assertEqual(self.cache.get_many(itens[:2]), {url: resultado[url] for url, n, t in itens[:2]})
+        finally:
+            threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def test_evict_shared_content(self):
+        a, b = self.base + '/a.tif', self.base + '/b.tif'
+        resultado = self.cache.get_many([(a, 'a.tif', None)])
+        resultado.update(self.cache.get_many([(b, 'b.tif', None)]))
+        self.assertEqual(os.path.dirname(resultado[a]), os.path.dirname(resultado[b]))
+        total = self.cache.evict(manter=[b])
+        self.assertFalse(os.path.exists(resultado[a]))
+        self.assertTrue(os.path.exists(resultado[b]))
+        self.assertEqual(total, 1000)
+        self.cache.max_bytes = 0
+        self.cache.evict()
+        self.assertFalse(os.path.exists(os.path.dirname(resultado[b])))
+
+
+if __name__ == '__main__':
+    unittest.main()